@@ -0,0 +1,305 @@
+"""
+Price alerts evaluated on every new quote.
+
+Users set alerts on tickers in their watchlist: the price is at or above a
+level, at or below a level, or the day's change (from the previous close) is
+at least some percent either way. An alert fires once and is then done.
+
+AlertIndex keeps, per ticker and kind, the alerts sorted by threshold in
+parallel lists. A quote for a ticker without alerts costs one dict lookup;
+otherwise each kind is one bisect, and the alerts that fire are a prefix or
+suffix of the list, cut off in one slice. So a quote costs O(log n + fired)
+however many alerts are set.
+
+AlertEngine feeds the index and hands fired alerts to the app. Quotes come in
+as the scraper produces them (a ThreadedScraper listener) or, when scraping
+runs in a daemon, from the daemon's cache every few seconds. Evaluation only
+queues fired alerts; a background thread claims them in the database in
+batches, so several web workers each running an engine deliver each alert
+once. The same thread reloads the index when the alerts in the database
+change (another worker added one, say).
+"""
+
+import bisect
+import collections
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+import metrics
+from quote import Quote
+
+logger = logging.getLogger('247stonx.alerts')
+
+ABOVE = 'above'
+BELOW = 'below'
+MOVE = 'move'
+KINDS = (ABOVE, BELOW, MOVE)
+
+
+class Alert(NamedTuple):
+    id: int
+    user_id: int
+    ticker: str
+    kind: str
+    # Price for above and below, percent for move
+    threshold: float
+
+
+class FiredAlert(NamedTuple):
+    alert: Alert
+    price: float
+    change_percent: Optional[float]
+    timestamp: float
+
+
+def describe(kind: str, threshold: float) -> str:
+    """Human description of an alert condition, e.g. 'above 200.00' or 'moves 5%'"""
+    if kind == MOVE:
+        return f"moves {threshold:g}%"
+    return f"{kind} {threshold:.2f}"
+
+
+class _Thresholds:
+    """Alerts of one kind on one ticker, sorted by threshold"""
+
+    __slots__ = ('thresholds', 'alerts')
+
+    def __init__(self):
+        self.thresholds = []
+        self.alerts = []
+
+    def add(self, alert: Alert):
+        position = bisect.bisect_right(self.thresholds, alert.threshold)
+        self.thresholds.insert(position, alert.threshold)
+        self.alerts.insert(position, alert)
+
+    def remove(self, alert: Alert) -> bool:
+        position = bisect.bisect_left(self.thresholds, alert.threshold)
+        while position < len(self.alerts) and self.thresholds[position] == alert.threshold:
+            if self.alerts[position].id == alert.id:
+                del self.thresholds[position], self.alerts[position]
+                return True
+            position += 1
+        return False
+
+    def take_up_to(self, value: float) -> List[Alert]:
+        """Remove and return the alerts with threshold <= value"""
+        position = bisect.bisect_right(self.thresholds, value)
+        if not position:
+            return []
+        taken = self.alerts[:position]
+        del self.thresholds[:position], self.alerts[:position]
+        return taken
+
+    def take_from(self, value: float) -> List[Alert]:
+        """Remove and return the alerts with threshold >= value"""
+        position = bisect.bisect_left(self.thresholds, value)
+        if position == len(self.thresholds):
+            return []
+        taken = self.alerts[position:]
+        del self.thresholds[position:], self.alerts[position:]
+        return taken
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+
+class AlertIndex:
+    """Active alerts by ticker and kind, evaluated against quotes"""
+
+    def __init__(self, alerts: List[Alert] = ()):
+        self._lock = threading.Lock()
+        self._tickers = {}  # ticker -> {kind: _Thresholds}
+        self._alerts = {}  # id -> Alert
+        for alert in alerts:
+            self._add(alert)
+
+    def _add(self, alert: Alert):
+        if alert.id in self._alerts:
+            return
+        kinds = self._tickers.get(alert.ticker)
+        if kinds is None:
+            kinds = self._tickers[alert.ticker] = {}
+        thresholds = kinds.get(alert.kind)
+        if thresholds is None:
+            thresholds = kinds[alert.kind] = _Thresholds()
+        thresholds.add(alert)
+        self._alerts[alert.id] = alert
+
+    def add(self, alert: Alert):
+        with self._lock:
+            self._add(alert)
+
+    def remove(self, alert_id: int) -> bool:
+        with self._lock:
+            alert = self._alerts.pop(alert_id, None)
+            if alert is None:
+                return False
+            kinds = self._tickers[alert.ticker]
+            kinds[alert.kind].remove(alert)
+            if not kinds[alert.kind]:
+                del kinds[alert.kind]
+                if not kinds:
+                    del self._tickers[alert.ticker]
+            return True
+
+    def evaluate(self, quote: Quote) -> List[FiredAlert]:
+        """Remove and return the alerts the quote sets off"""
+        if quote.ticker not in self._tickers or quote.price is None or quote.error:
+            return []
+        with self._lock:
+            kinds = self._tickers.get(quote.ticker)
+            if kinds is None:
+                return []
+            fired = []
+            if ABOVE in kinds:
+                fired += kinds[ABOVE].take_up_to(quote.price)
+            if BELOW in kinds:
+                fired += kinds[BELOW].take_from(quote.price)
+            if MOVE in kinds and quote.change_percent is not None:
+                fired += kinds[MOVE].take_up_to(abs(quote.change_percent))
+            if not fired:
+                return []
+            for alert in fired:
+                del self._alerts[alert.id]
+            for kind in [kind for kind, thresholds in kinds.items() if not thresholds]:
+                del kinds[kind]
+            if not kinds:
+                del self._tickers[quote.ticker]
+        return [FiredAlert(alert, quote.price, quote.change_percent, quote.timestamp) for alert in fired]
+
+    def tickers(self) -> List[str]:
+        with self._lock:
+            return list(self._tickers)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._tickers
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+
+class AlertEngine:
+    """
+    Evaluates quotes against an AlertIndex kept in step with the database.
+
+    Args:
+        load (Callable): Returns every active Alert.
+        signature (Callable): Returns a value that changes whenever the set of active
+            alerts does, e.g. their count and highest id; checked every interval.
+        claim (Callable): Marks fired alerts triggered, returning those this call
+            claimed (another process may have claimed some already).
+        interval (float, optional): Seconds between database checks and quote polls.
+        poll_quotes (Callable, optional): Returns the cached quotes of the given
+            tickers; polled every interval when quotes are not pushed with on_quote().
+    """
+
+    def __init__(self, load: Callable[[], List[Alert]], signature: Callable[[], Hashable],
+                 claim: Callable[[List[FiredAlert]], List[FiredAlert]], interval: float = 5.0,
+                 poll_quotes: Optional[Callable[[List[str]], Dict[str, Quote]]] = None):
+        self.load = load
+        self.signature = signature
+        self.claim = claim
+        self.interval = interval
+        self.poll_quotes = poll_quotes
+        self.index = AlertIndex()
+        self._signature = None
+        # Newest quote time evaluated per ticker, so a quote seen twice fires nothing twice
+        self._seen = {}
+        self._fired = collections.deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'evaluated': 0, 'fired': 0, 'claimed': 0, 'reloads': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='alert-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def on_quote(self, quote: Quote):
+        """Evaluate a new quote; cheap enough to call on every scrape"""
+        if quote.ticker not in self.index:
+            return
+        if quote.timestamp <= self._seen.get(quote.ticker, 0):
+            return
+        self._seen[quote.ticker] = quote.timestamp
+        self._stats['evaluated'] += 1
+        fired = self.index.evaluate(quote)
+        if fired:
+            self._fired.extend(fired)
+            self._stats['fired'] += len(fired)
+            self._wake.set()
+
+    def sync(self):
+        """Reload the index if the active alerts changed in the database"""
+        signature = self.signature()
+        if signature == self._signature:
+            return
+        alerts = self.load()
+        self.index = AlertIndex(alerts)
+        self._signature = signature
+        self._stats['reloads'] += 1
+        metrics.ALERTS_ACTIVE.set(len(alerts))
+        logger.debug("Loaded %d active alerts", len(alerts))
+
+    def deliver(self) -> int:
+        """
+        Claim the queued fired alerts in one batch.
+
+        Returns:
+            int: Alerts claimed by this engine.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._fired.popleft())
+            except IndexError:
+                break
+        if not batch:
+            return 0
+        try:
+            claimed = self.claim(batch)
+        except Exception:
+            # Back into the index, to fire again on a later quote
+            logger.exception("Could not record %d fired alerts", len(batch))
+            for fired in batch:
+                self.index.add(fired.alert)
+            return 0
+        self._stats['claimed'] += len(claimed)
+        for fired in claimed:
+            metrics.ALERTS_FIRED.labels(fired.alert.kind).inc()
+            logger.info("Alert %d fired: %s %s at %.2f", fired.alert.id, fired.alert.ticker,
+                        describe(fired.alert.kind, fired.alert.threshold), fired.price)
+        return len(claimed)
+
+    def _poll(self):
+        tickers = self.index.tickers()
+        if not tickers:
+            return
+        for quote in self.poll_quotes(tickers).values():
+            self.on_quote(quote)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.deliver()
+                self.sync()
+                if self.poll_quotes is not None:
+                    self._poll()
+                self.deliver()
+            except Exception:
+                logger.exception("Alert engine failed")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({'active': len(self.index), 'tickers': len(self.index.tickers()), 'queued': len(self._fired)})
+        return stats
@@ -0,0 +1,374 @@
+"""
+OHLC bars, returns and percent changes over the tick history, with NumPy.
+
+A day segment of history.py maps straight onto a structured array of
+TICK_DTYPE, so bars are built without a Python loop per tick: ticks are
+grouped by bucket with np.flatnonzero over the bucket ids, and opens,
+highs, lows and closes come from fancy indexing and ufunc.reduceat.
+
+Bars are cached per (ticker, bucket) in a BarSeries. A request reads only
+the ticks recorded since the previous one (the tail of today's segment,
+from the byte offset already consumed) and folds them into the last bar or
+appends new bars, so refreshing a 100-ticker watchlist's sparklines costs a
+few milliseconds. Windows are slices of the cached bars.
+
+Bucket and window lengths are written like 30s, 1m, 5m, 1h or 1d. Buckets
+are limited to BUCKETS and windows to the history retention, so requests
+cannot fill the cache with series nobody else uses. A series keeps the bars
+of the longest window asked of it in the last HORIZON_TTL seconds.
+"""
+
+import collections
+import datetime
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import history
+
+# Matches history.RECORD: timestamp, price, previous close
+TICK_DTYPE = np.dtype([('timestamp', '<f8'), ('price', '<f8'), ('previous_close', '<f8')])
+
+# Windows reported by changes()
+CHANGE_WINDOWS = ('1m', '5m', '1h', '1d')
+
+_DURATION = re.compile(r'^(\d+)([smhd])$')
+_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Seconds between reads of new ticks for one series; the history writer flushes about once a second
+EXTEND_INTERVAL = 1.0
+
+# Bar lengths that can be asked for
+BUCKETS = ('1m', '5m', '15m', '1h', '1d')
+
+# Seconds a window asked of a series keeps its bars from being trimmed
+HORIZON_TTL = 3600.0
+
+
+def parse_duration(text: str) -> int:
+    """
+    Seconds in a duration such as '5m' or '1d'.
+
+    Raises:
+        ValueError: If the text is not a positive count followed by s, m, h or d.
+    """
+    match = _DURATION.match(text.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration {text!r}; use e.g. 30s, 5m, 1h or 1d")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def parse_bucket(text: str) -> int:
+    """
+    Seconds in a bar length, which must be one of BUCKETS.
+
+    Raises:
+        ValueError: If the text is not one of BUCKETS.
+    """
+    if text.strip().lower() not in BUCKETS:
+        raise ValueError(f"Invalid bucket {text!r}; use one of {', '.join(BUCKETS)}")
+    return parse_duration(text)
+
+
+def load_ticks(store: history.HistoryStore, ticker: str, day: str, offset: int = 0) -> Tuple[np.ndarray, int]:
+    """
+    Ticks of one day segment from a byte offset, with one mmap.
+
+    Returns:
+        tuple: (ticks, end) where ticks is a TICK_DTYPE array and end the byte
+        offset after the last whole record read.
+    """
+    segment = store.map_day(ticker, day)
+    if segment is None:
+        return np.empty(0, TICK_DTYPE), offset
+    with segment:
+        end = len(segment) - len(segment) % TICK_DTYPE.itemsize
+        if end <= offset:
+            return np.empty(0, TICK_DTYPE), offset
+        # Copy out of the map so it can be closed
+        ticks = np.frombuffer(segment, TICK_DTYPE, count=(end - offset) // TICK_DTYPE.itemsize,
+                              offset=offset).copy()
+    return ticks, end
+
+
+def make_bars(timestamps: np.ndarray, prices: np.ndarray, bucket: int) -> Dict[str, np.ndarray]:
+    """
+    Group time-ordered ticks into OHLC bars.
+
+    Returns:
+        Dict[str, np.ndarray]: time (bucket start), open, high, low, close and count per bar.
+    """
+    if not len(timestamps):
+        return {'time': np.empty(0, np.int64), 'open': np.empty(0), 'high': np.empty(0),
+                'low': np.empty(0), 'close': np.empty(0), 'count': np.empty(0, np.int64)}
+    ids = (timestamps // bucket).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    ends = np.append(starts[1:], len(ids))
+    return {
+        'time': ids[starts] * bucket,
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'count': ends - starts,
+    }
+
+
+def rolling_max(values: np.ndarray, span: int) -> np.ndarray:
+    """Maximum of each value and the span - 1 before it (fewer at the start)"""
+    if span <= 1 or not len(values):
+        return values.copy()
+    padded = np.concatenate((np.full(span - 1, -np.inf), values))
+    return np.lib.stride_tricks.sliding_window_view(padded, span).max(axis=1)
+
+
+def rolling_min(values: np.ndarray, span: int) -> np.ndarray:
+    """Minimum of each value and the span - 1 before it (fewer at the start)"""
+    return -rolling_max(-values, span)
+
+
+class BarSeries:
+    """
+    Bars of one ticker and bucket length, extended as ticks are recorded.
+
+    Args:
+        ticker (str): Ticker symbol.
+        bucket (int): Bar length in seconds.
+        start (float): Earliest time the bars cover.
+    """
+
+    def __init__(self, ticker: str, bucket: int, start: float):
+        self.ticker = ticker
+        self.bucket = bucket
+        self.start = start - start % bucket
+        # Longest window asked of this series lately; older bars are dropped
+        self.horizon = 0
+        self._windows = {}  # window -> when it was last asked for
+        self.bars = make_bars(np.empty(0), np.empty(0), bucket)
+        self.lock = threading.Lock()
+        # Read position: the last segment read and the byte offset consumed in it
+        self._day = history.day_of(self.start)
+        self._offset = 0
+        self._checked = 0.0
+
+    def extend(self, store: history.HistoryStore, now: float):
+        """Fold in the ticks recorded since the last call"""
+        if now - self._checked < EXTEND_INTERVAL:
+            return
+        self._checked = now
+        chunks = []
+        day = datetime.date.fromisoformat(self._day)
+        today = datetime.date.fromisoformat(history.day_of(now))
+        while True:
+            ticks, self._offset = load_ticks(store, self.ticker, day.isoformat(), self._offset)
+            if len(ticks):
+                chunks.append(ticks)
+            if day >= today:
+                break
+            day += datetime.timedelta(days=1)
+            self._offset = 0
+        self._day = day.isoformat()
+        if not chunks:
+            return
+
+        ticks = np.concatenate(chunks)
+        ticks = ticks[ticks['timestamp'] >= self.start]
+        if not len(ticks):
+            return
+        # Flushes keep recording order; sort anyway so a late tick cannot split a bar
+        ticks = ticks[np.argsort(ticks['timestamp'], kind='stable')]
+        timestamps = ticks['timestamp']
+        bars = self.bars
+        if len(bars['time']):
+            # A tick older than the last bar counts towards it
+            timestamps = np.maximum(timestamps, bars['time'][-1])
+        new = make_bars(timestamps, ticks['price'], self.bucket)
+
+        if len(bars['time']) and new['time'][0] == bars['time'][-1]:
+            # The first new bar continues the last cached one
+            bars['high'][-1] = max(bars['high'][-1], new['high'][0])
+            bars['low'][-1] = min(bars['low'][-1], new['low'][0])
+            bars['close'][-1] = new['close'][0]
+            bars['count'][-1] += new['count'][0]
+            new = {name: values[1:] for name, values in new.items()}
+        if len(new['time']):
+            self.bars = {name: np.concatenate((bars[name], new[name])) for name in bars}
+
+    def window(self, start: float) -> Dict[str, np.ndarray]:
+        """The bars from the one containing `start` on"""
+        first = int(np.searchsorted(self.bars['time'], start - start % self.bucket))
+        return {name: values[first:] for name, values in self.bars.items()}
+
+    def keep(self, window: int, now: float):
+        """Note a window asked for, and drop the bars no window asked for within HORIZON_TTL needs"""
+        self._windows[window] = now
+        for asked, when in list(self._windows.items()):
+            if now - when > HORIZON_TTL:
+                del self._windows[asked]
+        self.horizon = max(self._windows)
+        self.trim(now - self.horizon)
+
+    def trim(self, start: float):
+        """Drop bars before the one containing `start`"""
+        start -= start % self.bucket
+        if start > self.start:
+            self.bars = self.window(start)
+            self.start = start
+
+
+class BarCache:
+    """
+    BarSeries per (ticker, bucket), least recently used first out.
+
+    Args:
+        max_series (int, optional): Series kept.
+    """
+
+    def __init__(self, max_series: int = 4096):
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series = collections.OrderedDict()
+        self._stats = {'hits': 0, 'builds': 0, 'evictions': 0}
+
+    def series(self, ticker: str, bucket: int, start: float) -> BarSeries:
+        """The series of a ticker and bucket covering at least `start` on"""
+        key = (ticker, bucket)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None and series.start <= start:
+                self._series.move_to_end(key)
+                self._stats['hits'] += 1
+                return series
+            # New, or asked for more than it holds: rebuild from the requested start
+            series = self._series[key] = BarSeries(ticker, bucket, start)
+            self._series.move_to_end(key)
+            self._stats['builds'] += 1
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+                self._stats['evictions'] += 1
+            return series
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['series'] = len(self._series)
+            return stats
+
+
+_cache = BarCache()
+
+
+def _store() -> history.HistoryStore:
+    store = history.get_store()
+    if store is None:
+        raise LookupError("Tick history is not being recorded (STONX_HISTORY=0)")
+    return store
+
+
+def clamp_window(window: int) -> int:
+    """A window cut to the days of history kept"""
+    retention_days = _store().retention_days
+    return min(window, retention_days * 86400) if retention_days else window
+
+
+def _bars(ticker: str, bucket: int, window: int, now: float) -> Dict[str, np.ndarray]:
+    store = _store()
+    window = clamp_window(window)
+    start = now - window
+    series = _cache.series(ticker, bucket, start)
+    with series.lock:
+        series.extend(store, now)
+        series.keep(window, now)
+        # Copies, as the next extend() updates the last bar in place
+        return {name: values.copy() for name, values in series.window(start).items()}
+
+
+def _json_floats(values: np.ndarray, decimals: int = 4) -> List[Optional[float]]:
+    """Round for JSON, with NaN as null"""
+    values = np.round(values.astype(float), decimals)
+    return [None if value != value else value for value in values.tolist()]
+
+
+def bars(ticker: str, bucket: int, window: int, rolling: int = 0, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    OHLC bars of a ticker over the last `window` seconds.
+
+    Args:
+        ticker (str): Ticker symbol.
+        bucket (int): Bar length in seconds.
+        window (int): Seconds of history.
+        rolling (int, optional): Bars in the rolling high and low; 0 leaves them out.
+        now (float, optional): End of the window. Defaults to the current time.
+
+    Returns:
+        Dict[str, Any]: Lists of time, open, high, low, close and count per bar,
+        return (close over the previous close, minus one; null for the first bar),
+        rolling_high and rolling_low when asked for, and change_percent from the
+        first open to the last close.
+    """
+    now = time.time() if now is None else now
+    window_bars = _bars(ticker, bucket, window, now)
+    close = window_bars['close']
+    returns = np.full(len(close), np.nan)
+    if len(close) > 1:
+        returns[1:] = close[1:] / close[:-1] - 1
+    result = {
+        'time': window_bars['time'].tolist(),
+        'open': _json_floats(window_bars['open']),
+        'high': _json_floats(window_bars['high']),
+        'low': _json_floats(window_bars['low']),
+        'close': _json_floats(close),
+        'count': window_bars['count'].tolist(),
+        'return': _json_floats(returns, 6),
+        'change_percent': round(float((close[-1] / window_bars['open'][0] - 1) * 100), 4) if len(close) else None,
+    }
+    if rolling:
+        result['rolling_high'] = _json_floats(rolling_max(window_bars['high'], rolling))
+        result['rolling_low'] = _json_floats(rolling_min(window_bars['low'], rolling))
+    return result
+
+
+def changes(ticker: str, windows=CHANGE_WINDOWS, now: Optional[float] = None) -> Dict[str, Optional[float]]:
+    """
+    Percent change of the last price over each window, from minute bars.
+
+    The base is the close of the last bar that ended before the window began,
+    or null when the history does not reach back that far.
+    """
+    now = time.time() if now is None else now
+    spans = {name: parse_duration(name) for name in windows}
+    minute_bars = _bars(ticker, 60, max(spans.values()) + 60, now)
+    times = minute_bars['time']
+    close = minute_bars['close']
+    result = {}
+    for name, span in spans.items():
+        if not len(close):
+            result[name] = None
+            continue
+        # Bars starting at or before now - span - 60 ended before the window began
+        base = int(np.searchsorted(times, now - span - 60, side='right')) - 1
+        result[name] = round(float((close[-1] / close[base] - 1) * 100), 4) if base >= 0 else None
+    return result
+
+
+def sparklines(tickers: List[str], window: int = 86400, bucket: int = 300,
+               now: Optional[float] = None) -> Dict[str, List[float]]:
+    """Closing prices per bucket over the window, for each ticker with history"""
+    now = time.time() if now is None else now
+    lines = {}
+    for ticker in tickers:
+        close = _bars(ticker, bucket, window, now)['close']
+        if len(close):
+            lines[ticker] = _json_floats(close, 2)
+    return lines
+
+
+def stats() -> Dict[str, Any]:
+    return _cache.stats()
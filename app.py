@@ -1,59 +1,103 @@
 import os
+import csv
+import io
 import logging
 import time
 import datetime
 import hashlib
 import secrets
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, abort, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from threading import Lock
 import threading
 import argparse
 
 # Import scrapers
 from scraper import scrape_stock_data
 from threaded_scraper import ThreadedScraper
+from scraper_service import ScraperClient
+from sharding import ShardedScraperClient
+from payload import assemble_json, assemble_gzip
+from fair_share import QUOTA_EXCEEDED
+import metrics
+import tracing
+import profiler
+import parse_pool
+import history
+import analytics
+import export
+import symbols
+import alerts
+import database
+from logs import configure_logging, event
+from ttl_cache import TTLCache
 
 # Configure app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_key_change_in_production')
 app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(hours=24)  # 24 hour session timeout
 app.config['SESSION_REFRESH_EACH_REQUEST'] = True
+# Largest request body read at all (413 beyond); the CSV import is the only large one
+app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024
 
-# Configure database - optimized connection settings
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///247stonx.db'
+# Configure database: pool and pragmas tuned for SQLite, network settings otherwise (see database.py)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///247stonx.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,  # Verify connection validity before use
-    'pool_recycle': 280,    # Recycle connections after 280 seconds
-    'pool_size': 20,        # Increased pool size (from 10)
-    'max_overflow': 20,     # Increased max overflow (from 15)
-    'pool_timeout': 60      # Increased timeout (from default 30)
-}
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
 logger = logging.getLogger('247stonx')
 
 # Initialize database
 db = SQLAlchemy(app)
+with app.app_context():
+    database.tune_engine(db.engine)
+
+# With STONX_SCRAPER_SOCKET set, scraping and the quote cache live in the scraper daemon
+# (scraper_service.py) and this process only talks to it. Several comma-separated
+# sockets shard the tickers across daemons by consistent hashing (sharding.py).
+SCRAPER_SOCKETS = [path.strip() for path in os.environ.get('STONX_SCRAPER_SOCKET', '').split(',') if path.strip()]
 
-# Initialize the threaded scraper with optimized settings
-# - Use 6 workers for better parallelization
-# - Use a moderate cache_ttl of 300 seconds (5 minutes) to balance freshness and performance
-default_scraper = ThreadedScraper(max_workers=6, cache_ttl=300)  # 5 minutes cache TTL
+if len(SCRAPER_SOCKETS) > 1:
+    default_scraper = ShardedScraperClient(SCRAPER_SOCKETS, precompress=True)
+elif SCRAPER_SOCKETS:
+    default_scraper = ScraperClient(SCRAPER_SOCKETS[0], precompress=True)
+else:
+    # Initialize the threaded scraper with optimized settings
+    # - Use 6 workers for better parallelization
+    # - Use a moderate cache_ttl of 300 seconds (5 minutes) to balance freshness and performance
+    # - Pre-compress cached quotes so gzip bulk responses are assembled, not compressed, per request
+    default_scraper = ThreadedScraper(max_workers=6, cache_ttl=300, precompress=True)  # 5 minutes cache TTL
+
+def scrape_client() -> str:
+    """
+    Who the current request scrapes for: the signed-in user, or the caller's
+    address on unauthenticated routes. The scraper queues and charges cache
+    misses per client (see fair_share.py).
+    """
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return f"ip:{request.remote_addr}"
 
-# A lock to ensure thread-safety when accessing the scraper
-scraper_lock = Lock()
+# Cache gauges are read from the scraper whenever /metrics is scraped
+metrics.CACHE_SIZE.set_function(lambda: default_scraper.get_stats()['cache_size'])
+metrics.CACHE_HIT_RATIO.set_function(lambda: default_scraper.get_stats()['cache_hit_ratio'])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if profiler.active:
+        profiler.request_started(request.path)
+
+@app.after_request
+def observe_request_duration(response):
+    """Record endpoint latency for /metrics"""
+    start = g.get('request_start')
+    if start is not None:
+        metrics.REQUEST_DURATION.labels(request.endpoint or 'unmatched', request.method,
+                                        response.status_code).observe(time.perf_counter() - start)
+    return response
 
 # Ensure database sessions are properly managed
 @app.teardown_request
@@ -67,12 +111,28 @@ def teardown_request(exception=None):
     
     # Always close the session to avoid connection leaks
     db.session.close()
+    
+    if profiler.active:
+        profiler.request_finished()
 
 # Initialize login manager
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
+# Usernames allowed to use the admin and debug endpoints, e.g. STONX_ADMINS=alice,bob
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('STONX_ADMINS', '').split(',') if name.strip()}
+
+def admin_required(f):
+    """Like login_required, but also requires the user to be listed in STONX_ADMINS"""
+    @wraps(f)
+    @login_required
+    def decorated_function(*args, **kwargs):
+        if current_user.username not in ADMIN_USERNAMES:
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
 # Define database models
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -86,19 +146,230 @@ class UserTicker(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     ticker = db.Column(db.String(20))
-    __table_args__ = (db.UniqueConstraint('user_id', 'ticker', name='_user_ticker_uc'),)
+    # Place on the dashboard; ties (rows from before reordering existed) fall back to id
+    position = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    __table_args__ = (db.UniqueConstraint('user_id', 'ticker', name='_user_ticker_uc'),
+                      # Every dashboard and quote request reads a user's tickers in this order
+                      db.Index('ix_user_ticker_user_position', 'user_id', 'position'))
+
+class PriceAlert(db.Model):
+    """An alert on a watchlist ticker: price above or below a level, or a day move of at least some percent"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    ticker = db.Column(db.String(20), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # alerts.ABOVE, BELOW or MOVE
+    threshold = db.Column(db.Float, nullable=False)  # price, or percent for MOVE
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    triggered_at = db.Column(db.DateTime, nullable=True)
+    trigger_price = db.Column(db.Float, nullable=True)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.Index('ix_price_alert_user_delivered', 'user_id', 'delivered_at'),
+                      db.Index('ix_price_alert_triggered', 'triggered_at'))
+    
+    def to_alert(self) -> alerts.Alert:
+        return alerts.Alert(self.id, self.user_id, self.ticker, self.kind, self.threshold)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'ticker': self.ticker,
+            'kind': self.kind,
+            'threshold': self.threshold,
+            'description': f"{self.ticker} {alerts.describe(self.kind, self.threshold)}",
+            'created_at': self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'triggered_at': self.triggered_at.strftime("%Y-%m-%d %H:%M:%S") if self.triggered_at else None,
+            'trigger_price': self.trigger_price,
+        }
+
+# Users and watchlists are read on every request; each process keeps them for
+# STONX_USER_CACHE_TTL seconds (0 disables). Changes made by this process invalidate
+# its entries at once; other processes see them within the TTL.
+USER_CACHE_TTL = float(os.environ.get('STONX_USER_CACHE_TTL', '60'))
+user_cache = TTLCache('users', USER_CACHE_TTL)
+watchlist_cache = TTLCache('watchlists', USER_CACHE_TTL)
+
+def fetch_user(user_id):
+    """A user detached from the session, to be kept in the user cache"""
+    user = db.session.get(User, user_id)
+    if user is not None:
+        db.session.expunge(user)
+    return user
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        user = User.query.get(int(user_id))
-        return user
+        user_id = int(user_id)
+        user = user_cache.get(user_id, lambda: fetch_user(user_id))
+        # The cached instance is shared between threads; each request gets its own copy, without a query
+        return db.session.merge(user, load=False) if user is not None else None
     except Exception as e:
         logger.error(f"Error loading user {user_id}: {e}")
         return None
     finally:
         db.session.close()
 
+# Price alerts (see alerts.py). The engine reads and claims alerts from its own thread.
+
+def load_active_alerts():
+    with app.app_context():
+        try:
+            return [row.to_alert() for row in PriceAlert.query.filter(PriceAlert.triggered_at.is_(None)).all()]
+        finally:
+            db.session.close()
+
+def active_alerts_signature():
+    """Changes whenever an active alert is added, deleted or triggered, by any process"""
+    with app.app_context():
+        try:
+            return tuple(db.session.query(db.func.count(PriceAlert.id), db.func.max(PriceAlert.id),
+                                          db.func.max(PriceAlert.created_at))
+                         .filter(PriceAlert.triggered_at.is_(None)).one())
+        finally:
+            db.session.close()
+
+def claim_fired_alerts(fired):
+    """Mark fired alerts triggered; an alert another worker already claimed is skipped"""
+    with app.app_context():
+        try:
+            now = datetime.datetime.utcnow()
+            claimed = []
+            for item in fired:
+                updated = PriceAlert.query.filter(PriceAlert.id == item.alert.id, PriceAlert.triggered_at.is_(None)) \
+                    .update({'triggered_at': now, 'trigger_price': item.price}, synchronize_session=False)
+                if updated:
+                    claimed.append(item)
+            db.session.commit()
+            # The next poll of these users looks for the alerts
+            if claimed:
+                alert_check_cache.invalidate(PENDING_ALERT_USERS)
+            return claimed
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.close()
+
+def load_watchlist(user_id):
+    rows = db.session.query(UserTicker.ticker).filter_by(user_id=user_id) \
+        .order_by(UserTicker.position, UserTicker.id).all()
+    return tuple(row.ticker for row in rows)
+
+def watchlist_tickers(user_id):
+    """A user's tickers in dashboard order, from the watchlist cache"""
+    return list(watchlist_cache.get(user_id, lambda: load_watchlist(user_id)))
+
+def next_position(user_id):
+    """Position after the last of a user's tickers"""
+    last = db.session.query(db.func.max(UserTicker.position)).filter_by(user_id=user_id).scalar()
+    return (last or 0) + 1
+
+def load_pending_alert_users():
+    """Users with triggered alerts not yet delivered, claimed by any process"""
+    rows = db.session.query(PriceAlert.user_id).filter(PriceAlert.triggered_at.isnot(None),
+                                                       PriceAlert.delivered_at.is_(None)).distinct()
+    return frozenset(row.user_id for row in rows)
+
+def poll_fired_alerts(user_id):
+    """
+    take_fired_alerts(), skipped unless the user has alerts waiting.
+    
+    Who has alerts waiting is read from the database, which every worker's engine
+    claims alerts in, with one query per ALERT_INTERVAL for the whole process; so an
+    alert reaches the next poll after that, whichever worker claimed it.
+    claim_fired_alerts() drops the cached set, so alerts claimed here show at once.
+    """
+    if user_id not in alert_check_cache.get(PENDING_ALERT_USERS, load_pending_alert_users):
+        return []
+    delivered = take_fired_alerts(user_id)
+    alert_check_cache.invalidate(PENDING_ALERT_USERS)
+    return delivered
+
+def take_fired_alerts(user_id):
+    """The user's triggered alerts not yet shown on a dashboard, marked delivered"""
+    rows = PriceAlert.query.filter(PriceAlert.user_id == user_id, PriceAlert.delivered_at.is_(None),
+                                   PriceAlert.triggered_at.isnot(None)).all()
+    if not rows:
+        return []
+    now = datetime.datetime.utcnow()
+    delivered = []
+    for row in rows:
+        # Conditional, so two concurrent dashboard polls show an alert once
+        if PriceAlert.query.filter(PriceAlert.id == row.id, PriceAlert.delivered_at.is_(None)) \
+                .update({'delivered_at': now}, synchronize_session=False):
+            delivered.append(row.to_dict())
+    db.session.commit()
+    return delivered
+
+# Seconds between the alert engine's database checks (and quote polls with a scraper daemon)
+ALERT_INTERVAL = float(os.environ.get('STONX_ALERT_INTERVAL', '5'))
+
+# The users with fired alerts waiting, shared by every worker through the database
+# and re-read at most once per ALERT_INTERVAL (see poll_fired_alerts)
+PENDING_ALERT_USERS = 'pending'
+alert_check_cache = TTLCache('alert_checks', ALERT_INTERVAL)
+
+# A local scraper pushes every new quote to the engine; a daemon's cache is polled instead
+alert_engine = alerts.AlertEngine(
+    load_active_alerts, active_alerts_signature, claim_fired_alerts, ALERT_INTERVAL,
+    poll_quotes=None if hasattr(default_scraper, 'add_quote_listener')
+    else lambda tickers: default_scraper.get_cached_quotes(tickers)[0])
+
+# Columns added to existing tables since they were first created: (table, column, DDL).
+# create_all() creates missing tables but never alters existing ones.
+ADDED_COLUMNS = [
+    ('user_ticker', 'position', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+def upgrade_database():
+    """Create missing tables, columns and indexes, so an older database keeps working"""
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table, column, ddl in ADDED_COLUMNS:
+            if column not in {info['name'] for info in inspector.get_columns(table)}:
+                connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+                logger.info("Added column %s.%s", table, column)
+        # create_all() skips the indexes of tables that already exist
+        for table in db.metadata.sorted_tables:
+            existing = {info['name'] for info in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    logger.info("Created index %s", index.name)
+    database.optimize(db.engine)
+
+def init_app():
+    """
+    Start what runs beside the request handlers: logging, tracing, the parse pool,
+    tick history, the symbol index, the database upgrade and the alert engine.
+    
+    Kept out of the module body so that parse pool processes, which import this
+    module again as __mp_main__ (see parse_pool.py), start none of it.
+    """
+    # Records are queued and written by a background thread (see logs.py)
+    configure_logging()
+    # Opt-in scrape tracing (STONX_TRACING=1), served at /debug/traces
+    tracing.configure_from_env()
+    # Opt-in process pool for page parsing (STONX_PARSE_PROCESSES)
+    parse_pool.configure_from_env()
+    # Tick history of every scraped quote (STONX_HISTORY, STONX_HISTORY_DIR). With a scraper
+    # daemon, the daemon records and prunes it; the web workers only read it.
+    history.configure_from_env(os.path.join(app.instance_path, 'history'), read_only=bool(SCRAPER_SOCKETS))
+    # Known symbols for add_ticker and autocomplete (STONX_SYMBOLS_FILE, see symbols.py)
+    symbols.configure_from_env(os.path.join(app.instance_path, 'symbols.txt'))
+    
+    with app.app_context():
+        try:
+            upgrade_database()
+        except Exception as e:
+            logger.error(f"Could not upgrade the database: {e}")
+    if hasattr(default_scraper, 'add_quote_listener'):
+        default_scraper.add_quote_listener(alert_engine.on_quote)
+    alert_engine.start()
+
+if __name__ != '__mp_main__':
+    init_app()
+
 # Routes
 @app.route('/')
 def index():
@@ -213,17 +484,17 @@ def signup():
                 password=generate_password_hash(password, method='pbkdf2:sha256')
             )
             
-            # Add default tickers for new users
+            # Add the user and some default tickers in one transaction
             db.session.add(new_user)
-            db.session.commit()
+            db.session.flush()
             
-            # Add some default tickers
             default_tickers = ['SPY', 'AAPL', 'MSFT', 'GOOGL', 'AMZN']
-            for ticker in default_tickers:
-                user_ticker = UserTicker(user_id=new_user.id, ticker=ticker)
-                db.session.add(user_ticker)
+            db.session.add_all([UserTicker(user_id=new_user.id, ticker=ticker, position=position)
+                                for position, ticker in enumerate(default_tickers, 1)])
             
             db.session.commit()
+            user_cache.invalidate(new_user.id)
+            watchlist_cache.invalidate(new_user.id)
             
             # Log the user in
             login_user(new_user)
@@ -251,25 +522,43 @@ def logout():
 def dashboard():
     try:
         # Get user's tickers
-        user_tickers = UserTicker.query.filter_by(user_id=current_user.id).all()
-        tickers = [ut.ticker for ut in user_tickers]
+        tickers = watchlist_tickers(current_user.id)
         
         # If this is an AJAX request, return JSON
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({"authenticated": True})
         
-        # For fresh page loads, prefetch ticker data with fast mode to make the initial experience quicker
+        # Render straight from the cache instead of waiting for upstream: cached quotes
+        # are embedded in the page (expired ones marked stale) and the tickers that
+        # need fetching are queued in the background for dashboard.js to pick up
+        initial_quotes = {}
+        pending = []
         if tickers:
             try:
-                with scraper_lock:
+                quotes, pending = default_scraper.get_cached_quotes(tickers)
+                initial_quotes = {ticker: quote.to_dict() for ticker, quote in quotes.items()}
+                if pending:
                     # Use fast_mode=True for initial page loads to reduce delays
-                    default_scraper.get_multiple_stock_data(tickers, fast_mode=True)
-                    logger.info(f"Prefetched data for {len(tickers)} tickers on dashboard load (fast mode)")
+                    default_scraper.refresh_in_background(pending, fast_mode=True, client=scrape_client())
+                    logger.debug("Queued background refresh of %d of %d tickers on dashboard load",
+                                 len(pending), len(tickers))
             except Exception as e:
-                # If prefetch fails, just log it and continue - the frontend will still work
-                logger.error(f"Prefetch error: {e}")
+                # If the lookup fails, just log it and continue - the frontend will fetch everything
+                logger.error(f"Dashboard cache lookup error: {e}")
+                pending = tickers
             
-        return render_template('dashboard.html', tickers=tickers)
+        # Sparklines of the last day from the tick history, a few milliseconds even for long watchlists
+        sparklines = {}
+        if tickers:
+            try:
+                sparklines = analytics.sparklines(tickers, SPARKLINE_WINDOW, SPARKLINE_BUCKET)
+            except LookupError:
+                pass
+            except Exception as e:
+                logger.error(f"Dashboard sparkline error: {e}")
+            
+        return render_template('dashboard.html', tickers=tickers, initial_quotes=initial_quotes, pending=pending,
+                               sparklines=sparklines)
     except Exception as e:
         logger.error(f"Dashboard error: {e}")
         flash('An error occurred. Please try again.')
@@ -284,6 +573,8 @@ def add_ticker():
     
     if not ticker:
         return jsonify({"success": False, "error": "No ticker symbol provided"}), 400
+    if not symbols.is_valid_symbol(ticker):
+        return jsonify({"success": False, "error": f"{ticker} is not a valid ticker symbol"}), 400
         
     try:
         # Check if ticker already exists for this user
@@ -291,22 +582,30 @@ def add_ticker():
         if existing_ticker:
             return jsonify({"success": False, "error": f"{ticker} is already in your watchlist"}), 400
             
-        # Validate the ticker by attempting to get data for it
-        try:
-            with scraper_lock:
-                ticker_data = default_scraper.get_stock_data(ticker)
+        symbol_index = symbols.get_index()
+        if ticker in symbol_index:
+            # Known symbol: no need to wait for a scrape, just warm the cache for the reload
+            default_scraper.refresh_in_background([ticker], client=scrape_client())
+        else:
+            # Unknown to the index: validate the ticker by attempting to get data for it
+            try:
+                ticker_data = default_scraper.get_stock_data(ticker, client=scrape_client())
                 
-            if not ticker_data or 'error' in ticker_data:
-                error_msg = ticker_data.get('error', f"Could not find ticker {ticker}")
-                return jsonify({"success": False, "error": error_msg}), 404
-        except Exception as e:
-            logger.error(f"Error validating ticker {ticker}: {e}")
-            return jsonify({"success": False, "error": f"Could not validate ticker {ticker}"}), 500
+                if ticker_data.get('error') == QUOTA_EXCEEDED:
+                    return jsonify({"success": False, "error": QUOTA_EXCEEDED}), 429
+                if not ticker_data or 'error' in ticker_data:
+                    error_msg = ticker_data.get('error', f"Could not find ticker {ticker}")
+                    return jsonify({"success": False, "error": error_msg}), 404
+                symbol_index.add(ticker)
+            except Exception as e:
+                logger.error(f"Error validating ticker {ticker}: {e}")
+                return jsonify({"success": False, "error": f"Could not validate ticker {ticker}"}), 500
             
         # Add ticker to user's watchlist
-        new_ticker = UserTicker(user_id=current_user.id, ticker=ticker)
+        new_ticker = UserTicker(user_id=current_user.id, ticker=ticker, position=next_position(current_user.id))
         db.session.add(new_ticker)
         db.session.commit()
+        watchlist_cache.invalidate(current_user.id)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -327,7 +626,14 @@ def remove_ticker(ticker):
             return jsonify({"success": False, "error": f"{ticker} not found in your watchlist"}), 404
             
         db.session.delete(ticker_record)
+        # Alerts belong to the watchlist entry
+        ticker_alerts = PriceAlert.query.filter_by(user_id=current_user.id, ticker=ticker).all()
+        for alert in ticker_alerts:
+            db.session.delete(alert)
         db.session.commit()
+        watchlist_cache.invalidate(current_user.id)
+        for alert in ticker_alerts:
+            alert_engine.index.remove(alert.id)
         
         return jsonify({"success": True})
     except Exception as e:
@@ -337,6 +643,296 @@ def remove_ticker(ticker):
     finally:
         db.session.close()
 
+# Most alerts waiting to fire per user
+MAX_ALERTS_PER_USER = 100
+
+@app.route('/api/alerts')
+@login_required
+def list_alerts():
+    """The user's alerts, waiting and triggered, optionally for one ?ticker="""
+    try:
+        query = PriceAlert.query.filter_by(user_id=current_user.id)
+        ticker = request.args.get('ticker', '').strip().upper()
+        if ticker:
+            query = query.filter_by(ticker=ticker)
+        rows = query.order_by(PriceAlert.ticker, PriceAlert.created_at).all()
+        return jsonify([row.to_dict() for row in rows])
+    finally:
+        db.session.close()
+
+@app.route('/api/alerts', methods=['POST'])
+@login_required
+def create_alert():
+    """
+    Set an alert on a watchlist ticker.
+    
+    Takes JSON or form fields: ticker, kind (above, below or move) and threshold
+    (a price, or a percent for move).
+    """
+    data = request.get_json(silent=True) or request.form
+    ticker = str(data.get('ticker', '')).strip().upper()
+    kind = str(data.get('kind', '')).strip().lower()
+    try:
+        threshold = float(data.get('threshold', ''))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Threshold must be a number"}), 400
+    if kind not in alerts.KINDS:
+        return jsonify({"success": False, "error": f"Kind must be one of {', '.join(alerts.KINDS)}"}), 400
+    if not (0 < threshold < 1e9):
+        return jsonify({"success": False, "error": "Threshold must be positive"}), 400
+    
+    try:
+        if not UserTicker.query.filter_by(user_id=current_user.id, ticker=ticker).first():
+            return jsonify({"success": False, "error": f"{ticker} is not in your watchlist"}), 400
+        active = PriceAlert.query.filter_by(user_id=current_user.id, triggered_at=None).count()
+        if active >= MAX_ALERTS_PER_USER:
+            return jsonify({"success": False,
+                            "error": f"You can have at most {MAX_ALERTS_PER_USER} active alerts"}), 400
+        
+        row = PriceAlert(user_id=current_user.id, ticker=ticker, kind=kind, threshold=threshold)
+        db.session.add(row)
+        db.session.commit()
+        alert_engine.index.add(row.to_alert())
+        return jsonify({"success": True, "alert": row.to_dict()}), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating alert on {ticker}: {e}")
+        return jsonify({"success": False, "error": "An error occurred. Please try again."}), 500
+    finally:
+        db.session.close()
+
+@app.route('/api/alerts/<int:alert_id>', methods=['DELETE'])
+@login_required
+def delete_alert(alert_id):
+    try:
+        row = PriceAlert.query.filter_by(id=alert_id, user_id=current_user.id).first()
+        if not row:
+            return jsonify({"success": False, "error": "Alert not found"}), 404
+        db.session.delete(row)
+        db.session.commit()
+        alert_engine.index.remove(alert_id)
+        return jsonify({"success": True})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting alert {alert_id}: {e}")
+        return jsonify({"success": False, "error": "An error occurred. Please try again."}), 500
+    finally:
+        db.session.close()
+
+# Most suggestions one autocomplete request returns
+MAX_SYMBOL_SUGGESTIONS = 50
+
+@app.route('/api/symbols')
+@login_required
+def get_symbols():
+    """Autocomplete: known symbols starting with ?prefix=, then symbols whose name has a word starting with it"""
+    prefix = request.args.get('prefix', '').strip()
+    try:
+        limit = min(int(request.args.get('limit', '10')), MAX_SYMBOL_SUGGESTIONS)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    if not prefix or limit < 1:
+        return jsonify([])
+    
+    matches = symbols.get_index().search(prefix, limit)
+    response = jsonify([{'symbol': symbol, 'name': name} for symbol, name in matches])
+    # The index changes at most daily; let the browser reuse answers while the user types
+    response.headers["Cache-Control"] = "private, max-age=300"
+    return response
+
+# Most tickers one bulk watchlist request or import may carry
+MAX_BULK_TICKERS = 500
+
+# Largest CSV file the import takes
+MAX_IMPORT_BYTES = 1024 * 1024
+
+def request_ticker_list():
+    """Tickers of a bulk request: a JSON list under "tickers", or a comma-separated form field"""
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get('tickers'), list):
+        raw = [str(ticker) for ticker in data['tickers']]
+    else:
+        raw = request.form.get('tickers', '').replace('\n', ',').split(',')
+    return list(dict.fromkeys(t.strip().upper() for t in raw if t.strip()))
+
+def validate_tickers(tickers):
+    """
+    Check many tickers at once.
+    
+    Symbols the index knows pass without a scrape; the rest are scraped together,
+    concurrently on the scraper workers.
+    
+    Returns:
+        tuple: (valid, invalid) with the valid tickers in the given order and
+        an error message per invalid one.
+    """
+    invalid = {}
+    symbol_index = symbols.get_index()
+    unknown = []
+    for ticker in tickers:
+        if not symbols.is_valid_symbol(ticker):
+            invalid[ticker] = "Not a valid ticker symbol"
+        elif ticker not in symbol_index:
+            unknown.append(ticker)
+    if unknown:
+        quotes, _ = default_scraper.get_multiple_quotes(unknown, fast_mode=True, client=scrape_client())
+        for ticker in unknown:
+            quote = quotes.get(ticker)
+            if quote is None or quote.error or quote.price is None:
+                invalid[ticker] = quote.error if quote is not None and quote.error else f"Could not find ticker {ticker}"
+            else:
+                symbol_index.add(ticker)
+    return [ticker for ticker in tickers if ticker not in invalid], invalid
+
+def add_tickers(tickers):
+    """
+    Add tickers to the current user's watchlist in one transaction.
+    
+    Tickers already in the watchlist are found with one query and skipped before
+    validation; the new ones go at the end, in the given order.
+    
+    Returns:
+        Response: JSON with added, existing and invalid (ticker -> error).
+    """
+    if not tickers:
+        return jsonify({"success": False, "error": "No ticker symbols provided"}), 400
+    if len(tickers) > MAX_BULK_TICKERS:
+        return jsonify({"success": False, "error": f"At most {MAX_BULK_TICKERS} tickers per request"}), 400
+    
+    try:
+        start_time = time.perf_counter()
+        existing = {row.ticker for row in db.session.query(UserTicker.ticker).filter(
+            UserTicker.user_id == current_user.id, UserTicker.ticker.in_(tickers))}
+        new_tickers = [ticker for ticker in tickers if ticker not in existing]
+        
+        valid, invalid = validate_tickers(new_tickers)
+        if valid:
+            position = next_position(current_user.id)
+            db.session.add_all([UserTicker(user_id=current_user.id, ticker=ticker, position=position + offset)
+                                for offset, ticker in enumerate(valid)])
+            db.session.commit()
+            watchlist_cache.invalidate(current_user.id)
+            # Warm the cache for the dashboard reload
+            default_scraper.refresh_in_background(valid, client=scrape_client())
+        
+        event(logger, logging.INFO, 'watchlist_add', user=current_user.id, requested=len(tickers),
+              added=len(valid), existing=len(existing), invalid=len(invalid),
+              duration_ms=round((time.perf_counter() - start_time) * 1000, 1))
+        # Everything refused by the quota: tell the client to back off
+        status = 429 if invalid and all(error == QUOTA_EXCEEDED for error in invalid.values()) and not valid else 200
+        return jsonify({
+            "success": bool(valid) or not invalid,
+            "added": valid,
+            "existing": [ticker for ticker in tickers if ticker in existing],
+            "invalid": invalid,
+        }), status
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error adding {len(tickers)} tickers: {e}")
+        return jsonify({"success": False, "error": "An error occurred. Please try again."}), 500
+    finally:
+        db.session.close()
+
+@app.route('/api/watchlist/add', methods=['POST'])
+@login_required
+def bulk_add_tickers():
+    """Add many tickers: JSON {"tickers": [...]} or a comma-separated tickers form field"""
+    return add_tickers(request_ticker_list())
+
+@app.route('/api/watchlist/import', methods=['POST'])
+@login_required
+def import_tickers():
+    """
+    Add the tickers of a CSV file (uploaded as "file", or the request body).
+    
+    Tickers come from the column headed symbol or ticker, or else the first column;
+    other columns (quantities, prices) are ignored.
+    """
+    too_large = jsonify({"success": False, "error": "The file is too large"}), 413
+    # Refuse before reading; the multipart framing adds a little to the file itself
+    if request.content_length is not None and request.content_length > MAX_IMPORT_BYTES + 64 * 1024:
+        return too_large
+    upload = request.files.get('file')
+    raw = upload.read(MAX_IMPORT_BYTES + 1) if upload is not None else request.get_data()
+    if len(raw) > MAX_IMPORT_BYTES:
+        return too_large
+    rows = list(csv.reader(io.StringIO(raw.decode('utf-8-sig', errors='replace'))))
+    if not rows:
+        return jsonify({"success": False, "error": "The file is empty"}), 400
+    
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in ('symbol', 'ticker') if name in header), None)
+    if column is not None:
+        rows = rows[1:]
+    else:
+        column = 0
+    tickers = list(dict.fromkeys(row[column].strip().upper() for row in rows
+                                 if len(row) > column and row[column].strip()))
+    return add_tickers(tickers)
+
+@app.route('/api/watchlist/remove', methods=['POST'])
+@login_required
+def bulk_remove_tickers():
+    """Remove many tickers, and their alerts, in one transaction"""
+    tickers = request_ticker_list()
+    if not tickers:
+        return jsonify({"success": False, "error": "No ticker symbols provided"}), 400
+    
+    try:
+        removed = [row.ticker for row in db.session.query(UserTicker.ticker).filter(
+            UserTicker.user_id == current_user.id, UserTicker.ticker.in_(tickers))]
+        alert_ids = [row.id for row in db.session.query(PriceAlert.id).filter(
+            PriceAlert.user_id == current_user.id, PriceAlert.ticker.in_(removed))]
+        if removed:
+            UserTicker.query.filter(UserTicker.user_id == current_user.id, UserTicker.ticker.in_(removed)) \
+                .delete(synchronize_session=False)
+            if alert_ids:
+                PriceAlert.query.filter(PriceAlert.id.in_(alert_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            watchlist_cache.invalidate(current_user.id)
+            for alert_id in alert_ids:
+                alert_engine.index.remove(alert_id)
+        removed = set(removed)
+        return jsonify({
+            "success": True,
+            "removed": [ticker for ticker in tickers if ticker in removed],
+            "missing": [ticker for ticker in tickers if ticker not in removed],
+        })
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error removing {len(tickers)} tickers: {e}")
+        return jsonify({"success": False, "error": "An error occurred. Please try again."}), 500
+    finally:
+        db.session.close()
+
+@app.route('/api/watchlist/reorder', methods=['POST'])
+@login_required
+def reorder_tickers():
+    """
+    Put the watchlist in the given order.
+    
+    Tickers left out keep their relative order after the listed ones; tickers not
+    in the watchlist are ignored.
+    """
+    order = request_ticker_list()
+    try:
+        rows = UserTicker.query.filter_by(user_id=current_user.id) \
+            .order_by(UserTicker.position, UserTicker.id).all()
+        rank = {ticker: index for index, ticker in enumerate(order)}
+        # Stable sort: unlisted tickers keep their order, after the listed ones
+        rows.sort(key=lambda row: rank.get(row.ticker, len(order)))
+        db.session.bulk_update_mappings(UserTicker, [{'id': row.id, 'position': position}
+                                                     for position, row in enumerate(rows, 1)])
+        db.session.commit()
+        watchlist_cache.invalidate(current_user.id)
+        return jsonify({"success": True, "tickers": [row.ticker for row in rows]})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reordering the watchlist: {e}")
+        return jsonify({"success": False, "error": "An error occurred. Please try again."}), 500
+    finally:
+        db.session.close()
+
 @app.route('/api/stock_data')
 @login_required
 def get_stock_data():
@@ -348,15 +944,15 @@ def get_stock_data():
     try:
         start_time = time.time()
         
-        # Add timestamp to avoid caching on client side
-        with scraper_lock:
-            data = default_scraper.get_stock_data(ticker)
+        data = default_scraper.get_stock_data(ticker, client=scrape_client())
         
         end_time = time.time()
-        logger.info(f"Fetched data for {ticker} in {end_time - start_time:.2f}s")
+        logger.debug("Fetched data for %s in %.2fs", ticker, end_time - start_time)
         
         # Add Cache-Control headers to prevent caching
         response = jsonify(data)
+        if data.get('error') == QUOTA_EXCEEDED:
+            response.status_code = 429
         response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
@@ -382,8 +978,7 @@ def get_bulk_stock_data():
         else:
             # Otherwise, use all of the user's tickers
             try:
-                user_tickers = UserTicker.query.filter_by(user_id=current_user.id).all()
-                tickers = [ut.ticker for ut in user_tickers]
+                tickers = watchlist_tickers(current_user.id)
             except Exception as db_error:
                 logger.error(f"Database error fetching user tickers: {db_error}")
                 return jsonify({"error": "Failed to fetch user tickers"}), 500
@@ -392,47 +987,65 @@ def get_bulk_stock_data():
             return jsonify({"error": "No tickers available"}), 400
         
         # Log request details
-        logger.info(f"Bulk data request for {len(tickers)} tickers: {', '.join(tickers[:5])}{' ...' if len(tickers) > 5 else ''}{' (fast mode)' if initial_load else ''}")
+        logger.debug("Bulk data request for %d tickers: %s", len(tickers), tickers)
         
         start_time = time.time()
         
         try:
-            # Get data for all tickers at once using the threaded scraper
-            with scraper_lock:
-                data = default_scraper.get_multiple_stock_data(tickers, fast_mode=initial_load)
+            # Get quotes for all tickers at once using the threaded scraper
+            quotes, batch_metadata = default_scraper.get_multiple_quotes(tickers, fast_mode=initial_load,
+                                                                         client=scrape_client())
             
             end_time = time.time()
             total_time = end_time - start_time
             
-            # Get statistics from the scraper
-            stats = default_scraper.get_stats()
-            cache_info = default_scraper.get_cache_info() if hasattr(default_scraper, 'get_cache_info') else None
-            
             # Add enhanced metadata about the request
-            # Fix: Check if cached_tickers and uncached_tickers are lists before calling len()
-            cached_tickers = data['metadata'].get('cached_tickers', []) if 'metadata' in data else []
-            uncached_tickers = data['metadata'].get('uncached_tickers', []) if 'metadata' in data else []
-            
-            # Fix: Ensure cached_tickers and uncached_tickers are treated as values, not lists if they're integers
-            cache_hits = len(cached_tickers) if isinstance(cached_tickers, list) else cached_tickers
-            cache_misses = len(uncached_tickers) if isinstance(uncached_tickers, list) else uncached_tickers
+            cache_hits = batch_metadata['cached_tickers']
+            cache_misses = batch_metadata['uncached_tickers']
+            quota_denied = batch_metadata.get('quota_denied', 0)
             
-            data['metadata'] = {
+            metadata = {
                 'total_time': total_time,
                 'tickers_count': len(tickers),
                 'average_time_per_ticker': total_time / max(len(tickers), 1),
                 'cache_hits': cache_hits,
                 'cache_misses': cache_misses,
-                'cache_size': stats.get('cache_size', 0),
                 'fast_mode': initial_load,
-                'success_rate': f"{len([t for t in tickers if t in data and data[t].get('price') != 'N/A']) / len(tickers) * 100:.1f}%"
+                'quota_denied': quota_denied,
+                'success_rate': f"{len([t for t in tickers if t in quotes and quotes[t].price is not None]) / len(tickers) * 100:.1f}%"
             }
             
-            logger.info(f"Fetched bulk data for {len(tickers)} tickers in {total_time:.2f}s " +
-                      f"(cache hits: {data['metadata']['cache_hits']}, misses: {data['metadata']['cache_misses']})")
+            # Alerts fired since the last poll ride along with the quotes
+            try:
+                fired_alerts = poll_fired_alerts(current_user.id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error delivering alerts: {e}")
+                fired_alerts = []
+            if fired_alerts:
+                metadata['alerts'] = fired_alerts
+            
+            event(logger, logging.INFO, 'bulk_request', user=current_user.id, tickers=len(tickers),
+                  duration_ms=round(total_time * 1000, 1), cache_hits=cache_hits, cache_misses=cache_misses,
+                  fast_mode=initial_load, quota_denied=quota_denied)
+            
+            # Build the body from the quotes' pre-encoded bytes instead of re-encoding with jsonify
+            encoded_quotes = default_scraper.get_encoded_quotes(quotes)
+            precompressed = all(quote.deflated is not None for quote in encoded_quotes)
+            
+            # Every ticker refused by the quota: tell the client to back off
+            status = 429 if quota_denied and quota_denied == len(tickers) else 200
+            
+            if precompressed and 'gzip' in request.accept_encodings:
+                response = app.response_class(assemble_gzip(encoded_quotes, metadata), status=status,
+                                              mimetype='application/json')
+                response.headers["Content-Encoding"] = "gzip"
+            else:
+                body = assemble_json([quote.member for quote in encoded_quotes], metadata)
+                response = app.response_class(body, status=status, mimetype='application/json')
+            response.headers["Vary"] = "Accept-Encoding"
             
             # Add Cache-Control headers to prevent caching
-            response = jsonify(data)
             response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
             response.headers["Pragma"] = "no-cache"
             response.headers["Expires"] = "0"
@@ -446,10 +1059,9 @@ def get_bulk_stock_data():
             partial_results = {}
             try:
                 for ticker in tickers:
-                    with scraper_lock:
-                        result = default_scraper.get_stock_data(ticker)
-                        if result:
-                            partial_results[ticker] = result
+                    result = default_scraper.get_stock_data(ticker, client=scrape_client())
+                    if result:
+                        partial_results[ticker] = result
             except:
                 # If even that fails, return the error
                 pass
@@ -470,6 +1082,145 @@ def get_bulk_stock_data():
         logger.error(f"Error getting bulk stock data: {e}")
         return jsonify({"error": f"Failed to fetch bulk stock data: {str(e)}"}), 500
 
+# Dashboard sparklines: a day of 5-minute closes
+SPARKLINE_WINDOW = 86400
+SPARKLINE_BUCKET = 300
+
+# Most tickers one history request may ask for
+MAX_HISTORY_TICKERS = 200
+
+def history_tickers():
+    """Tickers of a history or export request: ?tickers= or the user's watchlist"""
+    tickers_param = request.args.get('tickers', '')
+    if tickers_param:
+        tickers = [t.strip().upper() for t in tickers_param.split(',') if t.strip()]
+    else:
+        tickers = watchlist_tickers(current_user.id)
+    return list(dict.fromkeys(tickers))[:MAX_HISTORY_TICKERS]
+
+@app.route('/api/history/bars')
+@login_required
+def get_history_bars():
+    """
+    OHLC bars, per-bar returns, rolling highs and lows and percent changes from the tick history.
+    
+    Query parameters: tickers (default the watchlist), bucket (bar length: 1m, 5m, 15m,
+    1h or 1d; default 5m), window (default 1d, at most the history retention) and
+    rolling (bars in the rolling high and low, default 0 for none).
+    """
+    try:
+        bucket = analytics.parse_bucket(request.args.get('bucket', '5m'))
+        window = analytics.parse_duration(request.args.get('window', '1d'))
+        rolling = int(request.args.get('rolling', '0'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if window // bucket > 10000 or rolling < 0 or rolling > 1000:
+        return jsonify({"error": "Too many bars requested"}), 400
+    
+    try:
+        start_time = time.perf_counter()
+        window = analytics.clamp_window(window)
+        tickers = history_tickers()
+        now = time.time()
+        data = {}
+        for ticker in tickers:
+            data[ticker] = analytics.bars(ticker, bucket, window, rolling, now)
+            data[ticker]['changes'] = analytics.changes(ticker, now=now)
+        data['metadata'] = {
+            'bucket': bucket,
+            'window': window,
+            'tickers_count': len(tickers),
+            'total_time': time.perf_counter() - start_time,
+        }
+        return jsonify(data)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error computing history bars: {e}")
+        return jsonify({"error": "Failed to compute history"}), 500
+    finally:
+        db.session.close()
+
+@app.route('/api/history/sparklines')
+@login_required
+def get_history_sparklines():
+    """Closing prices per 5 minutes over the last day, per ticker, for the dashboard cards"""
+    try:
+        return jsonify(analytics.sparklines(history_tickers(), SPARKLINE_WINDOW, SPARKLINE_BUCKET))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error computing sparklines: {e}")
+        return jsonify({"error": "Failed to compute sparklines"}), 500
+    finally:
+        db.session.close()
+
+def export_response(chunks, fmt, name):
+    """Stream export chunks as a download, with chunked transfer encoding"""
+    response = app.response_class(stream_with_context(chunks), mimetype=export.MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=stonx-{name}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.{fmt}")
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    # Keep proxies from buffering the whole export before passing it on
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/api/export/history')
+@login_required
+def export_history():
+    """
+    Download recorded ticks as CSV or NDJSON, streamed straight from the day segments.
+    
+    Query parameters: tickers (default the watchlist), format (csv or ndjson, default csv),
+    start (epoch seconds, ISO date or datetime, or a duration before now like 7d; default 1d)
+    and end (same forms, exclusive; default now).
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unknown format {fmt!r}"}), 400
+    try:
+        now = time.time()
+        start = export.parse_time(request.args.get('start', '1d'), now)
+        end = export.parse_time(request.args['end'], now) if request.args.get('end') else now
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    store = history.get_store()
+    if store is None:
+        return jsonify({"error": "Tick history is not being recorded (STONX_HISTORY=0)"}), 404
+    
+    try:
+        tickers = history_tickers()
+    finally:
+        db.session.close()
+    event(logger, logging.INFO, 'export', user=current_user.id, kind='history', format=fmt,
+          tickers=len(tickers), start=round(start), end=round(end))
+    return export_response(export.export_history(store, tickers, start, end, fmt), fmt, 'history')
+
+@app.route('/api/export/quotes')
+@login_required
+def export_quotes():
+    """
+    Download the current quotes of the watchlist (or ?tickers=) as CSV or NDJSON.
+    
+    Fetches go through the scraper like any other request, cache and scrape quota included.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"Unknown format {fmt!r}"}), 400
+    
+    try:
+        tickers = history_tickers()
+    finally:
+        db.session.close()
+    try:
+        quotes, _ = default_scraper.get_multiple_quotes(tickers, client=scrape_client())
+    except Exception as e:
+        logger.error(f"Error fetching quotes for export: {e}")
+        return jsonify({"error": "Failed to fetch quotes"}), 500
+    event(logger, logging.INFO, 'export', user=current_user.id, kind='quotes', format=fmt, tickers=len(tickers))
+    rows = (quotes[ticker] for ticker in tickers if ticker in quotes)
+    return export_response(export.export_quotes(rows, fmt), fmt, 'quotes')
+
 @app.route('/api/session/keep-alive')
 @login_required
 def keep_session_alive():
@@ -481,9 +1232,8 @@ def keep_session_alive():
 @login_required
 def clear_cache():
     try:
-        with scraper_lock:
-            default_scraper.clear_cache()
-            stats = default_scraper.get_stats()
+        default_scraper.clear_cache()
+        stats = default_scraper.get_stats()
         
         return jsonify({
             "status": "success", 
@@ -504,9 +1254,8 @@ def settings():
 def force_refresh():
     try:
         # Reset the scraper's cache and stats
-        with scraper_lock:
-            default_scraper.clear_cache()
-            default_scraper.reset_stats()
+        default_scraper.clear_cache()
+        default_scraper.reset_stats()
         
         return jsonify({"success": True})
     except Exception as e:
@@ -538,8 +1287,8 @@ def test_stock_data():
         
         try:
             # Get data for all tickers using the threaded scraper
-            with scraper_lock:
-                data = default_scraper.get_multiple_stock_data(tickers, fast_mode=initial_load)
+            data = default_scraper.get_multiple_stock_data(tickers, fast_mode=initial_load,
+                                                           client=scrape_client())
             
             end_time = time.time()
             total_time = end_time - start_time
@@ -562,6 +1311,118 @@ def test_stock_data():
         logger.error(f"Test endpoint error: {e}")
         return jsonify({"error": f"Test endpoint error: {str(e)}"}), 500
 
+@app.route('/admin/shards')
+@admin_required
+def admin_shards():
+    """Scraper daemons on the hash ring and how many of the users' distinct tickers each owns"""
+    if not isinstance(default_scraper, ShardedScraperClient):
+        return jsonify({'sharded': False})
+    try:
+        tickers = [row[0] for row in db.session.query(UserTicker.ticker).distinct()]
+    finally:
+        db.session.close()
+    assignment = default_scraper.assign(tickers)
+    return jsonify({
+        'sharded': True,
+        'live': default_scraper.live_nodes(),
+        'down': sorted(set(default_scraper.paths) - set(default_scraper.live_nodes())),
+        'distinct_tickers': len(tickers),
+        'tickers_per_shard': {path: len(owned) for path, owned in assignment.items()},
+    })
+
+@app.route('/debug/traces')
+@admin_required
+def debug_traces():
+    """Slowest recent scrape waterfalls kept by tracing.py, as JSON or ?format=text"""
+    traces = tracing.slow_traces()
+    if request.args.get('format') == 'text':
+        body = '\n\n'.join(trace.format_waterfall() for trace in traces) or 'No slow traces recorded'
+        if not tracing.enabled:
+            body = 'Tracing is off (set STONX_TRACING=1)\n\n' + body
+        return app.response_class(body + '\n', mimetype='text/plain')
+    return jsonify({**tracing.status(), 'traces': [trace.to_dict() for trace in traces]})
+
+@app.route('/admin/profiler')
+@admin_required
+def profiler_status():
+    """Status of the running or most recent profile"""
+    session = profiler.current()
+    return jsonify({'active': profiler.active, 'profile': session.status() if session else None})
+
+@app.route('/admin/profiler/start', methods=['POST'])
+@admin_required
+def profiler_start():
+    """
+    Start sampling stacks of all threads.
+    
+    Form or query parameters: duration (seconds, default 30), interval_ms
+    (default 10) and path (only sample requests whose path starts with it).
+    """
+    try:
+        duration = float(request.values.get('duration', 30))
+        interval = float(request.values.get('interval_ms', 10)) / 1000
+    except ValueError:
+        return jsonify({"success": False, "error": "duration and interval_ms must be numbers"}), 400
+    path = request.values.get('path') or None
+    
+    try:
+        session = profiler.start(duration, interval, path)
+    except RuntimeError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    
+    logger.info(f"Profiler started by {current_user.username} for {session.duration:.0f}s"
+                f"{f' on {path}' if path else ''}")
+    return jsonify({"success": True, "profile": session.status()})
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+@admin_required
+def profiler_stop():
+    session = profiler.stop()
+    if session is None:
+        return jsonify({"success": False, "error": "No profile has been recorded"}), 404
+    return jsonify({"success": True, "profile": session.status()})
+
+@app.route('/admin/profiler/download')
+@admin_required
+def profiler_download():
+    """Download the profile as collapsed stacks (?format=collapsed, default) or an SVG flame graph (?format=svg)"""
+    session = profiler.current()
+    if session is None:
+        return jsonify({"error": "No profile has been recorded"}), 404
+    
+    lines = session.collapsed()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(session.started_at))
+    if request.args.get('format') == 'svg':
+        title = f"247stonx {session.samples} samples{f' on {session.path_prefix}' if session.path_prefix else ''}"
+        response = app.response_class(profiler.flamegraph_svg(lines, title), mimetype='image/svg+xml')
+        filename = f"profile-{stamp}.svg"
+    else:
+        response = app.response_class('\n'.join(lines) + '\n', mimetype='text/plain')
+        filename = f"profile-{stamp}.collapsed"
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+# Addresses allowed to read /metrics without a token
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Metrics in the Prometheus text format.
+    
+    Requires a bearer token if METRICS_TOKEN is set. Without one, only loopback
+    clients are served, unless STONX_METRICS_PUBLIC=1 opens the endpoint to anyone.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            abort(401)
+    elif os.environ.get('STONX_METRICS_PUBLIC') != '1' and request.remote_addr not in LOOPBACK_ADDRESSES:
+        abort(403)
+    response = app.response_class(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    return response
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
@@ -578,8 +1439,8 @@ if __name__ == '__main__':
     args = parser.parse_args()
     
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        # Create missing tables and columns
+        upgrade_database()
     
     # Use the port from command line arguments
     app.run(debug=True, host='0.0.0.0', port=args.port) 
\ No newline at end of file
@@ -0,0 +1,376 @@
+"""
+Batch scraping of long ticker lists, for nightly backfills outside the web app.
+
+Tickers are read from a file (one per line or comma-separated, '#' starts a
+comment, '-' reads stdin) and scraped in chunks through a ThreadedScraper:
+the same engine, pacing and tick history recording as the app, with its own
+workers and no per-client quota. --rate caps the fetches per second on top of
+the scraper's own pacing: every fetch waits for a token, so the workers never
+burst above it.
+
+Results are written after every chunk, as NDJSON lines (the fields of
+export.py's quote export) or as rows of a SQLite `quotes` table, and a
+checkpoint records how far the run got:
+
+- NDJSON: a `<output>.checkpoint` JSON file with the tickers done and the
+  output size at that point. A resumed run truncates whatever a crash left
+  after it, so no result is written twice or half.
+- SQLite: a `batch_checkpoint` table, updated in the same transaction as the
+  chunk's rows.
+
+Running the same command again resumes after the last checkpoint; --restart
+starts over. A checkpoint made for a different ticker list is refused.
+
+    python batch.py tickers.txt -o nightly.ndjson --workers 8 --rate 5
+    python batch.py tickers.txt -o nightly.db --chunk-size 200 --history
+
+A progress line with throughput and ETA goes to stderr every second.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import export
+from quote import Quote
+
+logger = logging.getLogger('247stonx.batch')
+
+# Queue of the batch run on the scraper's fair scheduler
+CLIENT = 'batch'
+
+
+def read_tickers(path: str) -> List[str]:
+    """Tickers of a ticker file in order, upper-cased, without duplicates"""
+    source = sys.stdin if path == '-' else open(path)
+    try:
+        tickers = []
+        for line in source:
+            line = line.split('#', 1)[0]
+            tickers.extend(t.strip().upper() for t in line.split(',') if t.strip())
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return list(dict.fromkeys(tickers))
+
+
+def fingerprint(tickers: List[str]) -> str:
+    """Identifies a ticker list, so a checkpoint is only resumed for the list it was made for"""
+    return hashlib.sha1('\n'.join(tickers).encode('utf-8')).hexdigest()
+
+
+class NdjsonSink:
+    """
+    Quotes as NDJSON lines, with a checkpoint file next to the output.
+
+    Args:
+        path (str): Output file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self._file = None
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open(self, checkpoint: Optional[Dict[str, Any]]):
+        """
+        Open for appending after the checkpoint, or empty without one.
+
+        Raises:
+            ValueError: If the output is missing or shorter than the checkpoint says,
+                so resuming would leave a gap in it.
+        """
+        if checkpoint:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = None
+            if size is None or size < checkpoint['output_bytes']:
+                found = 'missing' if size is None else f"{size} bytes"
+                raise ValueError(f"{self.path} is {found} but its checkpoint covers {checkpoint['output_bytes']} "
+                                 f"bytes; use --restart to start over")
+        self._file = open(self.path, 'a+b' if checkpoint else 'wb')
+        if checkpoint:
+            # Drop what was written after the last checkpoint
+            self._file.truncate(checkpoint['output_bytes'])
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, quotes: Iterable[Quote]):
+        for chunk in export.encode(export.quote_rows(quotes), 'ndjson', export.QUOTE_FIELDS):
+            self._file.write(chunk.encode('utf-8'))
+
+    def commit(self, checkpoint: Dict[str, Any]):
+        """Make the written quotes durable, then move the checkpoint past them"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        checkpoint['output_bytes'] = self._file.tell()
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+# SQLite column types of the quote fields that are not numbers
+_COLUMN_TYPES = {'ticker': 'TEXT', 'session': 'TEXT', 'time': 'TEXT', 'error': 'TEXT', 'stale': 'INTEGER'}
+
+
+class SqliteSink:
+    """
+    Quotes as rows of a `quotes` table keyed by ticker, with the checkpoint in the same database.
+
+    Args:
+        path (str): Database file, created if missing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        columns = ', '.join(f"{name} {_COLUMN_TYPES.get(name, 'REAL')}" for name in export.QUOTE_FIELDS)
+        with self._db:
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS quotes ({columns}, PRIMARY KEY (ticker))")
+            self._db.execute("CREATE TABLE IF NOT EXISTS batch_checkpoint (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                             "state TEXT NOT NULL)")
+        self._insert = (f"INSERT OR REPLACE INTO quotes ({', '.join(export.QUOTE_FIELDS)}) "
+                        f"VALUES ({', '.join('?' * len(export.QUOTE_FIELDS))})")
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT state FROM batch_checkpoint WHERE id = 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def open(self, checkpoint: Optional[Dict[str, Any]]):
+        if not checkpoint:
+            with self._db:
+                self._db.execute("DELETE FROM quotes")
+                self._db.execute("DELETE FROM batch_checkpoint")
+
+    def write(self, quotes: Iterable[Quote]):
+        # Rows wait in the open transaction until commit()
+        self._db.executemany(self._insert, ([row[name] for name in export.QUOTE_FIELDS]
+                                            for row in export.quote_rows(quotes)))
+
+    def commit(self, checkpoint: Dict[str, Any]):
+        self._db.execute("INSERT OR REPLACE INTO batch_checkpoint (id, state) VALUES (1, ?)",
+                         (json.dumps(checkpoint),))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def open_sink(path: str, fmt: Optional[str] = None):
+    """A sink for the output path; the format defaults from its extension (.db, .sqlite, .sqlite3)"""
+    if fmt is None:
+        fmt = 'sqlite' if os.path.splitext(path)[1].lower() in ('.db', '.sqlite', '.sqlite3') else 'ndjson'
+    return SqliteSink(path) if fmt == 'sqlite' else NdjsonSink(path)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """
+    Prints done/total, throughput and ETA to stderr about once a second.
+
+    Progress inside the running chunk is read from the scraper's request counter,
+    so the line moves between checkpoints too.
+    """
+
+    def __init__(self, scraper, total: int, done: int, stream=sys.stderr):
+        self.scraper = scraper
+        self.total = total
+        self.resumed = done
+        self.done = done
+        self.succeeded = 0
+        self.chunk_size = 0
+        self.stream = stream
+        self.started = time.monotonic()
+        self._chunk_requests = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='batch-progress', daemon=True)
+        # Rewrite one line on a terminal; one line per report otherwise
+        self._end = '\r' if stream.isatty() else '\n'
+
+    def start_chunk(self, size: int):
+        self.chunk_size = size
+        self._chunk_requests = self.scraper.get_stats()['requests_made']
+
+    def end_chunk(self, size: int, succeeded: int):
+        self.done += size
+        self.succeeded += succeeded
+        self.chunk_size = 0
+
+    def line(self) -> str:
+        in_chunk = 0
+        if self.chunk_size:
+            in_chunk = min(self.chunk_size, self.scraper.get_stats()['requests_made'] - self._chunk_requests)
+        done = self.done + in_chunk
+        elapsed = time.monotonic() - self.started
+        rate = (done - self.resumed) / elapsed if elapsed > 0 else 0.0
+        eta = format_duration((self.total - done) / rate) if rate > 0 else '?'
+        finished = self.done - self.resumed
+        ok = f"{self.succeeded / finished * 100:.0f}% ok" if finished else '-'
+        return (f"{done}/{self.total} ({done / max(self.total, 1) * 100:.1f}%)  {rate:.2f} tickers/s  "
+                f"{ok}  elapsed {format_duration(elapsed)}  ETA {eta}")
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            self.stream.write(self.line() + self._end)
+            self.stream.flush()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stream.write(self.line() + '\n')
+        self.stream.flush()
+
+
+def run(scraper, tickers: List[str], sink, chunk_size: int = 100, fast_mode: bool = False,
+        restart: bool = False, progress: Optional[Progress] = None) -> Dict[str, Any]:
+    """
+    Scrape tickers chunk by chunk into a sink, resuming from its checkpoint.
+
+    Args:
+        scraper: The ThreadedScraper (or daemon client) to scrape with. Its rate_limit
+            bounds the fetches per second.
+        tickers (List[str]): Tickers in order.
+        sink: NdjsonSink or SqliteSink.
+        chunk_size (int, optional): Tickers per chunk, and per checkpoint.
+        fast_mode (bool, optional): Use the scraper's short fast-mode delays.
+        restart (bool, optional): Ignore an existing checkpoint.
+        progress (Progress, optional): Told about each chunk.
+
+    Returns:
+        Dict[str, Any]: The final checkpoint.
+
+    Raises:
+        ValueError: If the sink's checkpoint belongs to another ticker list, or its
+            output no longer holds what the checkpoint says.
+    """
+    checkpoint = None if restart else sink.load_checkpoint()
+    if checkpoint and checkpoint['fingerprint'] != fingerprint(tickers):
+        raise ValueError("The checkpoint was made for a different ticker list; use --restart to start over")
+    if checkpoint is None:
+        checkpoint = {'fingerprint': fingerprint(tickers), 'total': len(tickers), 'done': 0,
+                      'succeeded': 0, 'failed': 0, 'elapsed': 0.0}
+    sink.open(checkpoint if checkpoint['done'] else None)
+    if checkpoint['done']:
+        logger.info("Resuming after %d of %d tickers", checkpoint['done'], len(tickers))
+
+    started = time.monotonic()
+    elapsed_before = checkpoint['elapsed']
+    for position in range(checkpoint['done'], len(tickers), chunk_size):
+        chunk = tickers[position:position + chunk_size]
+        if progress is not None:
+            progress.start_chunk(len(chunk))
+
+        quotes, _ = scraper.get_multiple_quotes(chunk, fast_mode, CLIENT)
+        results = [quotes.get(ticker) or Quote(ticker, error='No result') for ticker in chunk]
+        succeeded = sum(1 for quote in results if quote.price is not None and not quote.error)
+        sink.write(results)
+        checkpoint.update({
+            'done': position + len(chunk),
+            'succeeded': checkpoint['succeeded'] + succeeded,
+            'failed': checkpoint['failed'] + len(chunk) - succeeded,
+            'elapsed': elapsed_before + time.monotonic() - started,
+        })
+        sink.commit(checkpoint)
+        # Results are on disk; the cache would only grow
+        scraper.clear_cache()
+        if progress is not None:
+            progress.end_chunk(len(chunk), succeeded)
+    return checkpoint
+
+
+def main():
+    from logs import configure_logging
+    import history
+    import parse_pool
+    from threaded_scraper import ThreadedScraper
+
+    parser = argparse.ArgumentParser(description='Scrape a ticker file into NDJSON or SQLite, resumably')
+    parser.add_argument('tickers', help="Ticker file, one per line or comma-separated ('-' for stdin)")
+    parser.add_argument('-o', '--output', required=True, help='Output file (.db/.sqlite for SQLite, else NDJSON)')
+    parser.add_argument('--format', choices=('ndjson', 'sqlite'), help='Output format (default from the extension)')
+    parser.add_argument('--workers', type=int, default=6, help='Concurrent fetches (default %(default)s)')
+    parser.add_argument('--rate', type=float, default=0.0, help='Most fetches per second (default no limit)')
+    parser.add_argument('--chunk-size', type=int, default=100, help='Tickers per checkpoint (default %(default)s)')
+    parser.add_argument('--fast', action='store_true', help="Use the scraper's short fast-mode delays")
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+    parser.add_argument('--history', action='store_true',
+                        help='Also record the quotes in the tick history (STONX_HISTORY_DIR or instance/history)')
+    parser.add_argument('--log-level', default='WARNING', help='Log level (default %(default)s)')
+    args = parser.parse_args()
+    if args.chunk_size < 1 or args.workers < 1:
+        parser.error('--chunk-size and --workers must be positive')
+    if args.rate < 0:
+        parser.error('--rate must not be negative')
+
+    configure_logging(args.log_level)
+    parse_pool.configure_from_env()
+    if args.history:
+        history.configure_from_env(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'history'))
+
+    tickers = read_tickers(args.tickers)
+    if not tickers:
+        parser.error(f"No tickers in {args.tickers}")
+    sink = open_sink(args.output, args.format)
+    scraper = ThreadedScraper(max_workers=args.workers, scrape_quota=0, rate_limit=args.rate)
+
+    checkpoint = None if args.restart else sink.load_checkpoint()
+    if checkpoint and checkpoint['done'] >= len(tickers) and checkpoint['fingerprint'] == fingerprint(tickers):
+        print(f"{args.output} is already complete; use --restart to scrape again", file=sys.stderr)
+        sink.close()
+        return
+    progress = Progress(scraper, len(tickers), checkpoint['done'] if checkpoint else 0)
+    progress.start()
+    status = 0
+    try:
+        checkpoint = run(scraper, tickers, sink, args.chunk_size, args.fast, args.restart, progress)
+    except ValueError as e:
+        print(f"batch.py: error: {e}", file=sys.stderr)
+        status = 2
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; run the same command again to resume after {progress.done} tickers",
+              file=sys.stderr)
+        status = 130
+    finally:
+        progress.stop()
+        sink.close()
+        scraper.shutdown()
+    if status == 0:
+        print(f"Done: {checkpoint['succeeded']} ok, {checkpoint['failed']} failed in "
+              f"{format_duration(checkpoint['elapsed'])} -> {args.output}", file=sys.stderr)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
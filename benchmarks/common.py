@@ -0,0 +1,117 @@
+"""
+Helpers shared by the benchmark scripts: timing summaries, result files and
+pointing the scraper at a local stub server.
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# Make the app modules (scraper, threaded_scraper, ...) importable from benchmark scripts
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, math.ceil(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    """
+    Summarize timing samples (seconds) as count/mean/p50/p95/p99/max.
+
+    Args:
+        samples (List[float]): Durations in seconds.
+        scale (float, optional): Multiplier for the reported values, milliseconds by default.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) * scale,
+        'p50': percentile(ordered, 50) * scale,
+        'p95': percentile(ordered, 95) * scale,
+        'p99': percentile(ordered, 99) * scale,
+        'max': ordered[-1] * scale,
+    }
+
+
+def configure_scraper(base_url: str, human_delay: float = 0.0):
+    """
+    Point scraper.py at a stub server and set its human-like delay.
+
+    Args:
+        base_url (str): Base URL of the stub server (used for pages and API).
+        human_delay (float, optional): Upper bound of the random pre-scrape delay.
+    """
+    import scraper
+    scraper.WEB_BASE_URL = base_url
+    scraper.API_BASE_URL = base_url
+    scraper.HUMAN_DELAY_RANGE = (0.0, human_delay)
+
+
+def git_revision() -> Optional[str]:
+    """Current git commit of the repository, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_metadata() -> Dict[str, Any]:
+    """Describe the machine and code revision a run was made on"""
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(name: str, results: Dict[str, Any], output: Optional[str] = None) -> str:
+    """
+    Save results as JSON.
+
+    Args:
+        name (str): Benchmark name, used for the default file name.
+        results (dict): Results to save.
+        output (str, optional): Output path. Defaults to benchmarks/results/<name>-<timestamp>.json.
+
+    Returns:
+        str: The path written.
+    """
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    return output
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """Load a results file written by save_results()"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_delta(new: float, old: float) -> str:
+    """Format the change from old to new as a signed percentage"""
+    if not old:
+        return 'n/a'
+    return f"{(new - old) / old * 100:+.1f}%"
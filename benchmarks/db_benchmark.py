@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write benchmark of the SQLite database layer.
+
+Builds a scratch database with the app's schema, many users and their
+watchlists and alerts, then runs reader and writer threads against it for a
+fixed time, once per configuration:
+
+- legacy: the network pool settings the app used before (20 + 20 connections,
+  pre-ping, recycle) with SQLite's default rollback journal and
+  synchronous=FULL, and without the (user_id, position) index.
+- tuned: database.py's pool, WAL and pragmas, with every index of the schema.
+
+Readers do what a dashboard or quote request does: load the user, their
+tickers in order and their undelivered alerts. Writers add and remove
+tickers, reorder watchlists and claim alerts, committing each change. Reports
+operations per second, latency percentiles and "database is locked" errors.
+
+Usage:
+    python benchmarks/db_benchmark.py
+    python benchmarks/db_benchmark.py --readers 16 --writers 4 --duration 10 --users 2000
+    python benchmarks/db_benchmark.py --compare benchmarks/results/db-<timestamp>.json
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from common import format_delta, load_results, run_metadata, save_results, summarize
+
+SCRATCH = tempfile.mkdtemp(prefix='stonx-db-')
+
+# app.py opens its database at import; keep it and everything else it starts out of the way
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(SCRATCH, 'app.db')}"
+os.environ['STONX_HISTORY'] = '0'
+os.environ['STONX_SYMBOLS_FILE'] = os.path.join(SCRATCH, 'symbols.txt')
+
+import sqlalchemy as sa
+
+import app
+import database
+
+CONFIGURATIONS = ('legacy', 'tuned')
+
+LEGACY_INDEXES = {'ix_user_ticker_user_position'}
+
+
+def make_engine(name, path):
+    """An engine on the database file with the settings of a configuration"""
+    uri = f"sqlite:///{path}"
+    if name == 'legacy':
+        engine = sa.create_engine(uri, **database.NETWORK_ENGINE_OPTIONS)
+        # Back to SQLite's defaults, as a database created before WAL was enabled has them
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode=DELETE')
+        return engine
+    engine = sa.create_engine(uri, **database.engine_options(uri))
+    database.tune_engine(engine)
+    return engine
+
+
+def populate(engine, name, args):
+    """Create the schema and the users, watchlists and alerts"""
+    metadata = app.db.metadata
+    metadata.create_all(engine)
+    if name == 'legacy':
+        with engine.begin() as connection:
+            for index in LEGACY_INDEXES:
+                connection.exec_driver_sql(f'DROP INDEX IF EXISTS {index}')
+
+    users, tickers, alerts = (metadata.tables[table] for table in ('user', 'user_ticker', 'price_alert'))
+    rng = random.Random(args.seed)
+    with engine.begin() as connection:
+        connection.execute(users.insert(), [
+            {'id': user_id, 'username': f"user{user_id}", 'email': f"user{user_id}@example.com", 'password': 'x'}
+            for user_id in range(1, args.users + 1)])
+        connection.execute(tickers.insert(), [
+            {'user_id': user_id, 'ticker': f"T{index:04d}", 'position': position}
+            for user_id in range(1, args.users + 1)
+            for position, index in enumerate(rng.sample(range(args.symbols), args.tickers), 1)])
+        connection.execute(alerts.insert(), [
+            {'user_id': user_id, 'ticker': 'T0000', 'kind': 'above', 'threshold': 100.0 + index,
+             'created_at': app.datetime.datetime.utcnow()}
+            for user_id in range(1, args.users + 1) for index in range(args.alerts)])
+
+
+class Worker(threading.Thread):
+    """Runs one kind of operation in a loop until the deadline, timing each"""
+
+    def __init__(self, operation, engine, args, seed, deadline):
+        super().__init__(daemon=True)
+        self.operation = operation
+        self.engine = engine
+        self.args = args
+        self.rng = random.Random(seed)
+        self.deadline = deadline
+        self.samples = []
+        self.locked = 0
+        self.errors = 0
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            start = time.perf_counter()
+            try:
+                self.operation(self.engine, self.rng, self.args)
+            except sa.exc.OperationalError as e:
+                if 'locked' in str(e):
+                    self.locked += 1
+                else:
+                    self.errors += 1
+                continue
+            self.samples.append(time.perf_counter() - start)
+
+
+def read_dashboard(engine, rng, args):
+    """The queries of a dashboard request"""
+    metadata = app.db.metadata
+    users, tickers, alerts = (metadata.tables[table] for table in ('user', 'user_ticker', 'price_alert'))
+    user_id = rng.randint(1, args.users)
+    with engine.connect() as connection:
+        connection.execute(sa.select(users).where(users.c.id == user_id)).first()
+        connection.execute(sa.select(tickers.c.ticker).where(tickers.c.user_id == user_id)
+                           .order_by(tickers.c.position, tickers.c.id)).all()
+        connection.execute(sa.select(alerts.c.id).where(alerts.c.user_id == user_id,
+                                                        alerts.c.delivered_at.is_(None),
+                                                        alerts.c.triggered_at.isnot(None))).all()
+
+
+def write_watchlist(engine, rng, args):
+    """One watchlist change or alert claim, committed"""
+    metadata = app.db.metadata
+    tickers, alerts = metadata.tables['user_ticker'], metadata.tables['price_alert']
+    user_id = rng.randint(1, args.users)
+    action = rng.random()
+    with engine.begin() as connection:
+        if action < 0.4:
+            last = connection.execute(sa.select(sa.func.max(tickers.c.position))
+                                      .where(tickers.c.user_id == user_id)).scalar() or 0
+            connection.execute(sa.insert(tickers).prefix_with('OR IGNORE'), {
+                'user_id': user_id, 'ticker': f"T{rng.randrange(args.symbols):04d}", 'position': last + 1})
+        elif action < 0.7:
+            connection.execute(tickers.delete().where(
+                tickers.c.user_id == user_id, tickers.c.ticker == f"T{rng.randrange(args.symbols):04d}"))
+        elif action < 0.9:
+            ids = connection.execute(sa.select(tickers.c.id).where(tickers.c.user_id == user_id)).scalars().all()
+            rng.shuffle(ids)
+            connection.execute(tickers.update().where(tickers.c.id == sa.bindparam('row_id')),
+                               [{'row_id': row_id, 'position': position} for position, row_id in enumerate(ids, 1)])
+        else:
+            connection.execute(alerts.update().where(alerts.c.user_id == user_id, alerts.c.triggered_at.is_(None))
+                               .values(triggered_at=app.datetime.datetime.utcnow(), trigger_price=1.0))
+
+
+def bench(name, args):
+    path = os.path.join(SCRATCH, f"{name}.db")
+    engine = make_engine(name, path)
+    try:
+        populate(engine, name, args)
+        deadline = time.perf_counter() + args.duration
+        readers = [Worker(read_dashboard, engine, args, args.seed + index, deadline)
+                   for index in range(args.readers)]
+        writers = [Worker(write_watchlist, engine, args, args.seed + 1000 + index, deadline)
+                   for index in range(args.writers)]
+        start = time.perf_counter()
+        for worker in readers + writers:
+            worker.start()
+        for worker in readers + writers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        with engine.connect() as connection:
+            pragmas = {pragma: connection.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+                       for pragma in ('journal_mode', 'synchronous')}
+    finally:
+        engine.dispose()
+
+    read_samples = [sample for worker in readers for sample in worker.samples]
+    write_samples = [sample for worker in writers for sample in worker.samples]
+    return {
+        'configuration': name,
+        'pragmas': pragmas,
+        'reads_per_second': len(read_samples) / elapsed,
+        'writes_per_second': len(write_samples) / elapsed,
+        'read_latency': summarize(read_samples),
+        'write_latency': summarize(write_samples),
+        'locked_errors': sum(worker.locked for worker in readers + writers),
+        'other_errors': sum(worker.errors for worker in readers + writers),
+        'file_bytes': sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix)),
+    }
+
+
+def print_report(results):
+    print(f"\n{'Configuration':<14} {'reads/s':>9} {'read p50':>9} {'read p99':>9} "
+          f"{'writes/s':>9} {'write p50':>10} {'write p99':>10} {'locked':>7}")
+    for row in results['runs']:
+        print(f"{row['configuration']:<14} {row['reads_per_second']:>9.0f} "
+              f"{row['read_latency'].get('p50', 0):>8.2f}ms {row['read_latency'].get('p99', 0):>8.2f}ms "
+              f"{row['writes_per_second']:>9.0f} {row['write_latency'].get('p50', 0):>8.2f}ms "
+              f"{row['write_latency'].get('p99', 0):>8.2f}ms {row['locked_errors']:>7}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nComparison with {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')})")
+    old_rows = {row['configuration']: row for row in baseline.get('runs', [])}
+    for row in results['runs']:
+        old = old_rows.get(row['configuration'])
+        if old:
+            print(f"{row['configuration']}: {row['reads_per_second']:.0f} reads/s "
+                  f"({format_delta(row['reads_per_second'], old['reads_per_second'])}), "
+                  f"{row['writes_per_second']:.0f} writes/s "
+                  f"({format_delta(row['writes_per_second'], old['writes_per_second'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent read/write benchmark of the SQLite database layer')
+    parser.add_argument('--configurations', default=','.join(CONFIGURATIONS),
+                        help='Comma-separated configurations to run (default %(default)s)')
+    parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+    parser.add_argument('--writers', type=int, default=2, help='Writer threads')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per configuration')
+    parser.add_argument('--users', type=int, default=1000, help='Users in the database')
+    parser.add_argument('--tickers', type=int, default=20, help='Tickers per watchlist')
+    parser.add_argument('--symbols', type=int, default=2000, help='Distinct ticker symbols')
+    parser.add_argument('--alerts', type=int, default=2, help='Alerts per user')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.configurations.split(',') if name.strip()]
+    for name in names:
+        if name not in CONFIGURATIONS:
+            parser.error(f"Unknown configuration {name!r}; use {', '.join(CONFIGURATIONS)}")
+
+    # Nothing in this process scrapes or evaluates alerts
+    app.alert_engine.stop()
+    app.default_scraper.shutdown()
+
+    print(f"{args.users} users x {args.tickers} tickers; {args.readers} readers, {args.writers} writers, "
+          f"{args.duration:g}s per configuration")
+    try:
+        runs = []
+        for name in names:
+            runs.append(bench(name, args))
+            print(f"{name}: {runs[-1]['reads_per_second']:.0f} reads/s, {runs[-1]['writes_per_second']:.0f} writes/s")
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    results = {
+        'benchmark': 'db',
+        'meta': run_metadata(),
+        'config': vars(args),
+        'runs': runs,
+    }
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, load_results(args.compare))
+    print(f"\nResults saved to {save_results('db', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
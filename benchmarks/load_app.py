@@ -0,0 +1,42 @@
+"""
+WSGI entry point used by load_test.py.
+
+Exposes the Flask app with its scraper pointed at a stub server. Configured
+through the environment, since gunicorn workers cannot take arguments:
+
+- STONX_WEB_BASE_URL / STONX_API_BASE_URL: stub server URL (read by scraper.py)
+- DATABASE_URL: scratch database (read by app.py)
+- LOADTEST_HUMAN_DELAY: upper bound of the scraper's random pre-scrape delay
+
+Usage:
+    gunicorn --chdir benchmarks -w 2 --threads 8 load_app:app
+    python benchmarks/load_app.py --port 5001 --processes 1
+"""
+
+import argparse
+import os
+
+from common import configure_scraper
+
+import scraper
+from app import app
+
+configure_scraper(os.environ.get('STONX_WEB_BASE_URL', scraper.WEB_BASE_URL),
+                  float(os.environ.get('LOADTEST_HUMAN_DELAY', '0')))
+
+
+def main():
+    from werkzeug.serving import run_simple
+
+    parser = argparse.ArgumentParser(description='Serve the app for a load test with the Werkzeug server')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=5001, help='Port to bind')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Forked worker processes; 1 serves every request on its own thread')
+    args = parser.parse_args()
+
+    run_simple(args.host, args.port, app, threaded=args.processes == 1, processes=args.processes)
+
+
+if __name__ == '__main__':
+    main()
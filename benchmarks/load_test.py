@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Multi-user load test for the Flask app.
+
+Creates N users with M-ticker watchlists in a scratch SQLite database, starts
+the app (Werkzeug or gunicorn) with its scraper pointed at the fixture stub
+server, and has every user replay the polling pattern of static/js/dashboard.js:
+
+- log in and load /dashboard (which embeds the cached quotes and queues the
+  rest in the background),
+- ping /api/session/keep-alive and, if the page listed tickers still being
+  fetched, fetch /api/bulk_stock_data?initial_load=true,
+- then every refresh interval ping keep-alive and fetch /api/bulk_stock_data,
+- ping keep-alive on its own timer as well,
+- occasionally fetch a single ticker from /api/stock_data, as the dashboard
+  does when it retries a card.
+
+With --heavy-users, some users are noisy neighbours instead: every few
+seconds they ask /api/bulk_stock_data?tickers= for a couple of hundred
+tickers drawn from a universe of their own, so nearly every fetch misses the
+cache. Their requests are reported under "heavy:" endpoint names; comparing
+the light users' latencies with and without them shows how well scrape
+capacity is shared (see fair_share.py).
+
+Reports p50/p95/p99 latency, throughput and error rate per endpoint.
+
+Usage:
+    python benchmarks/load_test.py --users 50 --tickers 10 --duration 120
+    python benchmarks/load_test.py --server gunicorn --workers 2 --threads 8 --refresh-interval 10
+    python benchmarks/load_test.py --compare benchmarks/results/load-20250426-101500.json
+    python benchmarks/load_test.py --users 10 --heavy-users 2 --heavy-tickers 200 --refresh-interval 5
+"""
+
+import argparse
+import json
+import os
+import re
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from common import BENCHMARKS_DIR, format_delta, load_results, run_metadata, save_results, summarize
+from stub_server import SCENARIOS, StubServer, ticker_for
+
+PASSWORD = 'loadtest'
+
+# Mirrors the timers in static/js/dashboard.js
+DEFAULT_REFRESH_INTERVAL = 30.0
+DEFAULT_KEEPALIVE_INTERVAL = 120.0
+STOCK_DATA_TIMEOUT = 12.0
+REQUEST_TIMEOUT = 60.0
+
+# The quotes templates/dashboard.html embeds for dashboard.js
+INITIAL_QUOTES = re.compile(r'<script type="application/json" id="initialQuotes">(.*?)</script>', re.S)
+
+
+class LatencyRecorder:
+    """Collects request latencies, status codes and errors per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, elapsed, status, ok):
+        with self._lock:
+            self.samples[endpoint].append(elapsed)
+            self.statuses[endpoint][str(status)] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, duration):
+        report = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            summary = summarize(samples)
+            summary['throughput'] = len(samples) / duration if duration else 0
+            summary['errors'] = self.errors[endpoint]
+            summary['error_rate'] = self.errors[endpoint] / len(samples)
+            summary['statuses'] = dict(self.statuses[endpoint])
+            report[endpoint] = summary
+        return report
+
+
+def seed_database(database_url, users, tickers_per_user, universe, seed, prefix='loadtest'):
+    """
+    Create the scratch database with load test users and their watchlists.
+
+    Usernames are `prefix` followed by the user's number.
+
+    Returns:
+        list: (username, tickers) for each user.
+    """
+    os.environ['DATABASE_URL'] = database_url
+    from werkzeug.security import generate_password_hash
+    from app import app, db, User, UserTicker
+
+    rng = random.Random(seed)
+    # Hashing is deliberately slow; every user shares one password
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+    accounts = []
+    with app.app_context():
+        db.create_all()
+        for i in range(users):
+            username = f"{prefix}{i}"
+            user = User(username=username, email=f"{username}@example.com", password=password_hash)
+            db.session.add(user)
+            db.session.flush()
+            tickers = rng.sample(universe, min(tickers_per_user, len(universe)))
+            db.session.add_all([UserTicker(user_id=user.id, ticker=ticker) for ticker in tickers])
+            accounts.append((username, tickers))
+        db.session.commit()
+    return accounts
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, port, env, log_file):
+    """Start the app server in a child process"""
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--chdir', BENCHMARKS_DIR,
+                   '-w', str(args.workers), '--threads', str(args.threads),
+                   '-b', f'127.0.0.1:{port}', '--timeout', '120', 'load_app:app']
+    else:
+        command = [sys.executable, os.path.join(BENCHMARKS_DIR, 'load_app.py'),
+                   '--port', str(port), '--processes', str(args.workers)]
+    return subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_for_app(base_url, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App server exited with status {process.returncode}")
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"App server did not start within {timeout:.0f}s")
+
+
+class DashboardUser(threading.Thread):
+    """
+    One simulated browser polling the dashboard.
+
+    Args:
+        base_url (str): App URL.
+        username (str): Account to log in as.
+        tickers (list): The account's watchlist, in card order.
+        recorder (LatencyRecorder): Where request timings go.
+        start_at (float): When to open the dashboard (time.time()).
+        end_at (float): When to stop polling.
+        args: Parsed command line arguments (intervals and stock_data rate).
+        seed (int): Seed for this user's random choices.
+    """
+
+    # Prefix of the endpoint names this user's requests are recorded under
+    endpoint_prefix = ''
+
+    def __init__(self, base_url, username, tickers, recorder, start_at, end_at, args, seed):
+        super().__init__(name=f"user-{username}", daemon=True)
+        self.base_url = base_url
+        self.username = username
+        self.tickers = tickers
+        self.recorder = recorder
+        self.start_at = start_at
+        self.end_at = end_at
+        self.args = args
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.last_response = None
+
+    def request(self, endpoint, method, path, timeout=REQUEST_TIMEOUT, expect=200, **kwargs):
+        endpoint = self.endpoint_prefix + endpoint
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=timeout,
+                                            allow_redirects=False, **kwargs)
+            response.content
+            status = response.status_code
+            self.last_response = response
+        except requests.RequestException as e:
+            status = type(e).__name__
+            self.last_response = None
+        ok = status in expect if isinstance(expect, tuple) else status == expect
+        self.recorder.record(endpoint, time.perf_counter() - start, status, ok)
+        return ok
+
+    def keep_alive(self):
+        self.request('keep-alive', 'GET', '/api/session/keep-alive')
+
+    def refresh_interval(self):
+        return self.args.refresh_interval
+
+    def refresh(self, initial_load):
+        tickers = ','.join(self.tickers)
+        flag = 'true' if initial_load else 'false'
+        ok = self.request('bulk_stock_data', 'GET',
+                          f"/api/bulk_stock_data?tickers={tickers}&initial_load={flag}&_={int(time.time() * 1000)}",
+                          headers={'Accept-Encoding': 'gzip'})
+        if ok and self.tickers and self.rng.random() < self.args.stock_data_rate:
+            ticker = self.rng.choice(self.tickers)
+            self.request('stock_data', 'GET', f"/api/stock_data?ticker={ticker}&_={int(time.time() * 1000)}",
+                         timeout=STOCK_DATA_TIMEOUT)
+
+    def sleep_until(self, when):
+        delay = when - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self):
+        self.sleep_until(self.start_at)
+        if not self.request('login', 'POST', '/login', expect=302,
+                            data={'username': self.username, 'password': PASSWORD}):
+            return
+        pending = self.tickers
+        if self.request('dashboard', 'GET', '/dashboard'):
+            match = INITIAL_QUOTES.search(self.last_response.text)
+            if match:
+                pending = json.loads(match.group(1))['pending']
+
+        # Page load: keepSessionAlive() at script start, then on DOMContentLoaded the
+        # embedded quotes are shown and refreshAllTickers() runs only if some are pending
+        self.keep_alive()
+        if pending:
+            self.refresh(initial_load=True)
+
+        next_refresh = time.time() + self.refresh_interval()
+        next_keepalive = time.time() + self.args.keepalive_interval
+        while True:
+            next_event = min(next_refresh, next_keepalive)
+            if next_event >= self.end_at:
+                break
+            self.sleep_until(next_event)
+            if next_keepalive <= next_refresh:
+                self.keep_alive()
+                next_keepalive += self.args.keepalive_interval
+            else:
+                # refreshAllTickers() pings keep-alive before fetching
+                self.keep_alive()
+                self.refresh(initial_load=False)
+                next_refresh = time.time() + self.refresh_interval()
+
+
+class HeavyUser(DashboardUser):
+    """
+    A noisy neighbour: polls /api/bulk_stock_data?tickers= with a fresh sample
+    of args.heavy_tickers tickers from `universe` every args.heavy_refresh_interval
+    seconds. A 429 from the scrape quota counts as an expected answer.
+    """
+
+    endpoint_prefix = 'heavy:'
+
+    def __init__(self, base_url, username, tickers, recorder, start_at, end_at, args, seed, universe):
+        super().__init__(base_url, username, tickers, recorder, start_at, end_at, args, seed)
+        self.universe = universe
+
+    def refresh_interval(self):
+        return self.args.heavy_refresh_interval
+
+    def refresh(self, initial_load):
+        tickers = ','.join(self.rng.sample(self.universe, min(self.args.heavy_tickers, len(self.universe))))
+        flag = 'true' if initial_load else 'false'
+        self.request('bulk_stock_data', 'GET',
+                     f"/api/bulk_stock_data?tickers={tickers}&initial_load={flag}&_={int(time.time() * 1000)}",
+                     expect=(200, 429), headers={'Accept-Encoding': 'gzip'})
+
+
+def print_report(results):
+    config = results['config']
+    print(f"\n{config['users']} users x {config['tickers']} tickers, {config['server']} "
+          f"workers={config['workers']} threads={config['threads']}, {results['duration']:.0f}s")
+    if config.get('heavy_users'):
+        print(f"plus {config['heavy_users']} heavy users x {config['heavy_tickers']} tickers "
+              f"every {config['heavy_refresh_interval']:.0f}s")
+    print(f"{'Endpoint':<22} {'count':>7} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'errors':>7}")
+    for endpoint, s in results['endpoints'].items():
+        print(f"{endpoint:<22} {s['count']:>7} {s['throughput']:>7.2f} {s['p50']:>8.1f} {s['p95']:>8.1f} "
+              f"{s['p99']:>8.1f} {s['max']:>8.1f} {s['error_rate']:>7.1%}")
+    total = results['total']
+    print(f"{'total':<22} {total['requests']:>7} {total['throughput']:>7.2f} {'':>35} {total['error_rate']:>7.1%}")
+    print("(latencies in ms)")
+    if results['upstream_requests']:
+        print(f"Upstream requests: {results['upstream_requests']}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nComparison with {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')})")
+    for endpoint, s in results['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(endpoint)
+        if old and old.get('count'):
+            print(f"{endpoint:<22} p95 {s['p95']:8.1f} ms ({format_delta(s['p95'], old['p95'])}), "
+                  f"p99 {s['p99']:8.1f} ms ({format_delta(s['p99'], old['p99'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-user load test for the dashboard endpoints')
+    parser.add_argument('--users', type=int, default=20, help='Simulated dashboard users')
+    parser.add_argument('--tickers', type=int, default=10, help='Tickers per watchlist')
+    parser.add_argument('--universe', type=int, default=60, help='Distinct tickers the watchlists draw from')
+    parser.add_argument('--scenarios', default='regular,premarket,afterhours,halted',
+                        help='Comma-separated stub scenarios the tickers cycle through')
+    parser.add_argument('--duration', type=float, default=120, help='Seconds to poll after the first user starts')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which users open their dashboards')
+    parser.add_argument('--refresh-interval', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                        help='Seconds between bulk refreshes (dashboard.js uses 30 during market hours)')
+    parser.add_argument('--keepalive-interval', type=float, default=DEFAULT_KEEPALIVE_INTERVAL,
+                        help='Seconds between keep-alive pings')
+    parser.add_argument('--stock-data-rate', type=float, default=0.1,
+                        help='Chance that a refresh is followed by a single-ticker /api/stock_data fetch')
+    parser.add_argument('--heavy-users', type=int, default=0,
+                        help='Noisy-neighbour users polling large uncached ticker lists')
+    parser.add_argument('--heavy-tickers', type=int, default=200, help='Tickers per heavy user request')
+    parser.add_argument('--heavy-universe', type=int, default=5000,
+                        help='Distinct tickers the heavy users draw from, apart from the light universe')
+    parser.add_argument('--heavy-refresh-interval', type=float, default=5.0,
+                        help='Seconds between a heavy user\'s requests')
+    parser.add_argument('--scrape-quota', type=float,
+                        help='STONX_SCRAPE_QUOTA for the app (uncached fetches per user per minute, 0 for none)')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug', help='App server')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub server base latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Stub server random extra latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub responses that are errors')
+    parser.add_argument('--page-kb', type=int, default=300, help='Size stock pages are padded to')
+    parser.add_argument('--human-delay', type=float, default=0.0, help="Upper bound of the scraper's random pre-scrape delay")
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for watchlists, start times and the stub')
+    parser.add_argument('--keep-scratch', action='store_true', help='Keep the scratch database and app log')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip() in SCENARIOS]
+    universe = [ticker_for(scenarios[i % len(scenarios)], i) for i in range(args.universe)]
+
+    scratch = tempfile.mkdtemp(prefix='stonx-load-')
+    database_url = f"sqlite:///{os.path.join(scratch, 'load.db')}"
+    print(f"Seeding {args.users} users with {args.tickers} tickers each in {scratch}")
+    accounts = seed_database(database_url, args.users, args.tickers, universe, args.seed)
+    heavy_universe = [ticker_for(scenarios[i % len(scenarios)], args.universe + i)
+                      for i in range(args.heavy_universe)]
+    heavy_accounts = []
+    if args.heavy_users:
+        print(f"Seeding {args.heavy_users} heavy users")
+        heavy_accounts = seed_database(database_url, args.heavy_users, args.tickers, heavy_universe,
+                                       args.seed + 1, prefix='heavy')
+
+    stub = StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      page_kb=args.page_kb, seed=args.seed).start()
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATABASE_URL=database_url, STONX_WEB_BASE_URL=stub.url,
+               STONX_API_BASE_URL=stub.url, LOADTEST_HUMAN_DELAY=str(args.human_delay),
+               STONX_HISTORY_DIR=os.path.join(scratch, 'history'))
+    if args.scrape_quota is not None:
+        env['STONX_SCRAPE_QUOTA'] = str(args.scrape_quota)
+    log_path = os.path.join(scratch, 'app.log')
+    log_file = open(log_path, 'w')
+    process = start_app(args, port, env, log_file)
+
+    try:
+        wait_for_app(base_url, process)
+        stub.reset_counts()
+        print(f"App ({args.server}) on {base_url}, stub on {stub.url}; running for {args.duration:.0f}s")
+
+        recorder = LatencyRecorder()
+        rng = random.Random(args.seed)
+        start = time.time()
+        end = start + args.duration
+        users = [DashboardUser(base_url, username, tickers, recorder, start + rng.uniform(0, args.ramp_up),
+                               end, args, args.seed + i)
+                 for i, (username, tickers) in enumerate(accounts)]
+        # Heavy users start first so the light users open their dashboards into a busy scraper
+        users += [HeavyUser(base_url, username, tickers, recorder, start, end, args,
+                            args.seed + len(accounts) + i, heavy_universe)
+                  for i, (username, tickers) in enumerate(heavy_accounts)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        duration = time.time() - start
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log_file.close()
+        stub.stop()
+
+    endpoints = recorder.report(duration)
+    requests_total = sum(s['count'] for s in endpoints.values())
+    errors_total = sum(s['errors'] for s in endpoints.values())
+    results = {
+        'benchmark': 'load',
+        'meta': run_metadata(),
+        'config': vars(args),
+        'duration': duration,
+        'endpoints': endpoints,
+        'total': {
+            'requests': requests_total,
+            'throughput': requests_total / duration if duration else 0,
+            'error_rate': errors_total / requests_total if requests_total else 0,
+        },
+        'upstream_requests': dict(stub.counts),
+    }
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, load_results(args.compare))
+    print(f"\nResults saved to {save_results('load', results, args.output)}")
+
+    if args.keep_scratch:
+        print(f"Scratch database and app log kept in {scratch}")
+    else:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
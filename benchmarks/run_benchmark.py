@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the scraping pipeline.
+
+Starts the fixture stub server (stub_server.py), points scraper.py at it and
+measures:
+
+1. Per-stage timings (delay, fetch, html, json, api) for each fixture scenario
+   (regular, premarket, afterhours, halted, na), from sequential scrapes.
+2. Throughput of ThreadedScraper.get_multiple_quotes against worker count.
+3. Memory: peak traced allocations during a batch and retained bytes per cached quote.
+
+With --parse-processes N, pages are parsed in a pool of N processes (see
+parse_pool.py) so throughput can be compared with parsing on the threads.
+
+Results are saved as JSON so runs can be compared.
+
+With --replay, the stub server is replaced by a corpus recorded with
+transport.py, so engine changes can be compared on identical real inputs.
+
+Usage:
+    python benchmarks/run_benchmark.py
+    python benchmarks/run_benchmark.py --replay corpora/friday-close --latency-scale 1.0
+    python benchmarks/run_benchmark.py --latency 0.08 --jitter 0.04 --error-rate 0.02 --workers 1,2,4,8,16
+    python benchmarks/run_benchmark.py --parse-processes 4 --workers 4,8,16
+    python benchmarks/run_benchmark.py --compare benchmarks/results/scraper-20250426-101500.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+from common import (configure_scraper, format_delta, load_results, run_metadata,
+                    save_results, summarize)
+from stub_server import SCENARIOS, StubServer, scenario_for, ticker_for
+
+import parse_pool
+import scraper
+import transport
+from logs import configure_logging
+from threaded_scraper import ThreadedScraper
+
+
+class StageRecorder:
+    """Stage hook that collects scrape stage timings per fixture scenario"""
+
+    def __init__(self, group=scenario_for):
+        self._group = group
+        self._lock = threading.Lock()
+        self.samples = defaultdict(lambda: defaultdict(list))
+        self.successes = defaultdict(lambda: defaultdict(int))
+
+    def __call__(self, ticker, stage, start, elapsed, info):
+        scenario = self._group(ticker)
+        with self._lock:
+            self.samples[scenario][stage].append(elapsed)
+            if info.get('ok'):
+                self.successes[scenario][stage] += 1
+
+    def report(self):
+        report = {}
+        for scenario, stages in self.samples.items():
+            report[scenario] = {}
+            for stage, samples in stages.items():
+                summary = summarize(samples)
+                summary['success_rate'] = self.successes[scenario][stage] / len(samples)
+                report[scenario][stage] = summary
+        return report
+
+
+def bench_stages(iterations, corpus_tickers=None):
+    """Scrape each scenario (or each corpus ticker) sequentially and collect per-stage timings"""
+    if corpus_tickers:
+        recorder = StageRecorder(group=lambda ticker: 'corpus')
+        runs = [ticker for _ in range(iterations) for ticker in corpus_tickers]
+    else:
+        recorder = StageRecorder()
+        runs = [ticker_for(scenario, i) for scenario in SCENARIOS for i in range(iterations)]
+    scraper.add_stage_hook(recorder)
+    try:
+        for ticker in runs:
+            scraper.scrape_quote(ticker)
+    finally:
+        scraper.remove_stage_hook(recorder)
+    return recorder.report()
+
+
+def mixed_tickers(count, corpus_tickers=None):
+    """Tickers cycling through every fixture scenario, or the corpus tickers when replaying"""
+    if corpus_tickers:
+        return corpus_tickers[:count]
+    return [ticker_for(SCENARIOS[i % len(SCENARIOS)], i) for i in range(count)]
+
+
+def corpus_page_tickers(corpus_dir):
+    """Tickers whose stock pages were recorded in a corpus"""
+    tickers = []
+    with open(os.path.join(corpus_dir, 'exchanges.ndjson')) as f:
+        for line in f:
+            key = json.loads(line)['key'] if line.strip() else ''
+            parts = [part for part in key.split('/') if part]
+            if len(parts) == 4 and parts[:3] == ['us', 'en', 'stocks'] and parts[3] not in tickers:
+                tickers.append(parts[3])
+    return tickers
+
+
+def bench_throughput(worker_counts, ticker_count, rounds, corpus_tickers=None):
+    """Measure get_multiple_quotes throughput for each worker count"""
+    tickers = mixed_tickers(ticker_count, corpus_tickers)
+    ticker_count = len(tickers)
+    results = []
+    for workers in worker_counts:
+        elapsed_samples = []
+        successes = 0
+        for _ in range(rounds):
+            # A zero TTL keeps every round uncached
+            threaded = ThreadedScraper(max_workers=workers, cache_ttl=0)
+            start = time.perf_counter()
+            quotes, _ = threaded.get_multiple_quotes(tickers, fast_mode=True)
+            elapsed_samples.append(time.perf_counter() - start)
+            threaded.shutdown()
+            successes += sum(1 for quote in quotes.values() if quote.price is not None)
+        total = sum(elapsed_samples)
+        results.append({
+            'workers': workers,
+            'tickers': ticker_count,
+            'rounds': rounds,
+            'batch_time': summarize(elapsed_samples),
+            'tickers_per_second': ticker_count * rounds / total if total else 0,
+            'success_rate': successes / (ticker_count * rounds),
+        })
+    return results
+
+
+def bench_memory(ticker_count, workers, corpus_tickers=None):
+    """Measure peak allocations for one batch and bytes retained per cached quote"""
+    tickers = mixed_tickers(ticker_count, corpus_tickers)
+    ticker_count = len(tickers)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        threaded = ThreadedScraper(max_workers=workers, cache_ttl=3600)
+        quotes, _ = threaded.get_multiple_quotes(tickers, fast_mode=True)
+        threaded.shutdown()
+        _, peak = tracemalloc.get_traced_memory()
+        # Parse trees have reference cycles; collect them so only the cache remains
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    cached = threaded.get_stats()['cache_size']
+    return {
+        'tickers': ticker_count,
+        'cached_quotes': cached,
+        'peak_traced_kb': (peak - before) / 1024,
+        'retained_kb': (after - before) / 1024,
+        'retained_bytes_per_cached_quote': (after - before) / cached if cached else None,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def print_report(results):
+    print("\nPer-stage timings (ms)")
+    print(f"{'Scenario':<11} {'Stage':<7} {'count':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8} {'ok':>6}")
+    for scenario, stages in results['stages'].items():
+        for stage, s in stages.items():
+            print(f"{scenario:<11} {stage:<7} {s['count']:>6} {s['mean']:>8.2f} {s['p50']:>8.2f} "
+                  f"{s['p95']:>8.2f} {s['max']:>8.2f} {s['success_rate']:>6.0%}")
+
+    print("\nThroughput vs workers")
+    print(f"{'Workers':>7} {'tickers/s':>10} {'batch p50 (ms)':>15} {'success':>8}")
+    for row in results['throughput']:
+        print(f"{row['workers']:>7} {row['tickers_per_second']:>10.1f} {row['batch_time']['p50']:>15.1f} "
+              f"{row['success_rate']:>8.0%}")
+
+    memory = results['memory']
+    print("\nMemory")
+    print(f"Peak traced during batch: {memory['peak_traced_kb']:.1f} KB")
+    if memory['retained_bytes_per_cached_quote'] is not None:
+        print(f"Retained per cached quote: {memory['retained_bytes_per_cached_quote']:.0f} bytes")
+    print(f"Max RSS: {memory['max_rss_kb']} KB")
+
+
+def print_comparison(results, baseline):
+    print(f"\nComparison with {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')})")
+    for scenario, stages in results['stages'].items():
+        for stage, s in stages.items():
+            old = baseline.get('stages', {}).get(scenario, {}).get(stage)
+            if old and old.get('count'):
+                print(f"{scenario:<11} {stage:<7} p50 {s['p50']:8.2f} ms ({format_delta(s['p50'], old['p50'])})")
+    old_rows = {row['workers']: row for row in baseline.get('throughput', [])}
+    for row in results['throughput']:
+        old = old_rows.get(row['workers'])
+        if old:
+            print(f"{row['workers']:>3} workers: {row['tickers_per_second']:.1f} tickers/s "
+                  f"({format_delta(row['tickers_per_second'], old['tickers_per_second'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark for the scraping pipeline')
+    parser.add_argument('--iterations', type=int, default=20, help='Sequential scrapes per scenario for stage timings')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker counts for the throughput test')
+    parser.add_argument('--tickers', type=int, default=40, help='Tickers per batch in the throughput and memory tests')
+    parser.add_argument('--rounds', type=int, default=3, help='Batches per worker count')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub server base latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Stub server random extra latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub responses that are errors')
+    parser.add_argument('--page-kb', type=int, default=300, help='Size stock pages are padded to')
+    parser.add_argument('--human-delay', type=float, default=0.0, help="Upper bound of the scraper's random pre-scrape delay")
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the stub server')
+    parser.add_argument('--replay', help='Replay a corpus recorded with transport.py instead of using the stub server')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='Latency multiplier when replaying a corpus')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help='Parse pages in this many processes instead of on the worker threads')
+    parser.add_argument('--verbose', action='store_true', help="Show the scraper's debug logs")
+    args = parser.parse_args()
+
+    stub = None
+    corpus_tickers = None
+    if args.replay:
+        transport.set_transport(transport.ReplayTransport(args.replay, args.latency_scale))
+        configure_scraper(scraper.WEB_BASE_URL, args.human_delay)
+        corpus_tickers = corpus_page_tickers(args.replay)
+        print(f"Replaying {len(corpus_tickers)} tickers from {args.replay} at {args.latency_scale}x latency")
+    else:
+        stub = StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          page_kb=args.page_kb, seed=args.seed).start()
+        configure_scraper(stub.url, args.human_delay)
+        print(f"Stub server on {stub.url} (latency {args.latency * 1000:.0f}ms +{args.jitter * 1000:.0f}ms, "
+              f"errors {args.error_rate:.0%}, pages ~{args.page_kb}KB)")
+
+    worker_counts = [int(w) for w in args.workers.split(',') if w.strip()]
+    if args.verbose:
+        configure_logging('DEBUG')
+    if args.parse_processes:
+        parse_pool.configure(args.parse_processes)
+        print(f"Parsing pages in {args.parse_processes} processes")
+
+    try:
+        stages = bench_stages(args.iterations, corpus_tickers)
+        throughput = bench_throughput(worker_counts, args.tickers, args.rounds, corpus_tickers)
+        memory = bench_memory(args.tickers, max(worker_counts), corpus_tickers)
+    finally:
+        if stub:
+            stub.stop()
+        parse_pool.configure(0)
+
+    results = {
+        'benchmark': 'scraper',
+        'meta': run_metadata(),
+        'config': vars(args),
+        'stages': stages,
+        'throughput': throughput,
+        'memory': memory,
+        'upstream_requests': dict(stub.counts) if stub else None,
+    }
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, load_results(args.compare))
+    print(f"\nResults saved to {save_results('scraper', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
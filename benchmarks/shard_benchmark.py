@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Refresh capacity of sharded scraper daemons.
+
+Starts the fixture stub server, then for each shard count N starts N scraper
+daemons (shard_node.py) as local processes and refreshes a universe of
+distinct tickers through ShardedScraperClient, with caching disabled so every
+round scrapes every ticker. Reports tickers refreshed per second against N and
+the scaling efficiency relative to one shard.
+
+It also checks the hash ring itself: how evenly the universe is split, and the
+fraction of tickers that change owner when a shard joins (ideally 1/(N+1)).
+
+Usage:
+    python benchmarks/shard_benchmark.py
+    python benchmarks/shard_benchmark.py --shards 1,2,4,8 --tickers 400 --workers 6 --latency 0.08
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import BENCHMARKS_DIR, format_delta, load_results, run_metadata, save_results, summarize
+from stub_server import SCENARIOS, StubServer, ticker_for
+
+from scraper_service import ScraperClient, ScraperServiceError
+from sharding import HashRing, ShardedScraperClient, ring_movement
+
+
+def start_shards(count, scratch, args, env):
+    """Start `count` daemons and wait until each answers a ping"""
+    paths = [os.path.join(scratch, f"shard-{index}.sock") for index in range(count)]
+    processes = []
+    for path in paths:
+        command = [sys.executable, os.path.join(BENCHMARKS_DIR, 'shard_node.py'), '--socket', path,
+                   '--workers', str(args.workers), '--cache-ttl', '0', '--shards', str(count),
+                   '--log-level', 'WARNING']
+        processes.append(subprocess.Popen(command, env=env))
+    deadline = time.time() + 30
+    for path, process in zip(paths, processes):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Shard {path} exited with status {process.returncode}")
+            try:
+                ScraperClient(path, timeout=5).ping()
+                break
+            except ScraperServiceError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Shard {path} did not start within 30s")
+                time.sleep(0.1)
+    return paths, processes
+
+
+def stop_shards(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def bench_refresh(shard_count, universe, args, scratch, env):
+    """Refresh the universe through `shard_count` daemons and measure throughput"""
+    paths, processes = start_shards(shard_count, scratch, args, env)
+    try:
+        client = ShardedScraperClient(paths)
+        elapsed_samples = []
+        successes = 0
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            quotes, _ = client.get_multiple_quotes(universe, fast_mode=True)
+            elapsed_samples.append(time.perf_counter() - start)
+            successes += sum(1 for quote in quotes.values() if quote.price is not None)
+        owned = {os.path.basename(path): len(tickers) for path, tickers in client.assign(universe).items()}
+    finally:
+        stop_shards(processes)
+    total = sum(elapsed_samples)
+    return {
+        'shards': shard_count,
+        'tickers': len(universe),
+        'rounds': args.rounds,
+        'refresh_time': summarize(elapsed_samples),
+        'tickers_per_second': len(universe) * args.rounds / total if total else 0,
+        'success_rate': successes / (len(universe) * args.rounds),
+        'tickers_per_shard': owned,
+    }
+
+
+def ring_report(shard_counts, universe):
+    """Balance of the universe across N nodes and movement when node N+1 joins"""
+    rows = []
+    for count in shard_counts:
+        nodes = [f"shard-{index}" for index in range(count)]
+        ring = HashRing(nodes)
+        shares = [len(tickers) for tickers in ring.assign(universe).values()]
+        grown = HashRing(nodes + [f"shard-{count}"])
+        rows.append({
+            'shards': count,
+            'max_share_over_ideal': max(shares) / (len(universe) / count) if shares else 0,
+            'moved_on_join': ring_movement(ring, grown, universe),
+            'ideal_moved_on_join': 1 / (count + 1),
+        })
+    return rows
+
+
+def print_report(results):
+    print("\nRefresh capacity vs shards")
+    print(f"{'Shards':>6} {'tickers/s':>10} {'refresh p50 (ms)':>17} {'efficiency':>11} {'success':>8}")
+    base = results['refresh'][0]['tickers_per_second'] / results['refresh'][0]['shards'] if results['refresh'] else 0
+    for row in results['refresh']:
+        efficiency = row['tickers_per_second'] / (base * row['shards']) if base else 0
+        print(f"{row['shards']:>6} {row['tickers_per_second']:>10.1f} {row['refresh_time']['p50']:>17.1f} "
+              f"{efficiency:>11.0%} {row['success_rate']:>8.0%}")
+
+    print("\nHash ring")
+    print(f"{'Shards':>6} {'max share/ideal':>16} {'moved on join':>14} {'ideal':>6}")
+    for row in results['ring']:
+        print(f"{row['shards']:>6} {row['max_share_over_ideal']:>16.2f} {row['moved_on_join']:>14.1%} "
+              f"{row['ideal_moved_on_join']:>6.1%}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nComparison with {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')})")
+    old_rows = {row['shards']: row for row in baseline.get('refresh', [])}
+    for row in results['refresh']:
+        old = old_rows.get(row['shards'])
+        if old:
+            print(f"{row['shards']:>3} shards: {row['tickers_per_second']:.1f} tickers/s "
+                  f"({format_delta(row['tickers_per_second'], old['tickers_per_second'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh capacity of sharded scraper daemons')
+    parser.add_argument('--shards', default='1,2,4', help='Comma-separated shard counts')
+    parser.add_argument('--tickers', type=int, default=200, help='Distinct tickers in the universe')
+    parser.add_argument('--workers', type=int, default=6, help='Scraper threads per shard')
+    parser.add_argument('--rounds', type=int, default=2, help='Refreshes per shard count')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stub server base latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Stub server random extra latency in seconds')
+    parser.add_argument('--page-kb', type=int, default=50, help='Size stock pages are padded to')
+    parser.add_argument('--human-delay', type=float, default=0.0, help="Upper bound of the scraper's random pre-scrape delay")
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the stub server')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    shard_counts = [int(count) for count in args.shards.split(',') if count.strip()]
+    universe = [ticker_for(SCENARIOS[i % len(SCENARIOS)], i) for i in range(args.tickers)]
+
+    stub = StubServer(latency=args.latency, jitter=args.jitter, page_kb=args.page_kb, seed=args.seed).start()
+    env = dict(os.environ, STONX_WEB_BASE_URL=stub.url, STONX_API_BASE_URL=stub.url,
+               SHARD_HUMAN_DELAY=str(args.human_delay), STONX_HISTORY='0')
+    scratch = tempfile.mkdtemp(prefix='stonx-shards-')
+    print(f"Stub server on {stub.url}; {len(universe)} tickers, shards {shard_counts}, "
+          f"{args.workers} workers per shard")
+
+    try:
+        refresh = []
+        for count in shard_counts:
+            refresh.append(bench_refresh(count, universe, args, scratch, env))
+            print(f"{count} shards: {refresh[-1]['tickers_per_second']:.1f} tickers/s")
+    finally:
+        stub.stop()
+
+    results = {
+        'benchmark': 'shard',
+        'meta': run_metadata(),
+        'config': vars(args),
+        'refresh': refresh,
+        'ring': ring_report(shard_counts, universe),
+        'upstream_requests': dict(stub.counts),
+    }
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, load_results(args.compare))
+    print(f"\nResults saved to {save_results('shard', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Scraper daemon entry point used by shard_benchmark.py.
+
+Runs scraper_service.py's daemon with the scraper pointed at a stub server.
+Takes the daemon's own arguments (--socket, --workers, --cache-ttl) and is
+configured through the environment like load_app.py:
+
+- STONX_WEB_BASE_URL / STONX_API_BASE_URL: stub server URL (read by scraper.py)
+- SHARD_HUMAN_DELAY: upper bound of the scraper's random pre-scrape delay
+
+Usage:
+    python benchmarks/shard_node.py --socket /tmp/stonx-0.sock --workers 6 --cache-ttl 0
+"""
+
+import os
+
+from common import configure_scraper
+
+import scraper
+import scraper_service
+
+configure_scraper(os.environ.get('STONX_WEB_BASE_URL', scraper.WEB_BASE_URL),
+                  float(os.environ.get('SHARD_HUMAN_DELAY', '0')))
+
+
+if __name__ == '__main__':
+    scraper_service.main()
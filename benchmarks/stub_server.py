@@ -0,0 +1,243 @@
+"""
+Local stub of the Robinhood endpoints used by scraper.py.
+
+Serves the recorded fixtures in benchmarks/fixtures with configurable latency
+and error injection, so the scraping pipeline can be measured offline:
+
+- /us/en/stocks/<TICKER>/            -> fixtures/pages/<scenario>.html
+- /instruments/?symbol=<TICKER>       -> instrument lookup
+- /marketdata/quotes/<instrument id>/ -> fixtures/api/<scenario>.json
+
+The scenario of a ticker is taken from its prefix (see SCENARIO_PREFIXES), so
+"AFT12" is served the after-hours fixtures. Unknown tickers get 'regular'.
+
+Usage:
+    python benchmarks/stub_server.py --port 8765 --latency 0.05 --error-rate 0.02
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Ticker prefix -> fixture scenario
+SCENARIO_PREFIXES = {
+    'REG': 'regular',
+    'PRE': 'premarket',
+    'AFT': 'afterhours',
+    'HLT': 'halted',
+    'NA': 'na',
+}
+SCENARIOS = list(SCENARIO_PREFIXES.values())
+
+# Status codes returned by injected errors
+ERROR_STATUSES = (429, 500, 503)
+
+
+def scenario_for(ticker: str) -> str:
+    """Get the fixture scenario a ticker is served from"""
+    for prefix, scenario in SCENARIO_PREFIXES.items():
+        if ticker.startswith(prefix) and ticker[len(prefix):].isdigit():
+            return scenario
+    return 'regular'
+
+
+def ticker_for(scenario: str, index: int) -> str:
+    """Build a ticker symbol that the stub serves from the given scenario"""
+    for prefix, name in SCENARIO_PREFIXES.items():
+        if name == scenario:
+            return f"{prefix}{index}"
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def _load_fixtures(page_kb: int):
+    """Load page and API fixtures, padding pages to roughly page_kb kilobytes"""
+    pages = {}
+    for scenario in SCENARIOS:
+        with open(os.path.join(FIXTURES_DIR, 'pages', f'{scenario}.html'), encoding='utf-8') as f:
+            page = f.read()
+        # Real pages are several hundred KB of markup; pad to make parsing cost realistic
+        if page_kb > 0:
+            row = '<div class="sdp-filler"><span class="label">Volume</span><span class="value">1,234,567</span></div>\n'
+            filler = row * max(1, (page_kb * 1024 - len(page)) // len(row))
+            page = page.replace('</main>', filler + '</main>')
+        pages[scenario] = page
+
+    quotes = {}
+    for scenario in SCENARIOS:
+        path = os.path.join(FIXTURES_DIR, 'api', f'{scenario}.json')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                quotes[scenario] = f.read()
+    return pages, quotes
+
+
+class StubServer:
+    """
+    Threaded HTTP server serving Robinhood-style fixtures.
+
+    Args:
+        host (str, optional): Interface to bind.
+        port (int, optional): Port to bind, 0 picks a free port.
+        latency (float, optional): Base delay added to every response, in seconds.
+        jitter (float, optional): Extra uniformly random delay up to this many seconds.
+        error_rate (float, optional): Fraction of requests answered with a 429/500/503.
+        page_kb (int, optional): Pad stock pages to roughly this size.
+        seed (int, optional): Seed for latency and error injection.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, page_kb: int = 0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._pages, self._quotes = _load_fixtures(page_kb)
+        self._counts_lock = threading.Lock()
+        self.counts = {'page': 0, 'instrument': 0, 'quote': 0, 'error': 0, 'not_found': 0}
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this, Nagle's algorithm
+                # and the client's delayed ACK add ~40ms to every response on a reused connection
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                # Keep benchmark output clean
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server, usable as both WEB_BASE_URL and API_BASE_URL"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubServer':
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counts(self):
+        """Reset the per-route request counters"""
+        with self._counts_lock:
+            for key in self.counts:
+                self.counts[key] = 0
+
+    def _count(self, key: str):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        with self._random_lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            error_status = self._random.choice(ERROR_STATUSES)
+        if delay > 0:
+            time.sleep(delay)
+
+        if fail:
+            self._count('error')
+            self._send(handler, error_status, 'application/json', '{"detail": "Injected error"}')
+            return
+
+        parsed = urlparse(handler.path)
+        parts = [part for part in parsed.path.split('/') if part]
+
+        # /us/en/stocks/<TICKER>/
+        if len(parts) == 4 and parts[:3] == ['us', 'en', 'stocks']:
+            ticker = parts[3].upper()
+            self._count('page')
+            page = self._pages[scenario_for(ticker)].replace('{{TICKER}}', ticker)
+            self._send(handler, 200, 'text/html; charset=utf-8', page)
+            return
+
+        # /instruments/?symbol=<TICKER>
+        if parts == ['instruments']:
+            ticker = parse_qs(parsed.query).get('symbol', [''])[0].upper()
+            self._count('instrument')
+            if scenario_for(ticker) in self._quotes:
+                results = [{'id': f"inst-{ticker}", 'symbol': ticker}]
+            else:
+                results = []
+            self._send(handler, 200, 'application/json', json.dumps({'results': results}))
+            return
+
+        # /marketdata/quotes/<instrument id>/
+        if len(parts) == 3 and parts[:2] == ['marketdata', 'quotes'] and parts[2].startswith('inst-'):
+            ticker = parts[2][len('inst-'):]
+            quote = self._quotes.get(scenario_for(ticker))
+            if quote is not None:
+                self._count('quote')
+                self._send(handler, 200, 'application/json', quote.replace('{{TICKER}}', ticker))
+                return
+
+        self._count('not_found')
+        self._send(handler, 404, 'application/json', '{"detail": "Not found."}')
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, content_type: str, body: str):
+        data = body.encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Robinhood-style fixtures for offline scraper runs')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind')
+    parser.add_argument('--latency', type=float, default=0.0, help='Base response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--page-kb', type=int, default=300, help='Pad stock pages to roughly this size')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for latency and errors')
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.page_kb, args.seed)
+    print(f"Serving fixtures on {server.url}")
+    print(f"Point the scraper at it with STONX_WEB_BASE_URL={server.url} STONX_API_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
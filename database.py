@@ -0,0 +1,135 @@
+"""
+SQLite settings for the app's database.
+
+The app stores users, watchlists and alerts in a single SQLite file, which is
+read on every request and written rarely. The defaults SQLite starts with suit
+neither that workload nor several web threads sharing one file:
+
+- journal_mode=WAL lets readers go on while a write is in progress; with the
+  default rollback journal every commit locks readers out of the whole file.
+- synchronous=NORMAL syncs the WAL at checkpoints rather than at every commit.
+  The database stays consistent after a power cut; only the last commits before
+  it can be lost.
+- cache_size and mmap_size keep the (small) database in memory: pages are read
+  through a memory map shared by every connection instead of copied into each
+  connection's cache.
+- busy_timeout makes a writer wait for the write lock instead of failing at once
+  with "database is locked".
+
+Pragmas other than journal_mode only last for a connection, so they are set as
+each pooled connection is opened. Connections to a local file cannot go stale,
+so the pool neither pings nor recycles them. Its size bounds the concurrent
+readers, since writes are serialized by SQLite anyway.
+
+Other databases (DATABASE_URL pointing at a server) keep network pool settings.
+
+Environment:
+    STONX_DB_POOL_SIZE     Pooled SQLite connections (default 8)
+    STONX_SQLITE_MMAP_MB   Bytes of the file mapped into memory, in MB (default 256)
+"""
+
+import logging
+import os
+from typing import Any, Dict, Tuple
+
+import sqlalchemy as sa
+
+logger = logging.getLogger('247stonx.database')
+
+# Seconds a writer waits for the write lock before "database is locked"
+BUSY_TIMEOUT = 10.0
+
+# Page cache per connection in KiB (negative cache_size means KiB, not pages)
+CACHE_KB = 16 * 1024
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MMAP_MB = 256
+
+# Pool settings for a database server
+NETWORK_ENGINE_OPTIONS = {
+    'pool_pre_ping': True,  # Verify connection validity before use
+    'pool_recycle': 280,    # Recycle connections after 280 seconds
+    'pool_size': 20,
+    'max_overflow': 20,
+    'pool_timeout': 60,
+}
+
+
+def sqlite_pragmas() -> Tuple[Tuple[str, Any], ...]:
+    """The pragmas set on every SQLite connection, in order"""
+    mmap_mb = int(os.environ.get('STONX_SQLITE_MMAP_MB', DEFAULT_MMAP_MB))
+    return (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -CACHE_KB),
+        ('mmap_size', mmap_mb * 1024 * 1024),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def is_sqlite_file(uri: str) -> bool:
+    """True for a SQLite database in a file (not in memory)"""
+    url = sa.engine.make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri: str) -> Dict[str, Any]:
+    """
+    SQLAlchemy engine options for a database URI.
+
+    Args:
+        uri (str): The database URI.
+
+    Returns:
+        dict: Options for SQLALCHEMY_ENGINE_OPTIONS. Empty for an in-memory SQLite
+        database, which Flask-SQLAlchemy gives a static pool of one connection.
+    """
+    url = sa.engine.make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return dict(NETWORK_ENGINE_OPTIONS)
+    if not is_sqlite_file(uri):
+        return {}
+    pool_size = int(os.environ.get('STONX_DB_POOL_SIZE', DEFAULT_POOL_SIZE))
+    return {
+        'poolclass': sa.pool.QueuePool,
+        'pool_size': pool_size,
+        # Short bursts beyond the pool open extra connections, closed when returned
+        'max_overflow': pool_size,
+        'pool_timeout': 30,
+        'connect_args': {'timeout': BUSY_TIMEOUT, 'check_same_thread': False},
+    }
+
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    """Set sqlite_pragmas() on a new DB-API connection (a 'connect' event listener)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def tune_engine(engine: sa.engine.Engine):
+    """Set the pragmas on every connection the engine opens, if it is a SQLite file engine"""
+    if not is_sqlite_file(str(engine.url)):
+        return
+    sa.event.listen(engine, 'connect', apply_pragmas)
+    logger.debug("Tuned SQLite engine for %s", engine.url.database)
+
+
+def pragma_values(engine: sa.engine.Engine) -> Dict[str, Any]:
+    """Current values of the tuned pragmas on a pooled connection"""
+    values = {}
+    with engine.connect() as connection:
+        for name, _ in sqlite_pragmas():
+            values[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+    return values
+
+
+def optimize(engine: sa.engine.Engine):
+    """Let SQLite refresh the statistics its query planner uses, where they are out of date"""
+    if engine.url.get_backend_name() != 'sqlite':
+        return
+    with engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA optimize')
@@ -0,0 +1,228 @@
+"""
+Streaming CSV and NDJSON export of quotes and tick history.
+
+Everything here is a generator: rows are produced one at a time from the
+quotes or straight from the mmapped day segments of history.py, and encoded
+into chunks of about CHUNK_SIZE characters. An export of a year of history
+holds one segment map and one chunk in memory at a time, however many ticks
+it covers, and the web endpoint sends each chunk as it is made (chunked
+transfer encoding).
+
+History rows come ticker by ticker, each in time order. Time filters take
+epoch seconds, ISO dates or datetimes (UTC unless they carry an offset), or
+a duration before now such as 1h or 7d.
+
+Command line:
+
+    python export.py history --tickers AAPL,MSFT --start 2025-04-01 --end 2025-04-26 -o ticks.csv
+    python export.py history --start 7d --format ndjson | gzip > week.ndjson.gz
+    python export.py quotes --tickers AAPL,MSFT,NVDA --format ndjson
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import history
+from analytics import parse_duration
+from quote import Quote
+
+FORMATS = ('csv', 'ndjson')
+
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+QUOTE_FIELDS = ('ticker', 'price', 'regular_price', 'extended_price', 'previous_close', 'change',
+                'change_percent', 'extended_change', 'extended_change_percent', 'session', 'timestamp',
+                'time', 'stale', 'error')
+
+HISTORY_FIELDS = ('ticker', 'timestamp', 'time', 'price', 'previous_close')
+
+# Characters per yielded chunk: large enough to keep writes few, small enough to stream
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_time(text: str, now: Optional[float] = None) -> float:
+    """
+    Epoch seconds of a time filter.
+
+    Args:
+        text (str): Epoch seconds, an ISO date or datetime (UTC if naive), or a
+            duration such as '1h' meaning that long before now.
+        now (float, optional): Reference for durations. Defaults to the current time.
+
+    Raises:
+        ValueError: If the text is none of these.
+    """
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return (time.time() if now is None else now) - parse_duration(text)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid time {text!r}; use epoch seconds, an ISO date or datetime, or e.g. 1h") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+
+def quote_rows(quotes: Iterable[Quote]) -> Iterator[Dict[str, Any]]:
+    """One row of numeric fields per quote"""
+    for quote in quotes:
+        row = {name: getattr(quote, name) for name in Quote.__slots__}
+        row['session'] = quote.session.name
+        row['time'] = _iso(quote.timestamp)
+        yield row
+
+
+def history_rows(store: history.HistoryStore, tickers: Optional[Sequence[str]], start: float,
+                 end: float) -> Iterator[Dict[str, Any]]:
+    """
+    One row per recorded tick with start <= timestamp < end.
+
+    Args:
+        store (history.HistoryStore): Where to read the ticks.
+        tickers (Sequence[str], optional): Tickers to export. None exports every
+            ticker with history in the range.
+        start (float): Earliest timestamp, inclusive.
+        end (float): Latest timestamp, exclusive.
+    """
+    if tickers is None:
+        tickers = history_tickers(store, start, end)
+    for ticker in tickers:
+        for tick in store.iter_ticks(ticker, start, end):
+            yield {
+                'ticker': ticker,
+                'timestamp': tick.timestamp,
+                'time': _iso(tick.timestamp),
+                'price': tick.price,
+                'previous_close': tick.previous_close,
+            }
+
+
+def history_tickers(store: history.HistoryStore, start: float, end: float) -> List[str]:
+    """Every ticker with a segment on a day of the range, sorted"""
+    first, last = history.day_of(start), history.day_of(end)
+    tickers = set()
+    for day in store.days():
+        if first <= day <= last:
+            tickers.update(store.tickers(day))
+    return sorted(tickers)
+
+
+def encode(rows: Iterable[Dict[str, Any]], fmt: str, fields: Sequence[str],
+           chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Encode rows as CSV (with a header line) or NDJSON, in chunks.
+
+    Missing values are empty in CSV and null in NDJSON.
+
+    Raises:
+        ValueError: If the format is not one of FORMATS.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fields, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps({name: row.get(name) for name in fields}, separators=(',', ':')))
+            buffer.write('\n')
+    for row in rows:
+        write(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_history(store: history.HistoryStore, tickers: Optional[Sequence[str]], start: float, end: float,
+                   fmt: str = 'csv') -> Iterator[str]:
+    """Chunks of a history export; see history_rows()"""
+    return encode(history_rows(store, tickers, start, end), fmt, HISTORY_FIELDS)
+
+
+def export_quotes(quotes: Iterable[Quote], fmt: str = 'csv') -> Iterator[str]:
+    """Chunks of a quotes export"""
+    return encode(quote_rows(quotes), fmt, QUOTE_FIELDS)
+
+
+def _split_tickers(text: Optional[str]) -> Optional[List[str]]:
+    if not text:
+        return None
+    return list(dict.fromkeys(t.strip().upper() for t in text.split(',') if t.strip()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export quotes or tick history as CSV or NDJSON')
+    parser.add_argument('kind', choices=('history', 'quotes'), help='What to export')
+    parser.add_argument('--tickers', help='Comma-separated tickers (history default: every ticker recorded)')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default %(default)s)')
+    parser.add_argument('-o', '--output', help='Output file (default stdout)')
+    parser.add_argument('--start', help='History from this time: epoch seconds, ISO date/datetime or e.g. 7d (default 1d)')
+    parser.add_argument('--end', help='History until this time, exclusive (default now)')
+    parser.add_argument('--history-dir', help='Tick history directory (default STONX_HISTORY_DIR or instance/history)')
+    parser.add_argument('--workers', type=int, default=4, help='Scraper threads for quotes without a daemon')
+    args = parser.parse_args()
+
+    tickers = _split_tickers(args.tickers)
+    try:
+        start = parse_time(args.start or '1d')
+        end = parse_time(args.end) if args.end else time.time()
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.kind == 'history':
+        directory = (args.history_dir or os.environ.get('STONX_HISTORY_DIR')
+                     or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'history'))
+        if not os.path.isdir(directory):
+            parser.error(f"No tick history at {directory}")
+        chunks = export_history(history.HistoryStore(directory, read_only=True), tickers, start, end, args.format)
+    else:
+        if not tickers:
+            parser.error('quotes needs --tickers')
+        socket_paths = [path.strip() for path in os.environ.get('STONX_SCRAPER_SOCKET', '').split(',') if path.strip()]
+        if socket_paths:
+            from sharding import ShardedScraperClient
+            from scraper_service import ScraperClient
+            scraper = ShardedScraperClient(socket_paths) if len(socket_paths) > 1 else ScraperClient(socket_paths[0])
+        else:
+            from threaded_scraper import ThreadedScraper
+            scraper = ThreadedScraper(max_workers=args.workers)
+        quotes, _ = scraper.get_multiple_quotes(tickers, client='export')
+        chunks = export_quotes((quotes[ticker] for ticker in tickers if ticker in quotes), args.format)
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    except BrokenPipeError:
+        # e.g. piped into head; nothing left to say
+        sys.stderr.close()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Fair sharing of scrape capacity between users.
+
+Upstream fetches are the scarce resource: the scraper has a handful of worker
+threads and paces its requests. Without scheduling, one user refreshing a
+200-ticker watchlist fills the queue and everyone behind them waits for all
+200 fetches.
+
+FairScheduler gives every client (a user, or the address of an anonymous
+caller) its own FIFO queue and serves the queues with deficit round robin:
+each turn a client earns `quantum * weight` credit and spends one credit per
+fetch, so a client with a single ticker waits behind at most one fetch per
+other active client, however long their queues are. A job wanted by several
+clients sits in each of their queues and runs at the first turn any of them
+gets; the other copies are skipped without being charged.
+
+ScrapeQuota caps the upstream fetches a client can cause per minute with a
+token bucket. Cache hits are free; only fetches that would go upstream are
+charged.
+
+RateLimiter spaces all the fetches of a scraper to a rate, making the workers
+wait for a token rather than refusing them.
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+# Error of the quote returned for a ticker refused by the quota
+QUOTA_EXCEEDED = 'Scrape quota exceeded, try again shortly'
+
+
+class Job:
+    """
+    A unit of work queued on a FairScheduler.
+
+    Args:
+        key (Hashable): What the job does, e.g. the ticker to scrape.
+        payload (Any, optional): Extra data for the worker.
+    """
+
+    __slots__ = ('key', 'payload', 'submitted', 'taken')
+
+    def __init__(self, key: Hashable, payload: Any = None):
+        self.key = key
+        self.payload = payload
+        self.submitted = time.perf_counter()
+        self.taken = False
+
+
+class FairScheduler:
+    """
+    Deficit round robin over per-client job queues.
+
+    Args:
+        quantum (float, optional): Credit a client earns per turn, in fetches.
+    """
+
+    def __init__(self, quantum: float = 1.0):
+        self.quantum = quantum
+        self._cond = threading.Condition()
+        self._queues = {}  # client -> deque of jobs
+        self._active = collections.deque()  # clients with queued jobs, in turn order
+        self._deficit = {}  # client -> unspent credit
+        self._weights = {}  # client -> weight, 1 unless set
+        self._served = collections.Counter()
+        self._closed = False
+
+    def set_weight(self, client: Hashable, weight: float):
+        """Give a client `weight` times the default share"""
+        with self._cond:
+            if weight == 1:
+                self._weights.pop(client, None)
+            else:
+                self._weights[client] = weight
+
+    def submit(self, client: Hashable, job: Job):
+        """Queue a job for a client. A job may be queued for several clients."""
+        with self._cond:
+            queue = self._queues.get(client)
+            if queue is None:
+                queue = self._queues[client] = collections.deque()
+            if not queue:
+                self._active.append(client)
+                self._deficit[client] = 0.0
+            queue.append(job)
+            self._cond.notify()
+
+    def _drop_taken(self, queue: collections.deque):
+        while queue and queue[0].taken:
+            queue.popleft()
+
+    def _retire(self, client: Hashable):
+        """Forget a client whose queue ran dry; it starts from zero credit next time"""
+        self._active.remove(client)
+        del self._queues[client]
+        del self._deficit[client]
+
+    def next_job(self, timeout: Optional[float] = None) -> Optional[Job]:
+        """
+        Take the next job in fair order, waiting for one if none is queued.
+
+        Returns:
+            Job: The job, or None on timeout or once the scheduler is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if not self._active:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+                    continue
+
+                client = self._active[0]
+                queue = self._queues[client]
+                # Copies already run for another client cost nothing
+                self._drop_taken(queue)
+                if not queue:
+                    self._retire(client)
+                    continue
+
+                if self._deficit[client] < 1:
+                    # A new turn: earn this turn's credit, or pass if the weight
+                    # is too small to afford a fetch yet
+                    self._deficit[client] += self.quantum * self._weights.get(client, 1)
+                    if self._deficit[client] < 1:
+                        self._active.rotate(-1)
+                        continue
+
+                job = queue.popleft()
+                job.taken = True
+                self._deficit[client] -= 1
+                self._served[client] += 1
+
+                self._drop_taken(queue)
+                if not queue:
+                    self._retire(client)
+                elif self._deficit[client] < 1:
+                    # Turn over; the client goes to the back of the line
+                    self._active.rotate(-1)
+                return job
+
+    def close(self):
+        """Wake every waiting worker with None"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = {client: sum(1 for job in queue if not job.taken)
+                      for client, queue in self._queues.items()}
+            return {
+                'active_clients': len(self._active),
+                'queued_jobs': sum(queued.values()),
+                'longest_queue': max(queued.values(), default=0),
+                'clients_served': len(self._served),
+            }
+
+
+class ScrapeQuota:
+    """
+    Per-client token buckets of upstream fetches.
+
+    Args:
+        per_minute (float): Fetches a client may cause per minute, on average.
+        burst (float, optional): Bucket size. Defaults to one minute's worth.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.per_minute = per_minute
+        self.burst = burst if burst is not None else per_minute
+        self._lock = threading.Lock()
+        self._buckets = {}  # client -> (tokens, last refill)
+        self._denied = 0
+
+    def take(self, client: Hashable, wanted: int) -> int:
+        """
+        Charge up to `wanted` fetches to a client.
+
+        Returns:
+            int: How many of them the client may make now.
+        """
+        if wanted <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.per_minute / 60)
+            allowed = min(wanted, int(tokens))
+            self._buckets[client] = (tokens - allowed, now)
+            self._denied += wanted - allowed
+            # Full buckets carry no information; drop them so idle clients don't pile up
+            if len(self._buckets) > 4096:
+                self._buckets = {key: value for key, value in self._buckets.items()
+                                 if value[0] + (now - value[1]) * self.per_minute / 60 < self.burst}
+            return allowed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'per_minute': self.per_minute,
+                'burst': self.burst,
+                'clients': len(self._buckets),
+                'denied': self._denied,
+            }
+
+
+class RateLimiter:
+    """
+    Token bucket spacing fetches across threads to at most `per_second` on average.
+
+    A caller takes a token, or reserves the next one to come, under the lock and
+    sleeps for it outside the lock, so waiting callers start one token apart.
+
+    Args:
+        per_second (float): Fetches per second, on average.
+        burst (float, optional): Bucket size: fetches that may start at once after a pause.
+    """
+
+    def __init__(self, per_second: float, burst: float = 1.0):
+        self.per_second = per_second
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._waited = 0.0
+
+    def wait(self) -> float:
+        """
+        Block until the caller may fetch.
+
+        Returns:
+            float: Seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.per_second)
+            self._last = now
+            # Below zero, the tokens are reserved by callers still waiting
+            self._tokens -= 1
+            wait = -self._tokens / self.per_second if self._tokens < 0 else 0.0
+            self._waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'per_second': self.per_second,
+                'burst': self.burst,
+                'waited': self._waited,
+            }
@@ -0,0 +1,361 @@
+"""
+Append-only tick history of every scraped quote.
+
+Each successful scrape is recorded as a fixed-size 24-byte record of
+timestamp, price and previous close (three little-endian doubles, NaN when
+the previous close is unknown). Records are kept per ticker in one file per
+UTC day:
+
+    <directory>/2025-04-25/AAPL.ticks
+
+so a day of one ticker's history is a single contiguous file that loads with
+one mmap, and retention drops whole day directories.
+
+record() only appends a tuple to an in-memory queue; a writer thread groups
+the queued records by file every `flush_interval` seconds and appends each
+group with one write. Records reach the files (and readers) within a flush
+interval. A record cut short by a crash or a full disk mid-write is ignored
+on read, and cut off by the next writer to touch the segment before it
+appends, so the records after it stay aligned.
+
+Only one process should write a directory. The web workers open it read-only
+when the scraper daemon records the ticks (configure(read_only=True)).
+
+History is on by default in the app and the scraper daemon, under
+instance/history. Environment:
+    STONX_HISTORY                 '0' to turn recording off
+    STONX_HISTORY_DIR             Directory of the day segments
+    STONX_HISTORY_RETENTION_DAYS  Days of history to keep (default 30, 0 keeps everything)
+"""
+
+import atexit
+import collections
+import datetime
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import metrics
+
+logger = logging.getLogger('247stonx.history')
+
+# timestamp, price, previous close
+RECORD = struct.Struct('<ddd')
+
+SEGMENT_SUFFIX = '.ticks'
+
+# Tickers are used as file names; anything else is not recorded
+_VALID_TICKER = re.compile(r'^[A-Z0-9][A-Z0-9.\-^=]{0,15}$')
+_DAY = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# The configured store, None while recording is off
+_store = None
+_store_lock = threading.Lock()
+
+
+class Tick(NamedTuple):
+    timestamp: float
+    price: float
+    previous_close: Optional[float]
+
+
+def day_of(timestamp: float) -> str:
+    """UTC day of a timestamp, as used in segment paths"""
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+class HistoryStore:
+    """
+    Per-ticker daily segments of tick records with a batched writer thread.
+
+    Args:
+        directory (str): Where the day directories live. Created if missing.
+        retention_days (int, optional): Days of history to keep; 0 keeps everything.
+        flush_interval (float, optional): Seconds between writes of the queued records.
+        max_pending (int, optional): Queued records beyond which new ones are dropped,
+            should the disk stall.
+        read_only (bool, optional): Only read the segments: no writer thread, no retention.
+    """
+
+    def __init__(self, directory: str, retention_days: int = 30, flush_interval: float = 1.0,
+                 max_pending: int = 100000, read_only: bool = False):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self._pending = collections.deque()
+        self._flush_lock = threading.Lock()
+        # Day -> tickers whose segment this writer has checked for a partial record
+        self._known_days = {}
+        self._stop = threading.Event()
+        self._stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'flushes': 0, 'bytes_written': 0,
+                       'days_removed': 0}
+        self._last_retention = None
+        self._writer = None
+        if not read_only:
+            self._writer = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._writer.start()
+
+    def record(self, ticker: str, timestamp: float, price: float, previous_close: Optional[float]):
+        """Queue one tick for the writer thread"""
+        if self.read_only:
+            raise RuntimeError("Cannot record into a read-only history store")
+        if len(self._pending) >= self.max_pending:
+            self._stats['dropped'] += 1
+            metrics.HISTORY_RECORDS.labels('dropped').inc()
+            return
+        self._pending.append((ticker, timestamp, price, previous_close))
+        self._stats['recorded'] += 1
+
+    def _segment_path(self, ticker: str, day: str) -> str:
+        return os.path.join(self.directory, day, ticker + SEGMENT_SUFFIX)
+
+    def flush(self) -> int:
+        """
+        Write every queued record, one append per segment.
+
+        Returns:
+            int: Records written.
+        """
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._pending.popleft())
+                except IndexError:
+                    break
+            if not batch:
+                return 0
+
+            segments = {}
+            for ticker, timestamp, price, previous_close in batch:
+                packed = RECORD.pack(timestamp, price, math.nan if previous_close is None else previous_close)
+                segments.setdefault((day_of(timestamp), ticker), []).append(packed)
+
+            written = 0
+            size = 0
+            for (day, ticker), records in segments.items():
+                if day not in self._known_days:
+                    os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+                    self._known_days[day] = set()
+                data = b''.join(records)
+                try:
+                    with open(self._segment_path(ticker, day), 'ab') as f:
+                        if ticker not in self._known_days[day]:
+                            self._trim_partial_record(f, ticker, day)
+                            self._known_days[day].add(ticker)
+                        f.write(data)
+                except OSError as e:
+                    logger.error("Could not write %d ticks of %s: %s", len(records), ticker, e)
+                    # The failed write may have left part of a record; check again next time
+                    self._known_days[day].discard(ticker)
+                    self._stats['dropped'] += len(records)
+                    metrics.HISTORY_RECORDS.labels('dropped').inc(len(records))
+                    continue
+                written += len(records)
+                size += len(data)
+
+            self._stats['written'] += written
+            self._stats['bytes_written'] += size
+            self._stats['flushes'] += 1
+            metrics.HISTORY_RECORDS.labels('written').inc(written)
+            logger.debug("Wrote %d ticks to %d segments", written, len(segments))
+            return written
+
+    def _trim_partial_record(self, f, ticker: str, day: str):
+        """Cut a partial record off the end of a segment opened for appending"""
+        size = os.fstat(f.fileno()).st_size
+        partial = size % RECORD.size
+        if partial:
+            os.ftruncate(f.fileno(), size - partial)
+            logger.warning("Cut a partial %d-byte tick record off %s on %s", partial, ticker, day)
+
+    def days(self) -> List[str]:
+        """Days with history, oldest first"""
+        try:
+            return sorted(name for name in os.listdir(self.directory) if _DAY.match(name))
+        except FileNotFoundError:
+            return []
+
+    def tickers(self, day: str) -> List[str]:
+        """Tickers with history on a day, sorted"""
+        if not _DAY.match(day):
+            return []
+        try:
+            names = os.listdir(os.path.join(self.directory, day))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len(SEGMENT_SUFFIX)] for name in names if name.endswith(SEGMENT_SUFFIX))
+
+    def apply_retention(self, now: Optional[float] = None) -> int:
+        """
+        Remove day directories older than retention_days.
+
+        Returns:
+            int: Days removed.
+        """
+        if not self.retention_days:
+            return 0
+        cutoff = day_of((now if now is not None else time.time()) - self.retention_days * 86400)
+        removed = 0
+        for day in self.days():
+            if day >= cutoff:
+                break
+            shutil.rmtree(os.path.join(self.directory, day), ignore_errors=True)
+            self._known_days.pop(day, None)
+            removed += 1
+        if removed:
+            self._stats['days_removed'] += removed
+            logger.info("Removed %d days of tick history older than %s", removed, cutoff)
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                # Retention is checked hourly; it only ever removes whole days
+                if self._last_retention is None or time.monotonic() - self._last_retention >= 3600:
+                    self._last_retention = time.monotonic()
+                    self.apply_retention()
+            except Exception:
+                logger.exception("Tick history writer failed")
+
+    def close(self):
+        """Stop the writer thread and write what is still queued"""
+        if self._writer is None:
+            return
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+
+    def map_day(self, ticker: str, day: str) -> Optional[mmap.mmap]:
+        """
+        Memory-map a day segment read-only.
+
+        The caller closes the map. Its length may include a partial record at the
+        end; use whole RECORD.size chunks only.
+
+        Returns:
+            mmap.mmap: The segment, or None if the ticker has no ticks that day.
+        """
+        if not _VALID_TICKER.match(ticker) or not _DAY.match(day):
+            return None
+        try:
+            with open(self._segment_path(ticker, day), 'rb') as f:
+                if os.fstat(f.fileno()).st_size < RECORD.size:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def iter_day(self, ticker: str, day: str) -> Iterator[Tick]:
+        """
+        Ticks of one ticker on one UTC day, in recording order, unpacked straight from the map.
+
+        Nothing is copied, so a day of any size streams in constant memory. The map
+        stays open until the iterator is exhausted or closed.
+        """
+        segment = self.map_day(ticker, day)
+        if segment is None:
+            return
+        with segment:
+            usable = len(segment) - len(segment) % RECORD.size
+            records = RECORD.iter_unpack(memoryview(segment)[:usable])
+            try:
+                for timestamp, price, previous_close in records:
+                    yield Tick(timestamp, price, None if math.isnan(previous_close) else previous_close)
+            finally:
+                # Release the view of the map before it is closed
+                del records
+
+    def read_day(self, ticker: str, day: str) -> List[Tick]:
+        """Ticks of one ticker on one UTC day, in recording order"""
+        return list(self.iter_day(ticker, day))
+
+    def iter_ticks(self, ticker: str, start: float, end: float) -> Iterator[Tick]:
+        """Ticks of a ticker with start <= timestamp < end, day by day"""
+        day = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).date()
+        last = datetime.datetime.fromtimestamp(end, datetime.timezone.utc).date()
+        while day <= last:
+            for tick in self.iter_day(ticker, day.isoformat()):
+                if start <= tick.timestamp < end:
+                    yield tick
+            day += datetime.timedelta(days=1)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            'directory': self.directory,
+            'retention_days': self.retention_days,
+            'pending': len(self._pending),
+        })
+        return stats
+
+
+def configure(directory: Optional[str], retention_days: int = 30, flush_interval: float = 1.0,
+              read_only: bool = False):
+    """
+    Record ticks under `directory`, or stop recording if None.
+
+    With read_only, only read the ticks another process records there: record()
+    does nothing and no writer thread or retention runs.
+
+    Replaces any existing store after writing its queued records.
+    """
+    global _store
+    with _store_lock:
+        old = _store
+        _store = HistoryStore(directory, retention_days, flush_interval, read_only=read_only) if directory else None
+    if old is not None:
+        old.close()
+
+
+def configure_from_env(default_directory: str, read_only: bool = False):
+    """
+    Record ticks unless STONX_HISTORY=0, under STONX_HISTORY_DIR or default_directory.
+
+    Args:
+        default_directory (str): Directory used when STONX_HISTORY_DIR is not set.
+        read_only (bool, optional): Only read the history, which another process records.
+    """
+    if os.environ.get('STONX_HISTORY', '1') == '0':
+        configure(None)
+        return
+    directory = os.environ.get('STONX_HISTORY_DIR') or default_directory
+    retention = int(os.environ.get('STONX_HISTORY_RETENTION_DAYS', '30') or 0)
+    configure(directory, retention, read_only=read_only)
+
+
+def get_store() -> Optional[HistoryStore]:
+    """The configured store, or None while recording is off"""
+    return _store
+
+
+def record(ticker: str, timestamp: float, price: float, previous_close: Optional[float]):
+    """Queue a tick if recording is on. Cheap enough for every scrape."""
+    store = _store
+    if store is not None and not store.read_only and _VALID_TICKER.match(ticker):
+        store.record(ticker, timestamp, price, previous_close)
+
+
+def stats() -> Optional[Dict[str, Any]]:
+    """Store statistics, or None while recording is off"""
+    store = _store
+    return store.stats() if store is not None else None
+
+
+@atexit.register
+def _close():
+    store = _store
+    if store is not None:
+        store.close()
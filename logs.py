@@ -0,0 +1,124 @@
+"""
+Logging setup for the app and the scraper.
+
+Log calls never wait on I/O: configure_logging() installs a QueueHandler on
+the root logger, and a QueueListener thread writes the records to stderr.
+Messages use %-style arguments, so nothing is formatted unless the level is
+enabled, and per-step scraper details are logged at DEBUG.
+
+Structured events carry their fields in the record (see event()). They are
+rendered as key=value pairs after the message, or as one JSON object per line
+with STONX_LOG_FORMAT=json.
+
+Environment:
+    STONX_LOG_LEVEL   Root log level (default INFO)
+    STONX_LOG_FORMAT  'text' (default) or 'json'
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+from typing import Optional
+
+# Record attribute holding the fields of a structured event
+FIELDS_ATTR = 'fields'
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+def event(logger: logging.Logger, level: int, name: str, **fields):
+    """
+    Log a structured event with its fields, if the level is enabled.
+
+    Args:
+        logger (logging.Logger): Logger to log to.
+        level (int): Log level, e.g. logging.INFO.
+        name (str): Event name, used as the message.
+        **fields: Event fields, rendered as key=value pairs or JSON keys.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra={FIELDS_ATTR: fields})
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatter that appends the fields of structured events.
+
+    Args:
+        json_lines (bool, optional): Emit one JSON object per record instead of text.
+    """
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__(TEXT_FORMAT)
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, FIELDS_ATTR, None)
+        if self.json_lines:
+            data = {
+                'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            if fields:
+                data.update(fields)
+            if record.exc_info:
+                data['exception'] = self.formatException(record.exc_info)
+            return json.dumps(data, default=str)
+
+        message = super().format(record)
+        if fields:
+            message += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items() if value is not None)
+        return message
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None):
+    """
+    Route all logging through a queue to a background writer thread.
+
+    Safe to call more than once; later calls only change the level and format.
+
+    Args:
+        level (str, optional): Log level name. Defaults to STONX_LOG_LEVEL or INFO.
+        fmt (str, optional): 'text' or 'json'. Defaults to STONX_LOG_FORMAT or text.
+        stream (optional): Where records are written. Defaults to stderr.
+    """
+    global _listener
+    level = (level or os.environ.get('STONX_LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('STONX_LOG_FORMAT', 'text')
+
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(StructuredFormatter(json_lines=fmt == 'json'))
+
+    records = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,331 @@
+"""
+Lightweight metrics in the Prometheus text exposition format.
+
+Counters, gauges and fixed-bucket histograms, cheap enough to update on every
+scrape and request: an observation is a bisect into the bucket bounds and two
+additions under a per-series lock. REGISTRY.render() produces the text served
+at /metrics.
+
+Metrics are per process. When the app runs under several gunicorn workers,
+each worker exposes its own values.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds, from 5ms to 30s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for a metric family: one series per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        if not self.labelnames:
+            self._series[()] = self._new_series()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Get the series for the given label values, creating it on first use"""
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterSeries:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing count. Names should end in _total."""
+
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the unlabelled series"""
+        self._series[()].inc(amount)
+
+    def _samples(self):
+        return [(self.name, _format_labels(self.labelnames, key), series.value)
+                for key, series in list(self._series.items())]
+
+
+class _GaugeSeries:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from function() whenever the metrics are rendered"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, either set directly or read from a callback"""
+
+    kind = 'gauge'
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def set(self, value: float):
+        """Set the unlabelled series"""
+        self._series[()].set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the unlabelled series from function() at render time"""
+        self._series[()].set_function(function)
+
+    def _samples(self):
+        return [(self.name, _format_labels(self.labelnames, key), series.get())
+                for key, series in list(self._series.items())]
+
+
+class _HistogramSeries:
+    __slots__ = ('_lock', '_bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        # One count per bucket plus the +Inf bucket; cumulated at render time
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in fixed buckets.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (Sequence[str], optional): Label names.
+        buckets (Sequence[float], optional): Upper bounds of the buckets, in increasing order.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.bounds)
+
+    def observe(self, value: float):
+        """Observe a value in the unlabelled series"""
+        self._series[()].observe(value)
+
+    def _samples(self):
+        samples = []
+        for key, series in list(self._series.items()):
+            counts, total = series.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """A set of metrics rendered together"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Content-Type of REGISTRY.render() output
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Create a counter in the default registry"""
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    """Create a gauge in the default registry"""
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Create a histogram in the default registry"""
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Metrics shared by the scraper and the app
+
+SCRAPE_DURATION = histogram(
+    'stonx_scrape_duration_seconds',
+    'Time to scrape one ticker, excluding the human-like delay, by the strategy that succeeded',
+    ['strategy'])
+
+UPSTREAM_RESPONSES = counter(
+    'stonx_upstream_responses_total',
+    'Responses from upstream by endpoint and status code ("error" when no response arrived)',
+    ['endpoint', 'status'])
+
+CACHE_LOOKUPS = counter(
+    'stonx_cache_lookups_total',
+    'Quote cache lookups by result (hit or miss)',
+    ['result'])
+
+CACHE_HIT_RATIO = gauge(
+    'stonx_cache_hit_ratio',
+    'Fraction of quote cache lookups that were hits since the stats were last reset')
+
+CACHE_SIZE = gauge(
+    'stonx_cache_size',
+    'Quotes in the cache')
+
+QUEUE_WAIT = histogram(
+    'stonx_queue_wait_seconds',
+    'Time spent waiting before work started, by queue (executor or parse)',
+    ['queue'])
+
+HEDGES = counter(
+    'stonx_hedged_requests_total',
+    'Hedged quote-API requests for slow page fetches, by outcome (fired, won, no_budget)',
+    ['outcome'])
+
+QUOTA_DENIED = counter(
+    'stonx_scrape_quota_denied_total',
+    'Uncached fetches refused because the client was over its scrape quota')
+
+HISTORY_RECORDS = counter(
+    'stonx_history_records_total',
+    'Ticks for the history store by result (written, or dropped when the queue was full or a write failed)',
+    ['result'])
+
+ALERTS_FIRED = counter(
+    'stonx_alerts_fired_total',
+    'Price alerts fired and delivered by this process, by kind (above, below or move)',
+    ['kind'])
+
+ALERTS_ACTIVE = gauge(
+    'stonx_alerts_active',
+    'Price alerts waiting to fire, as last loaded from the database')
+
+APP_CACHE_LOOKUPS = counter(
+    'stonx_app_cache_lookups_total',
+    'Lookups in the in-process user and watchlist caches, by cache and result (hit or miss)',
+    ['cache', 'result'])
+
+APP_CACHE_HIT_RATIO = gauge(
+    'stonx_app_cache_hit_ratio',
+    'Fraction of lookups in an in-process cache that were hits since the process started',
+    ['cache'])
+
+APP_CACHE_SIZE = gauge(
+    'stonx_app_cache_size',
+    'Entries in an in-process cache',
+    ['cache'])
+
+REQUEST_DURATION = histogram(
+    'stonx_http_request_duration_seconds',
+    'Time to handle an HTTP request, by Flask endpoint, method and status code',
+    ['endpoint', 'method', 'status'])
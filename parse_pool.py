@@ -0,0 +1,182 @@
+"""
+Process pool for the CPU-bound part of scraping.
+
+lxml, BeautifulSoup and json.loads hold the GIL while they parse a page, so
+once downloads overlap, extra ThreadedScraper workers mostly wait for each
+other. With a parse pool configured, scraping becomes a two-stage pipeline:
+the worker threads only do network I/O and hand the raw page bytes to a pool
+of processes, which run the page strategies (html, json) and send back the
+filled-in Quote, a few hundred bytes.
+
+The hand-off is bounded: at most `max_pending` pages are queued or being
+parsed at once, and a thread with another page waits for a slot (the wait is
+observed as stonx_queue_wait_seconds{queue="parse"}). This keeps memory flat
+when downloads outpace parsing.
+
+The pool is off by default. Set STONX_PARSE_PROCESSES to the number of
+processes, or call configure(). Processes are started with the 'spawn'
+method on first use, so they never inherit the app's threads or locks.
+
+A spawned process imports the parent's main script again, as __mp_main__,
+before it takes any job (forkserver children do the same). A script that can
+own a parse pool must therefore keep its side effects out of that import:
+app.py starts logging, history, the database upgrade and the alert engine in
+init_app(), which it skips under __mp_main__, and the other entry points
+(scraper_service.py, batch.py) only act under `if __name__ == '__main__'`.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from quote import Quote
+
+# The configured pool, None while pages are parsed inline on the scraper threads
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parse_job(ticker: str, page: bytes, encoding: Optional[str], strategies: List[str],
+               quote: Quote) -> Tuple[Quote, List[Tuple[str, float, float, Dict[str, Any]]], float]:
+    """
+    Run page strategies on a page, in a pool process.
+
+    Strategies run in order until one completes the quote, like scrape_quote()
+    does inline.
+
+    Returns:
+        tuple: (quote, outcomes, total) where outcomes holds one
+        (strategy, offset, elapsed, info) tuple per strategy tried, offset being
+        seconds from the start of the job, and total is the job's run time.
+    """
+    import scraper
+
+    start = time.perf_counter()
+    text = page.decode(encoding or 'utf-8', errors='replace')
+    outcomes = []
+    for strategy in strategies:
+        began = time.perf_counter()
+        info = {'ok': False}
+        try:
+            info['ok'] = scraper._extract(strategy, ticker, None, text, quote)
+        except Exception as e:
+            info['error'] = str(e)
+        if not info['ok']:
+            info['missing'] = quote.missing_fields()
+        outcomes.append((strategy, began - start, time.perf_counter() - began, info))
+        if info['ok']:
+            break
+    return quote, outcomes, time.perf_counter() - start
+
+
+class ParsePool:
+    """
+    Bounded hand-off of pages to a pool of parser processes.
+
+    Args:
+        processes (int): Number of parser processes.
+        max_pending (int, optional): Pages queued or in progress at once. Defaults to twice the processes.
+    """
+
+    def __init__(self, processes: int, max_pending: Optional[int] = None):
+        self.processes = processes
+        self.max_pending = max_pending or processes * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ProcessPoolExecutor(max_workers=processes,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        self._stats_lock = threading.Lock()
+        self._jobs = 0
+        self._in_flight = 0
+        self._queue_wait = 0.0
+        self._parse_time = 0.0
+
+    def parse(self, ticker: str, page: bytes, encoding: Optional[str], strategies: List[str],
+              quote: Quote) -> Tuple[Quote, List[Tuple[str, float, float, Dict[str, Any]]], float]:
+        """
+        Parse a page in a pool process, waiting for a free slot first.
+
+        Args:
+            ticker (str): Ticker the page belongs to.
+            page (bytes): Raw page body.
+            encoding (str, optional): Charset of the page.
+            strategies (List[str]): Page strategies to try, in order.
+            quote (Quote): Quote filled in so far.
+
+        Returns:
+            tuple: (quote, outcomes, end) where quote is the filled-in copy, outcomes
+            holds (strategy, start, elapsed, info) with start as a time.perf_counter()
+            value of this process, and end is when the result arrived.
+        """
+        waited = time.perf_counter()
+        self._slots.acquire()
+        submitted = time.perf_counter()
+        metrics.QUEUE_WAIT.labels('parse').observe(submitted - waited)
+        with self._stats_lock:
+            self._in_flight += 1
+            self._queue_wait += submitted - waited
+        try:
+            quote, outcomes, total = self._executor.submit(
+                _parse_job, ticker, page, encoding, strategies, quote).result()
+        finally:
+            self._slots.release()
+            with self._stats_lock:
+                self._in_flight -= 1
+        end = time.perf_counter()
+        with self._stats_lock:
+            self._jobs += 1
+            self._parse_time += total
+        # The job's clock is not ours; place its spans so the job ends when the result arrived
+        job_start = end - total
+        return quote, [(strategy, job_start + offset, elapsed, info)
+                       for strategy, offset, elapsed, info in outcomes], end
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'processes': self.processes,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'jobs': self._jobs,
+                'average_queue_wait_ms': self._queue_wait / self._jobs * 1000 if self._jobs else 0,
+                'average_parse_ms': self._parse_time / self._jobs * 1000 if self._jobs else 0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def configure(processes: int, max_pending: Optional[int] = None):
+    """
+    Parse pages in `processes` processes, or inline on the scraper threads if 0.
+
+    Replaces any existing pool; its processes exit once their current jobs finish.
+    """
+    global _pool
+    with _pool_lock:
+        old = _pool
+        _pool = ParsePool(processes, max_pending) if processes > 0 else None
+    if old is not None:
+        old.shutdown()
+
+
+def get_pool() -> Optional[ParsePool]:
+    """The configured pool, or None when pages are parsed inline"""
+    return _pool
+
+
+def stats() -> Optional[Dict[str, Any]]:
+    """Pool statistics, or None when pages are parsed inline"""
+    pool = _pool
+    return pool.stats() if pool is not None else None
+
+
+def configure_from_env():
+    """Start a parse pool if STONX_PARSE_PROCESSES is set"""
+    processes = int(os.environ.get('STONX_PARSE_PROCESSES', '0') or 0)
+    if processes > 0:
+        pending = os.environ.get('STONX_PARSE_MAX_PENDING')
+        configure(processes, int(pending) if pending else None)
@@ -0,0 +1,130 @@
+"""
+Pre-encoded JSON payloads for the bulk stock data endpoint.
+
+Quotes are encoded once, when they enter the scraper cache, instead of on
+every request. Each cached quote keeps its ``"TICKER":{...}`` JSON member as
+bytes and, optionally, the same bytes as a raw deflate fragment. Responses
+are then assembled by concatenating those fragments:
+
+- Plain JSON: ``{`` + members joined by ``,`` + ``"metadata":{...}`` + ``}``
+- Gzip: every fragment is compressed by a fresh compressor and flushed with
+  ``Z_SYNC_FLUSH``, so it ends on a byte boundary and never refers back to
+  earlier data. Fragments can therefore be concatenated into one valid
+  deflate stream, which only needs a gzip header, a final empty block and
+  the CRC32/size trailer.
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, Optional
+
+# Fixed gzip header: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# Compression level for cached fragments. They are compressed once per scrape,
+# so we can afford a better ratio than we would for per-request compression.
+FRAGMENT_COMPRESSION_LEVEL = 6
+
+
+def deflate_fragment(data: bytes, level: int = FRAGMENT_COMPRESSION_LEVEL) -> bytes:
+    """Compress data into a self-contained, byte-aligned raw deflate fragment."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _final_block() -> bytes:
+    """An empty final deflate block that terminates a concatenated stream."""
+    return zlib.compressobj(0, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+
+
+# Framing fragments used by every response
+OPEN_BRACE = b'{'
+CLOSE_BRACE = b'}'
+COMMA = b','
+DEFLATED_OPEN_BRACE = deflate_fragment(OPEN_BRACE)
+DEFLATED_CLOSE_BRACE = deflate_fragment(CLOSE_BRACE)
+DEFLATED_COMMA = deflate_fragment(COMMA)
+FINAL_BLOCK = _final_block()
+
+
+def encode_json(data: Any) -> bytes:
+    """Encode a value as compact JSON bytes."""
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+class EncodedQuote:
+    """
+    A quote's JSON member, encoded once when the quote is cached.
+
+    Attributes:
+        member (bytes): The ``"TICKER":{...}`` JSON member.
+        deflated (bytes, optional): The member as a raw deflate fragment,
+            present only when the scraper was created with ``precompress=True``.
+    """
+
+    __slots__ = ('member', 'deflated')
+
+    def __init__(self, ticker: str, data: Dict[str, Any], precompress: bool = False):
+        self.member = encode_json(ticker) + b':' + encode_json(data)
+        self.deflated = deflate_fragment(self.member) if precompress else None
+
+
+def assemble_json(members: List[bytes], metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Build a bulk response body from pre-encoded quote members.
+
+    Args:
+        members (List[bytes]): ``"TICKER":{...}`` members, already encoded.
+        metadata (dict, optional): Per-request metadata, appended as ``"metadata"``.
+
+    Returns:
+        bytes: The complete JSON document.
+    """
+    if metadata is not None:
+        members = members + [b'"metadata":' + encode_json(metadata)]
+    return OPEN_BRACE + COMMA.join(members) + CLOSE_BRACE
+
+
+def assemble_gzip(quotes: List[EncodedQuote], metadata: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Build a gzip-encoded bulk response body from pre-deflated quote members.
+
+    Only the metadata member is compressed per request. Every quote must have
+    been encoded with ``precompress=True``.
+
+    Args:
+        quotes (List[EncodedQuote]): Pre-encoded quotes with deflate fragments.
+        metadata (dict, optional): Per-request metadata, appended as ``"metadata"``.
+
+    Returns:
+        bytes: A single-member gzip stream that decodes to the JSON document.
+    """
+    raw_members = [quote.member for quote in quotes]
+    deflated_members = [quote.deflated for quote in quotes]
+    if metadata is not None:
+        metadata_member = b'"metadata":' + encode_json(metadata)
+        raw_members.append(metadata_member)
+        deflated_members.append(deflate_fragment(metadata_member, level=1))
+
+    # The trailer needs the CRC32 and length of the uncompressed document.
+    # CRC32 is far cheaper than compression, so compute it over the raw bytes.
+    crc = zlib.crc32(OPEN_BRACE)
+    size = len(OPEN_BRACE) + len(CLOSE_BRACE)
+    for index, member in enumerate(raw_members):
+        if index:
+            crc = zlib.crc32(COMMA, crc)
+            size += len(COMMA)
+        crc = zlib.crc32(member, crc)
+        size += len(member)
+    crc = zlib.crc32(CLOSE_BRACE, crc)
+
+    body = [GZIP_HEADER, DEFLATED_OPEN_BRACE]
+    for index, fragment in enumerate(deflated_members):
+        if index:
+            body.append(DEFLATED_COMMA)
+        body.append(fragment)
+    body.append(DEFLATED_CLOSE_BRACE)
+    body.append(FINAL_BLOCK)
+    body.append(struct.pack('<II', crc & 0xffffffff, size & 0xffffffff))
+    return b''.join(body)
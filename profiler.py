@@ -0,0 +1,250 @@
+"""
+On-demand sampling profiler.
+
+A background thread reads the stack of every thread with sys._current_frames()
+at a fixed interval and counts identical stacks, so request threads and the
+scraper's worker threads are profiled together without instrumenting them.
+Sampling runs for a time window, optionally only for requests whose path
+matches a prefix. Results are exported as collapsed stacks (one
+"frame;frame;frame count" line per stack, the input of flamegraph.pl and
+speedscope) or as a self-contained SVG flame graph.
+
+Nothing runs while the profiler is off: there is no sampler thread and the
+request hooks only check the module-level `active` flag.
+"""
+
+import html
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Whether a profile is being recorded; checked by the app's request hooks
+active = False
+
+MAX_DURATION = 600
+MAX_DEPTH = 128
+
+_lock = threading.Lock()
+_session = None
+
+# Threads serving requests that match the path filter
+_tracked_threads = set()
+
+# Thread names without their counters, so stacks from pool threads aggregate
+_THREAD_NUMBER = re.compile(r'[-_]\d+')
+
+
+def _thread_group(name: str) -> str:
+    return _THREAD_NUMBER.sub('', name)
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    One profiling run.
+
+    Args:
+        duration (float): Seconds to sample for.
+        interval (float): Seconds between samples.
+        path_prefix (str, optional): Only sample requests whose path starts with this,
+            plus the scraper worker threads while such a request is in flight.
+    """
+
+    def __init__(self, duration: float, interval: float, path_prefix: Optional[str] = None):
+        self.duration = duration
+        self.interval = interval
+        self.path_prefix = path_prefix
+        self.started_at = time.time()
+        self.stopped_at = None
+        self.samples = 0
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self.stopped_at is None
+
+    def _wanted(self, ident: int, name: str) -> bool:
+        if self.path_prefix is None:
+            return True
+        if ident in _tracked_threads:
+            return True
+        # Worker threads of ThreadedScraper run on behalf of the tracked request
+        return bool(_tracked_threads) and name.startswith(('scraper-worker', 'ThreadPoolExecutor'))
+
+    def _sample(self, own_ident: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            name = names.get(ident, 'unknown')
+            if not self._wanted(ident, name):
+                continue
+            codes = []
+            while frame is not None and len(codes) < MAX_DEPTH:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            self.stacks[(_thread_group(name), tuple(codes))] += 1
+        self.samples += 1
+
+    def _run(self):
+        global active
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                self._sample(own_ident)
+                self._stop.wait(self.interval)
+        finally:
+            self.stopped_at = time.time()
+            with _lock:
+                if _session is self:
+                    active = False
+                    _tracked_threads.clear()
+
+    def collapsed(self) -> List[str]:
+        """Collapsed stack lines, most frequent first"""
+        merged = Counter()
+        for (group, codes), count in list(self.stacks.items()):
+            merged[';'.join([group] + [_frame_label(code) for code in codes])] += count
+        return [f"{stack} {count}" for stack, count in merged.most_common()]
+
+    def status(self) -> Dict[str, Any]:
+        end = self.stopped_at or time.time()
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'elapsed': end - self.started_at,
+            'duration': self.duration,
+            'interval_ms': self.interval * 1000,
+            'path_prefix': self.path_prefix,
+            'samples': self.samples,
+            'distinct_stacks': len(self.stacks),
+        }
+
+
+def start(duration: float = 30.0, interval: float = 0.01, path_prefix: Optional[str] = None) -> ProfileSession:
+    """
+    Start sampling, replacing the results of any previous run.
+
+    Args:
+        duration (float, optional): Seconds to sample for, at most MAX_DURATION.
+        interval (float, optional): Seconds between samples.
+        path_prefix (str, optional): Only sample requests whose path starts with this.
+
+    Raises:
+        RuntimeError: If a profile is already running.
+    """
+    global active, _session
+    with _lock:
+        if _session is not None and _session.running:
+            raise RuntimeError("A profile is already running")
+        _tracked_threads.clear()
+        _session = ProfileSession(min(max(duration, 0.1), MAX_DURATION), max(interval, 0.001), path_prefix)
+        active = True
+    _session.start()
+    return _session
+
+
+def stop() -> Optional[ProfileSession]:
+    """Stop the running profile, if any. Its results stay available."""
+    session = _session
+    if session is not None:
+        session.stop()
+    return session
+
+
+def current() -> Optional[ProfileSession]:
+    """The running or most recent profile"""
+    return _session
+
+
+def request_started(path: str):
+    """Track the current thread if the profile is filtered to paths and this one matches"""
+    session = _session
+    if session is not None and session.path_prefix is not None and path.startswith(session.path_prefix):
+        _tracked_threads.add(threading.get_ident())
+
+
+def request_finished():
+    """Stop tracking the current thread"""
+    _tracked_threads.discard(threading.get_ident())
+
+
+def flamegraph_svg(lines: List[str], title: str = 'Flame graph', width: int = 1200) -> str:
+    """
+    Render collapsed stack lines as a static SVG flame graph.
+
+    Frames are drawn root at the bottom, children ordered by name, with the
+    full frame and sample count in each rectangle's tooltip.
+    """
+    root = {'count': 0, 'children': {}}
+    for line in lines:
+        stack, _, count = line.rpartition(' ')
+        count = int(count)
+        root['count'] += count
+        node = root
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node['children'].values()), default=0)
+
+    frame_height = 16
+    top = 30
+    levels = depth(root)
+    height = top + levels * frame_height + 10
+    total = root['count'] or 1
+    rects = []
+
+    def draw(node, name, x, level):
+        node_width = node['count'] / total * width
+        if node_width < 0.5:
+            return
+        y = height - 10 - (level + 1) * frame_height
+        # Stable warm colour per frame name
+        hue = sum(map(ord, name)) % 60
+        label = html.escape(name)
+        text = label if node_width > 40 else ''
+        if text and len(name) * 6.5 > node_width:
+            text = html.escape(name[:max(int(node_width / 6.5) - 2, 0)]) + '..'
+        rects.append(
+            f'<g><title>{label} ({node["count"]} samples, {node["count"] / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{node_width:.1f}" height="{frame_height - 1}" '
+            f'fill="hsl({hue},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}">{text}</text></g>')
+        child_x = x
+        for child_name in sorted(node['children']):
+            child = node['children'][child_name]
+            draw(child, child_name, child_x, level + 1)
+            child_x += child['count'] / total * width
+
+    x = 0.0
+    for name in sorted(root['children']):
+        child = root['children'][name]
+        draw(child, name, x, 0)
+        x += child['count'] / total * width
+
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="monospace" font-size="11">'
+            f'<rect width="100%" height="100%" fill="#fff"/>'
+            f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="14">{html.escape(title)}</text>'
+            + ''.join(rects) + '</svg>')
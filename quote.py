@@ -0,0 +1,178 @@
+"""
+Compact numeric quote model.
+
+The scraper and its cache work with Quote records holding plain numbers. The
+display strings the frontend expects ("$123.45", "+1.20 (+0.98%) Today | ...")
+are only produced at the JSON edge by Quote.to_dict().
+"""
+
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+
+class MarketSession(Enum):
+    """Trading session a quote was taken in. Values are the display labels."""
+    UNKNOWN = 'Unknown'
+    REGULAR = 'Market Open'
+    CLOSED = 'Market Closed'
+    PRE_MARKET = 'Pre-market'
+    AFTER_HOURS = 'After Hours'
+    HALTED = 'Trading Halted'
+
+
+# Display label used for stale cache entries served after a failed refresh
+STALE_STATUS = 'Data may be stale'
+
+
+def format_change(amount: float, percent: float) -> str:
+    """Format a price change as '+1.20 (+0.98%)'."""
+    sign = '+' if amount >= 0 else ''
+    return f"{sign}{amount:.2f} ({sign}{percent:.2f}%)"
+
+
+class Quote:
+    """
+    A single stock quote with numeric fields.
+
+    Attributes:
+        ticker (str): The stock ticker symbol.
+        price (float, optional): Last price, extended hours price if there is one.
+        regular_price (float, optional): Last regular hours trade price.
+        extended_price (float, optional): Last extended hours trade price.
+        previous_close (float, optional): Previous regular session close.
+        change (float, optional): Regular hours change from the previous close.
+        change_percent (float, optional): Regular hours change in percent.
+        extended_change (float, optional): Extended hours change from the regular price.
+        extended_change_percent (float, optional): Extended hours change in percent.
+        session (MarketSession): Trading session the quote belongs to.
+        timestamp (float): Epoch time the quote was produced.
+        stale (bool): True when served from cache after a failed refresh.
+        error (str, optional): Error message if the quote could not be fetched.
+    """
+
+    __slots__ = (
+        'ticker', 'price', 'regular_price', 'extended_price', 'previous_close',
+        'change', 'change_percent', 'extended_change', 'extended_change_percent',
+        'session', 'timestamp', 'stale', 'error'
+    )
+
+    def __init__(self, ticker: str, price: Optional[float] = None,
+                 regular_price: Optional[float] = None, extended_price: Optional[float] = None,
+                 previous_close: Optional[float] = None, change: Optional[float] = None,
+                 change_percent: Optional[float] = None, extended_change: Optional[float] = None,
+                 extended_change_percent: Optional[float] = None,
+                 session: MarketSession = MarketSession.UNKNOWN, timestamp: Optional[float] = None,
+                 stale: bool = False, error: Optional[str] = None):
+        self.ticker = ticker
+        self.price = price
+        self.regular_price = regular_price
+        self.extended_price = extended_price
+        self.previous_close = previous_close
+        self.change = change
+        self.change_percent = change_percent
+        self.extended_change = extended_change
+        self.extended_change_percent = extended_change_percent
+        self.session = session
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.stale = stale
+        self.error = error
+
+    def __repr__(self):
+        return f"Quote({self.ticker!r}, price={self.price!r}, change={self.change!r}, session={self.session.name})"
+
+    @property
+    def is_complete(self) -> bool:
+        """True once price, change and session are all known."""
+        return self.price is not None and self.change is not None and self.session is not MarketSession.UNKNOWN
+
+    def missing_fields(self) -> List[str]:
+        """Names of the fields is_complete is still waiting for."""
+        missing = []
+        if self.price is None:
+            missing.append('price')
+        if self.change is None:
+            missing.append('change')
+        if self.session is MarketSession.UNKNOWN:
+            missing.append('session')
+        return missing
+
+    def copy(self, **changes) -> 'Quote':
+        """Return a copy of the quote with the given fields replaced."""
+        quote = Quote.__new__(Quote)
+        for name in Quote.__slots__:
+            setattr(quote, name, changes.get(name, getattr(self, name)))
+        return quote
+
+    def to_record(self) -> List[Any]:
+        """Compact list of the field values in __slots__ order, session by name, for IPC."""
+        return [getattr(self, name) if name != 'session' else self.session.name for name in Quote.__slots__]
+
+    @classmethod
+    def from_record(cls, record: List[Any]) -> 'Quote':
+        """Rebuild a quote from to_record() output."""
+        quote = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, record):
+            setattr(quote, name, MarketSession[value] if name == 'session' else value)
+        return quote
+
+    def set_price_change(self, previous_close: float):
+        """Set previous_close and compute the change of price from it."""
+        self.previous_close = previous_close
+        self.change = self.price - previous_close
+        self.change_percent = (self.change / previous_close) * 100
+
+    def set_extended_change(self, regular_price: float, extended_price: float):
+        """Set both session prices and compute the regular and extended hours changes."""
+        self.regular_price = regular_price
+        self.extended_price = extended_price
+        self.change = regular_price - self.previous_close
+        self.change_percent = (self.change / self.previous_close) * 100
+        self.extended_change = extended_price - regular_price
+        self.extended_change_percent = (self.extended_change / regular_price) * 100
+
+    def format_price(self) -> str:
+        """Display price, e.g. '$123.45', '$123.45 (cached)' or 'N/A'."""
+        if self.price is None:
+            return 'N/A'
+        return f"${self.price:.2f}{' (cached)' if self.stale else ''}"
+
+    def format_change(self) -> str:
+        """Display change, e.g. '+1.20 (+0.98%) Today | -0.10 (-0.08%) After-hours'."""
+        if self.change is None:
+            return 'N/A'
+        regular = format_change(self.change, self.change_percent)
+        if self.extended_change is not None and self.session is MarketSession.AFTER_HOURS:
+            extended = format_change(self.extended_change, self.extended_change_percent)
+            return f"{regular} Today | {extended} After-hours"
+        if self.session is MarketSession.PRE_MARKET:
+            return f"{regular} Pre-market"
+        return regular
+
+    def format_status(self) -> str:
+        """Display market status label."""
+        if self.error:
+            return 'Error'
+        if self.stale:
+            return STALE_STATUS
+        return self.session.value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serialize to the legacy display-string dictionary used by the API.
+
+        Returns:
+            Dict[str, Any]: ticker, price, change, market_status, last_updated
+            and, for failed quotes, error.
+        """
+        data = {
+            'ticker': self.ticker,
+            'price': self.format_price(),
+            'change': self.format_change(),
+            'market_status': self.format_status(),
+            'last_updated': datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if self.error:
+            data['error'] = self.error
+        return data
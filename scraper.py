@@ -1,13 +1,58 @@
 import os
-import requests
 import re
 import json
 import time
+import logging
 import pytz
 from bs4 import BeautifulSoup
 from datetime import datetime
 from lxml import html
 import random
+import threading
+import concurrent.futures
+from collections import deque
+from contextlib import contextmanager
+
+from quote import Quote, MarketSession
+from transport import get_transport
+import metrics
+import tracing
+import parse_pool
+from logs import event
+
+logger = logging.getLogger('247stonx.scraper')
+
+# Upstream base URLs. Overridable so the scraper can be pointed at a local
+# stub server (see benchmarks/stub_server.py).
+WEB_BASE_URL = os.environ.get('STONX_WEB_BASE_URL', 'https://robinhood.com')
+API_BASE_URL = os.environ.get('STONX_API_BASE_URL', 'https://api.robinhood.com')
+
+# Range of the random delay (seconds) added before each scrape to simulate human browsing
+HUMAN_DELAY_RANGE = (0.5, 2.0)
+
+# Callables notified when a scrape stage finishes, see add_stage_hook()
+_stage_hooks = []
+
+# Hedging: when the page fetch is slower than the adaptive threshold, also ask the
+# quote API and use whichever complete answer arrives first (see _fetch_page_hedged)
+HEDGE_ENABLED = os.environ.get('STONX_HEDGE', '').lower() in ('1', 'true', 'yes', 'on')
+# Hedges allowed per page fetch, averaged over time, and the largest burst
+HEDGE_BUDGET_RATIO = float(os.environ.get('STONX_HEDGE_BUDGET', '0.1'))
+HEDGE_BUDGET_BURST = 10
+
+# Instrument IDs by ticker, so the API path needs one request instead of two
+_instrument_ids = {}
+
+# Extraction strategies in their default order. html and json parse the stock page,
+# api queries the quote API and needs no page.
+STRATEGIES = ('html', 'json', 'api')
+PAGE_STRATEGIES = ('html', 'json')
+# Fraction of scrapes that try every strategy in a random order, so the statistics
+# keep up with page changes and skipped strategies get a chance to recover
+STRATEGY_EXPLORATION = float(os.environ.get('STONX_STRATEGY_EXPLORATION', '0.05'))
+
+# US equity sessions in New York time, used to split the strategy statistics
+MARKET_TIMEZONE = pytz.timezone('America/New_York')
 
 # List of realistic user agents to rotate
 USER_AGENTS = [
@@ -52,340 +97,772 @@ def get_random_headers():
     
     return headers
 
-def scrape_stock_data(ticker):
+def add_stage_hook(hook):
     """
-    Scrape stock data from Robinhood for a given ticker
-    Uses a multi-layer approach:
-    1. JSON embedded data extraction (primary method)
-    2. API fallback (if JSON fails)
-    3. Direct HTML element extraction (if both JSON and API fail)
+    Register a callable notified after every scrape stage.
+
+    The hook is called as hook(ticker, stage, start, elapsed, info) where stage
+    is one of 'delay', 'fetch', 'html', 'json', 'api' or 'scrape' (the whole
+    scrape), start is a time.perf_counter() value, elapsed is in seconds and
+    info is a dict with at least 'ok' (whether the stage succeeded). For the
+    'scrape' stage, info also has 'delay', 'order' (the strategies in the
+    order they were to be tried) and, if a strategy produced a complete
+    quote, 'strategy' ('html', 'json', 'api' or 'hedge').
+    Hooks run on the scraping thread, so they must be cheap and thread-safe.
     """
-    # URL for Robinhood stock page
-    url = f"https://robinhood.com/us/en/stocks/{ticker}/"
-    
-    # Get random headers for this request
-    headers = get_random_headers()
-    
-    # Add a random delay between 0.5 and 2 seconds to simulate human browsing
-    time.sleep(random.uniform(0.5, 2.0))
-
-    # Default return values
-    stock_data = {
-        'ticker': ticker,
-        'price': 'N/A',
-        'change': 'N/A',
-        'market_status': 'Unknown',
-        'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _stage_hooks.append(hook)
+
+def remove_stage_hook(hook):
+    """Unregister a hook added with add_stage_hook()"""
+    if hook in _stage_hooks:
+        _stage_hooks.remove(hook)
+
+@contextmanager
+def _stage(ticker, name):
+    """Time a scrape stage and report it to the stage hooks, if there are any"""
+    info = {'ok': False}
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception as e:
+        info['error'] = str(e)
+        raise
+    finally:
+        _report_stage(ticker, name, start, time.perf_counter() - start, info)
+
+def _report_stage(ticker, name, start, elapsed, info):
+    """Report a finished stage to the stage hooks"""
+    info['elapsed'] = elapsed
+    for hook in list(_stage_hooks):
+        hook(ticker, name, start, elapsed, info)
+
+def _record_scrape(ticker, stage, start, elapsed, info):
+    """
+    Stage hook feeding the scrape latency histogram, labelled by the strategy
+    that succeeded, and logging one 'scrape' event per scrape
+    """
+    if stage == 'scrape':
+        strategy = info.get('strategy') or 'none'
+        delay = info.get('delay', 0.0)
+        metrics.SCRAPE_DURATION.labels(strategy).observe(elapsed - delay)
+        event(logger, logging.INFO, 'scrape', ticker=ticker, ok=info['ok'], strategy=strategy,
+              duration_ms=round((elapsed - delay) * 1000, 1), delay_ms=round(delay * 1000, 1),
+              status=info.get('status'), bytes=info.get('bytes'), order=info.get('order'),
+              error=info.get('error'))
+
+add_stage_hook(_record_scrape)
+
+def _get(url, headers, timeout, endpoint):
+    """Fetch a URL through the active transport, counting the upstream status code"""
+    start = time.perf_counter()
+    try:
+        response = get_transport().get(url, headers=headers, timeout=timeout)
+    except Exception as e:
+        metrics.UPSTREAM_RESPONSES.labels(endpoint, 'error').inc()
+        if tracing.enabled:
+            tracing.add_span(f"http:{endpoint}", start, time.perf_counter() - start, error=str(e))
+        raise
+    metrics.UPSTREAM_RESPONSES.labels(endpoint, response.status_code).inc()
+    if tracing.enabled:
+        tracing.add_span(f"http:{endpoint}", start, time.perf_counter() - start,
+                         status=response.status_code, bytes=len(response.content),
+                         ttfb_ms=round(response.ttfb * 1000, 2),
+                         download_ms=round((response.elapsed - response.ttfb) * 1000, 2),
+                         new_connection=response.new_connection)
+    return response
+
+class LatencyTracker:
+    """
+    Recent latencies and a percentile of them, used as the hedging threshold.
+
+    Args:
+        window (int, optional): Number of recent samples kept.
+        percentile (float, optional): Percentile used as the threshold.
+        min_samples (int, optional): Samples needed before the percentile is trusted.
+        default (float, optional): Threshold until then, in seconds.
+        floor (float, optional): Lowest threshold, in seconds.
+    """
+
+    def __init__(self, window=200, percentile=90, min_samples=20, default=1.0, floor=0.05):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default = default
+        self.floor = floor
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._threshold = default
+        self._stale = 0
+
+    def observe(self, elapsed):
+        with self._lock:
+            self._samples.append(elapsed)
+            self._stale += 1
+
+    def threshold(self):
+        """The percentile of the recent samples, recomputed every 10 new samples"""
+        with self._lock:
+            if self._stale >= 10 and len(self._samples) >= self.min_samples:
+                ordered = sorted(self._samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._threshold = max(self.floor, ordered[index])
+                self._stale = 0
+            return self._threshold
+
+class HedgeBudget:
+    """
+    Token bucket bounding the extra upstream load from hedging.
+
+    Every page fetch deposits `ratio` tokens, up to `burst`; a hedge spends one.
+    With the default ratio of 0.1, at most about 10% of page fetches are hedged.
+    """
+
+    def __init__(self, ratio, burst):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+_page_latency = LatencyTracker()
+_hedge_budget = HedgeBudget(HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST)
+# Runs page fetches and hedges when hedging is enabled. A losing page fetch cannot be
+# interrupted mid-request, so it is abandoned and finishes (or times out) here.
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+def configure_hedging(enabled=True, budget_ratio=None, burst=None):
+    """Turn hedging on or off and optionally change its budget"""
+    global HEDGE_ENABLED, _hedge_budget
+    HEDGE_ENABLED = enabled
+    if budget_ratio is not None or burst is not None:
+        _hedge_budget = HedgeBudget(budget_ratio if budget_ratio is not None else _hedge_budget.ratio,
+                                    burst if burst is not None else _hedge_budget.burst)
+
+def hedge_stats():
+    """Hedging settings, current threshold and the fired/won counts"""
+    return {
+        'enabled': HEDGE_ENABLED,
+        'threshold': _page_latency.threshold(),
+        'budget_ratio': _hedge_budget.ratio,
+        'fired': metrics.HEDGES.labels('fired').value,
+        'won': metrics.HEDGES.labels('won').value,
+        'skipped_no_budget': metrics.HEDGES.labels('no_budget').value,
+        'cached_instrument_ids': len(_instrument_ids),
     }
 
+def _hedge_succeeded(future):
+    return future.done() and not future.cancelled() and future.exception() is None and future.result()
+
+def _fetch_page_hedged(ticker, url, headers):
+    """
+    Fetch the stock page, hedging with the quote API if the page is slow.
+
+    The page fetch runs on the hedge executor. If it has not returned within the
+    adaptive threshold (the p90 of recent page fetches) and the budget allows,
+    extract_from_api() runs in parallel and whichever complete answer comes
+    first is used; the other is abandoned. A page that arrives with an error
+    status does not end the wait while the hedge is still running. Both requests
+    add their spans to the caller's trace (see tracing.bind).
+
+    Returns:
+        tuple: (response, hedge_quote, outcome). response is None when the hedge
+        won, in which case hedge_quote is the complete quote. outcome is None,
+        'no_budget', 'fired' (hedged, page won) or 'won'.
+    """
+    submitted = time.perf_counter()
+    page = _hedge_executor.submit(tracing.bind(_get), url, headers, 15, 'page')
+    page.add_done_callback(lambda future: _page_latency.observe(time.perf_counter() - submitted))
+    _hedge_budget.deposit()
+
     try:
-        print(f"Scraping data for {ticker} from {url}")
-        
-        # Get the webpage content
-        response = requests.get(url, headers=headers, timeout=15)
-        
-        if response.status_code == 200:
-            html_content = response.text
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # APPROACH 1: Extract data directly from HTML elements (most reliable)
-            print("Approach 1: Extracting directly from HTML elements...")
+        return page.result(timeout=_page_latency.threshold()), None, None
+    except concurrent.futures.TimeoutError:
+        pass
+
+    if not _hedge_budget.try_spend():
+        metrics.HEDGES.labels('no_budget').inc()
+        return page.result(), None, 'no_budget'
+
+    metrics.HEDGES.labels('fired').inc()
+    hedge_quote = Quote(ticker)
+    hedge = _hedge_executor.submit(tracing.bind(extract_from_api), ticker, headers, hedge_quote)
+
+    pending = {page, hedge}
+    while pending:
+        _, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        if _hedge_succeeded(hedge):
+            page.cancel()
+            metrics.HEDGES.labels('won').inc()
+            return None, hedge_quote, 'won'
+        # A 429 or 5xx page would send the caller to the API anyway: wait for the hedge instead
+        if page.done() and page.exception() is None and page.result().status_code == 200:
+            return page.result(), None, 'fired'
+    # Neither produced an answer; return the failed page or raise its fetch's error
+    return page.result(), None, 'fired'
+
+def market_session_at(timestamp):
+    """
+    The trading session by the clock at a given time (weekends are closed, holidays are not known).
+
+    Args:
+        timestamp (float): Epoch time.
+
+    Returns:
+        MarketSession: PRE_MARKET (4:00-9:30), REGULAR (9:30-16:00), AFTER_HOURS (16:00-20:00)
+        or CLOSED, in New York time.
+    """
+    now = datetime.fromtimestamp(timestamp, MARKET_TIMEZONE)
+    if now.weekday() >= 5:
+        return MarketSession.CLOSED
+    minutes = now.hour * 60 + now.minute
+    if 4 * 60 <= minutes < 9 * 60 + 30:
+        return MarketSession.PRE_MARKET
+    if 9 * 60 + 30 <= minutes < 16 * 60:
+        return MarketSession.REGULAR
+    if 16 * 60 <= minutes < 20 * 60:
+        return MarketSession.AFTER_HOURS
+    return MarketSession.CLOSED
+
+class StrategyStats:
+    """
+    Hit rate and cost of each extraction strategy per market session, and the order derived from them.
+
+    Hit rate and cost are exponentially weighted moving averages, so a page change shows up
+    within a few dozen scrapes. A strategy's cost includes the page fetch when it was the
+    first to need the page. Strategies are ordered by hits per second of cost; ones with a
+    hit rate below `skip_below` are left out. Strategies with fewer than `min_attempts`
+    samples follow the ranked ones in their default order.
+
+    Args:
+        exploration (float, optional): Fraction of scrapes that try all strategies in a random order.
+        min_attempts (int, optional): Samples needed before a strategy is reordered or skipped.
+        skip_below (float, optional): Hit rate below which a strategy is skipped.
+        decay (float, optional): Weight of the newest sample in the moving averages.
+    """
+
+    def __init__(self, exploration=0.05, min_attempts=20, skip_below=0.02, decay=0.05):
+        self.exploration = exploration
+        self.min_attempts = min_attempts
+        self.skip_below = skip_below
+        self.decay = decay
+        self._lock = threading.Lock()
+        # (session, strategy) -> [attempts, hit rate, cost in seconds]
+        self._stats = {}
+        self._explored = 0
+        self._random = random.Random()
+
+    def record(self, session, strategy, ok, cost):
+        key = (session, strategy)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                self._stats[key] = [1, 1.0 if ok else 0.0, cost]
+                return
+            entry[0] += 1
+            entry[1] += self.decay * ((1.0 if ok else 0.0) - entry[1])
+            entry[2] += self.decay * (cost - entry[2])
+
+    def _ranked(self, session):
+        """Adaptive order for a session, or None if every strategy would be skipped"""
+        ranked = []
+        untried = []
+        for strategy in STRATEGIES:
+            entry = self._stats.get((session, strategy))
+            if entry is None or entry[0] < self.min_attempts:
+                untried.append(strategy)
+            elif entry[1] >= self.skip_below:
+                ranked.append((entry[1] / max(entry[2], 1e-6), strategy))
+        if not ranked and not untried:
+            return None
+        ranked.sort(key=lambda item: -item[0])
+        # Strategies without enough samples keep their default order after the ranked ones
+        return [strategy for _, strategy in ranked] + untried
+
+    def order(self, session):
+        """
+        Strategies to try for a scrape in the given session.
+
+        Returns:
+            tuple: (list of strategy names, True if this is an exploration scrape)
+        """
+        with self._lock:
+            if self.exploration > 0 and self._random.random() < self.exploration:
+                self._explored += 1
+                order = list(STRATEGIES)
+                self._random.shuffle(order)
+                return order, True
+            return self._ranked(session) or list(STRATEGIES), False
+
+    def snapshot(self):
+        """Current order and per-strategy statistics by session"""
+        with self._lock:
+            sessions = {}
+            for (session, strategy), (attempts, hit_rate, cost) in sorted(self._stats.items()):
+                sessions.setdefault(session, {'order': None, 'strategies': {}})['strategies'][strategy] = {
+                    'attempts': attempts,
+                    'hit_rate': round(hit_rate, 4),
+                    'average_cost_ms': round(cost * 1000, 2),
+                    'skipped': attempts >= self.min_attempts and hit_rate < self.skip_below,
+                }
+            for session, data in sessions.items():
+                data['order'] = self._ranked(session) or list(STRATEGIES)
+            return {
+                'exploration_rate': self.exploration,
+                'exploration_scrapes': self._explored,
+                'sessions': sessions,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._explored = 0
+
+_strategy_stats = StrategyStats(STRATEGY_EXPLORATION)
+
+def strategy_stats():
+    """Per-session strategy order, hit rates and costs"""
+    return _strategy_stats.snapshot()
+
+def reset_strategy_stats():
+    """Forget the strategy statistics and go back to the default order"""
+    _strategy_stats.reset()
+
+def _parse_amount(text):
+    """Parse a change amount such as '+$25.36' or '-1.20' into a float"""
+    return float(text.replace('$', ''))
+
+def extract_from_html(html_content, quote):
+    """
+    APPROACH 1: Extract data directly from HTML elements (most reliable).
+    Fills in the given quote and returns True if it is complete.
+    """
+    # Parse HTML using lxml for XPath support
+    tree = html.fromstring(html_content)
+
+    # Extract price using provided selectors
+    # CSS: #sdp-market-price
+    # XPath: //*[@id="sdp-market-price"]
+    price_element = tree.xpath('//*[@id="sdp-market-price"]')
+    if price_element:
+        price_text = price_element[0].text_content().strip()
+        price_match = re.search(r'\$?(\d+\.\d+)', price_text)
+        if price_match:
+            quote.price = float(price_match.group(1))
+            logger.debug("Extracted price from HTML: %.2f", quote.price)
+
+    # Extract price change using provided selectors
+    # CSS: #sdp-price-chart-price-change
+    # XPath: //*[@id="sdp-price-chart-price-change"]
+    change_element = tree.xpath('//*[@id="sdp-price-chart-price-change"]')
+    if change_element:
+        change_text = change_element[0].text_content().strip()
+        lower_text = change_text.lower()
+        logger.debug("Raw change text: %s", change_text)
+
+        # Extract regular hours change
+        # Try to find patterns like "+$25.36 (+9.77%) Today"
+        reg_hours_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)\s*Today', change_text)
+
+        # Extract after hours change
+        # Try to find patterns like "+$0.22 (+0.08%) After-hours"
+        after_hours_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)\s*After-?hours', change_text)
+
+        # Process matches into numeric changes
+        if reg_hours_match and after_hours_match:
+            # We have both regular and after-hours changes
+            quote.change = _parse_amount(reg_hours_match.group(1))
+            quote.change_percent = float(reg_hours_match.group(2))
+            quote.extended_change = _parse_amount(after_hours_match.group(1))
+            quote.extended_change_percent = float(after_hours_match.group(2))
+
+            # Also set market status to After Hours
+            quote.session = MarketSession.AFTER_HOURS
+        elif reg_hours_match:
+            # Only regular hours change
+            quote.change = _parse_amount(reg_hours_match.group(1))
+            quote.change_percent = float(reg_hours_match.group(2))
+
+            # Check if market is still open
+            if "closed" in lower_text:
+                quote.session = MarketSession.CLOSED
+            else:
+                quote.session = MarketSession.REGULAR
+        elif "pre-market" in lower_text:
+            # Pre-market
+            pre_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)', change_text)
+            if pre_match:
+                quote.change = _parse_amount(pre_match.group(1))
+                quote.change_percent = float(pre_match.group(2))
+                quote.session = MarketSession.PRE_MARKET
+        else:
+            # Try a more general pattern
+            general_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)', change_text)
+            if general_match:
+                quote.change = _parse_amount(general_match.group(1))
+                quote.change_percent = float(general_match.group(2))
+
+                # Try to determine market status from text
+                if "after" in lower_text or "extended" in lower_text:
+                    quote.session = MarketSession.AFTER_HOURS
+                elif "pre" in lower_text:
+                    quote.session = MarketSession.PRE_MARKET
+                elif "open" in lower_text:
+                    quote.session = MarketSession.REGULAR
+                elif "closed" in lower_text:
+                    quote.session = MarketSession.CLOSED
+
+        # Derive the session prices and previous close from the changes
+        if quote.price is not None and quote.change is not None:
+            if quote.extended_change is not None:
+                quote.extended_price = quote.price
+                quote.regular_price = quote.price - quote.extended_change
+            else:
+                quote.regular_price = quote.price
+            quote.previous_close = quote.regular_price - quote.change
+
+        logger.debug("Extracted change and market status from HTML: %r", quote)
+
+    return quote.is_complete
+
+def extract_from_json(html_content, quote):
+    """
+    APPROACH 2: Extract from the JSON data embedded in the page.
+    Fills in the given quote and returns True if it is complete.
+    """
+    # Look for the script tag containing the JSON data.
+    # BeautifulSoup is only needed here, so the page is not parsed twice when HTML extraction succeeds.
+    soup = BeautifulSoup(html_content, 'html.parser')
+    json_data = None
+    script_elements = soup.find_all('script')
+    for script in script_elements:
+        script_content = script.string if script.string else ""
+        if script_content and script_content.strip().startswith('{"props":'):
             try:
-                # Parse HTML using lxml for XPath support
-                tree = html.fromstring(html_content)
-                
-                # Extract price using provided selectors
-                # CSS: #sdp-market-price
-                # XPath: //*[@id="sdp-market-price"]
-                price_element = tree.xpath('//*[@id="sdp-market-price"]')
-                if price_element:
-                    price_text = price_element[0].text_content().strip()
-                    price_match = re.search(r'\$?(\d+\.\d+)', price_text)
-                    if price_match:
-                        stock_data['price'] = f"${float(price_match.group(1)):.2f}"
-                        print(f"Extracted price from HTML: {stock_data['price']}")
-                
-                # Extract price change using provided selectors
-                # CSS: #sdp-price-chart-price-change
-                # XPath: //*[@id="sdp-price-chart-price-change"]
-                change_element = tree.xpath('//*[@id="sdp-price-chart-price-change"]')
-                if change_element:
-                    change_text = change_element[0].text_content().strip()
-                    print(f"Raw change text: {change_text}")
-                    
-                    # Extract regular hours change
-                    # Try to find patterns like "+$25.36 (+9.77%) Today"
-                    reg_hours_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)\s*Today', change_text)
-                    
-                    # Extract after hours change
-                    # Try to find patterns like "+$0.22 (+0.08%) After-hours"
-                    after_hours_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)\s*After-?hours', change_text)
-                    
-                    # Process matches to get change text
-                    if reg_hours_match and after_hours_match:
-                        # We have both regular and after-hours changes
-                        reg_change = reg_hours_match.group(1)
-                        reg_percent = reg_hours_match.group(2)
-                        reg_change_str = f"{reg_change} ({reg_percent}%) Today"
-                        
-                        aft_change = after_hours_match.group(1)
-                        aft_percent = after_hours_match.group(2)
-                        aft_change_str = f"{aft_change} ({aft_percent}%) After-hours"
-                        
-                        stock_data['change'] = f"{reg_change_str} | {aft_change_str}"
-                        
-                        # Also set market status to After Hours
-                        stock_data['market_status'] = "After Hours"
-                    elif reg_hours_match:
-                        # Only regular hours change
-                        reg_change = reg_hours_match.group(1)
-                        reg_percent = reg_hours_match.group(2)
-                        stock_data['change'] = f"{reg_change} ({reg_percent}%)"
-                        
-                        # Check if market is still open
-                        if "closed" in change_text.lower():
-                            stock_data['market_status'] = "Market Closed"
-                        else:
-                            stock_data['market_status'] = "Market Open"
-                    elif "pre-market" in change_text.lower():
-                        # Pre-market
-                        pre_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)', change_text)
-                        if pre_match:
-                            stock_data['change'] = f"{pre_match.group(1)} ({pre_match.group(2)}%) Pre-market"
-                            stock_data['market_status'] = "Pre-market"
-                    else:
-                        # Try a more general pattern
-                        general_match = re.search(r'([+-]?\$?\d+\.\d+)\s*\(([+-]?\d+\.\d+)%\)', change_text)
-                        if general_match:
-                            stock_data['change'] = f"{general_match.group(1)} ({general_match.group(2)}%)"
-                            
-                            # Try to determine market status from text
-                            if "after" in change_text.lower() or "extended" in change_text.lower():
-                                stock_data['market_status'] = "After Hours"
-                            elif "pre" in change_text.lower():
-                                stock_data['market_status'] = "Pre-market"
-                            elif "open" in change_text.lower():
-                                stock_data['market_status'] = "Market Open"
-                            elif "closed" in change_text.lower():
-                                stock_data['market_status'] = "Market Closed"
-                    
-                    print(f"Extracted change from HTML: {stock_data['change']}")
-                    print(f"Determined market status from HTML: {stock_data['market_status']}")
-                
-                # If we got all the data we need from HTML, return it
-                if stock_data['price'] != 'N/A' and stock_data['change'] != 'N/A' and stock_data['market_status'] != 'Unknown':
-                    print("Successfully extracted all data from HTML")
-                    stock_data['last_updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    return stock_data
-                
-            except Exception as e:
-                print(f"Error extracting data from HTML elements: {str(e)}")
-            
-            # APPROACH 2: Extract from embedded JSON (if HTML extraction failed)
-            if stock_data['price'] == 'N/A' or stock_data['change'] == 'N/A' or stock_data['market_status'] == 'Unknown':
-                print("Approach 2: Extracting from embedded JSON data...")
-                
-                # Look for the script tag containing the JSON data
-                json_data = None
-                script_elements = soup.find_all('script')
-                for script in script_elements:
-                    script_content = script.string if script.string else ""
-                    if script_content and script_content.strip().startswith('{"props":'):
-                        try:
-                            json_data = json.loads(script_content)
-                            print("Found embedded JSON data")
-                            break
-                        except json.JSONDecodeError:
-                            continue
-                
-                if json_data and "props" in json_data and "pageProps" in json_data["props"]:
-                    page_props = json_data["props"]["pageProps"]
-                    
-                    # Extract quote data (contains price info)
-                    if "quote" in page_props:
-                        quote = page_props["quote"]
-                        print(f"Found quote data for {ticker}")
-                        
-                        # Extract price
-                        # Prioritize extended hours price if available
-                        if "last_extended_hours_trade_price" in quote and quote["last_extended_hours_trade_price"]:
-                            current_price = float(quote["last_extended_hours_trade_price"])
-                            price_source = "extended hours"
-                            is_extended_hours = True
-                        elif "last_trade_price" in quote:
-                            current_price = float(quote["last_trade_price"])
-                            price_source = "regular hours"
-                            is_extended_hours = False
-                        else:
-                            # Fallback to ask/bid midpoint if available
-                            if "ask_price" in quote and "bid_price" in quote:
-                                ask = float(quote["ask_price"])
-                                bid = float(quote["bid_price"])
-                                current_price = (ask + bid) / 2
-                                price_source = "bid-ask midpoint"
-                                is_extended_hours = False
-                            else:
-                                current_price = None
-                                price_source = None
-                                is_extended_hours = False
-                        
-                        if current_price:
-                            # Format price with $ and 2 decimal places
-                            stock_data['price'] = f"${current_price:.2f}"
-                            print(f"Extracted price from JSON ({price_source}): {stock_data['price']}")
-                            
-                            # Calculate price change - with special handling for extended hours
-                            if "previous_close" in quote:
-                                previous_close = float(quote["previous_close"])
-                                regular_hours_change = 0
-                                extended_hours_change = 0
-                                
-                                # If we have both regular and extended hours prices
-                                if "last_trade_price" in quote and "last_extended_hours_trade_price" in quote and quote["last_extended_hours_trade_price"]:
-                                    regular_price = float(quote["last_trade_price"])
-                                    extended_price = float(quote["last_extended_hours_trade_price"])
-                                    
-                                    # Regular hours change (from previous close to regular hours price)
-                                    regular_hours_change = regular_price - previous_close
-                                    regular_hours_percent = (regular_hours_change / previous_close) * 100
-                                    
-                                    # Extended hours change (from regular close to extended hours price)
-                                    extended_hours_change = extended_price - regular_price
-                                    extended_hours_percent = (extended_hours_change / regular_price) * 100
-                                    
-                                    # For display, use the appropriate change based on current market status
-                                    if is_extended_hours:
-                                        # We're in extended hours, so show both changes
-                                        regular_change_str = f"{'+' if regular_hours_change >= 0 else ''}{regular_hours_change:.2f} ({'+' if regular_hours_change >= 0 else ''}{regular_hours_percent:.2f}%) Today"
-                                        extended_change_str = f"{'+' if extended_hours_change >= 0 else ''}{extended_hours_change:.2f} ({'+' if extended_hours_change >= 0 else ''}{extended_hours_percent:.2f}%) After-hours"
-                                        stock_data['change'] = f"{regular_change_str} | {extended_change_str}"
-                                        
-                                        # Set market status to After Hours if we're using extended hours price
-                                        stock_data['market_status'] = "After Hours"
-                                    else:
-                                        # Regular market hours, just show today's change
-                                        stock_data['change'] = f"{'+' if regular_hours_change >= 0 else ''}{regular_hours_change:.2f} ({'+' if regular_hours_change >= 0 else ''}{regular_hours_percent:.2f}%)"
-                                        stock_data['market_status'] = "Market Open"
-                                else:
-                                    # We only have one price, calculate simple change
-                                    change_amount = current_price - previous_close
-                                    change_percent = (change_amount / previous_close) * 100
-                                    stock_data['change'] = f"{'+' if change_amount >= 0 else ''}{change_amount:.2f} ({'+' if change_amount >= 0 else ''}{change_percent:.2f}%)"
-                                    
-                                    # Set a default market status based on whether we have extended hours
-                                    stock_data['market_status'] = "After Hours" if is_extended_hours else "Market Closed"
-                                
-                                print(f"Calculated price change from JSON: {stock_data['change']}")
-                                print(f"Determined market status: {stock_data['market_status']}")
-                        
-                        # Check for trading halted
-                        if "trading_halted" in quote and quote["trading_halted"]:
-                            stock_data['market_status'] = "Trading Halted"
-                            print("Trading is halted for this stock")
-                        
-                        # If we got everything we need, return the data
-                        if stock_data['price'] != 'N/A' and stock_data['change'] != 'N/A' and stock_data['market_status'] != 'Unknown':
-                            print("Successfully extracted all data from JSON")
-                            stock_data['last_updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            return stock_data
-            
-            # APPROACH 3: Use Robinhood API as fallback
-            if stock_data['price'] == 'N/A' or stock_data['change'] == 'N/A' or stock_data['market_status'] == 'Unknown':
-                print("Approach 3: Using Robinhood API as fallback...")
-                
-                api_url = f"https://api.robinhood.com/instruments/?symbol={ticker}"
-                response = requests.get(api_url, headers=headers, timeout=10)
-        
-                if response.status_code == 200:
-                    instrument_data = response.json()
-                    if instrument_data.get('results') and len(instrument_data['results']) > 0:
-                        instrument_id = instrument_data['results'][0]['id']
-                        print(f"Found instrument ID: {instrument_id}")
-        
-                        # Get quote data
-                        quote_url = f"https://api.robinhood.com/marketdata/quotes/{instrument_id}/"
-                        quote_response = requests.get(quote_url, headers=headers, timeout=10)
-        
-                        if quote_response.status_code == 200:
-                            quote_data = quote_response.json()
-                            print(f"Quote data: {json.dumps(quote_data, indent=2)}")
-        
-                            # Extract price if still needed
-                            if stock_data['price'] == 'N/A':
-                                # Prioritize extended hours price over last trade price
-                                if 'last_extended_hours_trade_price' in quote_data and quote_data['last_extended_hours_trade_price'] != 'null':
-                                    price = f"${float(quote_data['last_extended_hours_trade_price']):.2f}"
-                                    print(f"Using extended hours price from API: {price}")
-                                    using_extended_hours = True
-                                elif 'last_trade_price' in quote_data:
-                                    price = f"${float(quote_data['last_trade_price']):.2f}"
-                                    print(f"Using last trade price from API: {price}")
-                                    using_extended_hours = False
-                                else:
-                                    # Fallback to ask/bid as estimate
-                                    if 'ask_price' in quote_data and 'bid_price' in quote_data:
-                                        ask = float(quote_data['ask_price'])
-                                        bid = float(quote_data['bid_price'])
-                                        price = f"${((ask + bid) / 2):.2f}"
-                                        print(f"Using bid-ask midpoint from API: {price}")
-                                        using_extended_hours = False
-                                    else:
-                                        price = 'N/A'
-                                        using_extended_hours = False
-                                
-                                stock_data['price'] = price
-        
-                            # Calculate change if still needed
-                            if stock_data['change'] == 'N/A' and stock_data['price'] != 'N/A' and 'previous_close' in quote_data:
-                                # Try to get both regular and extended hours prices
-                                has_extended = ('last_extended_hours_trade_price' in quote_data and 
-                                               quote_data['last_extended_hours_trade_price'] != 'null')
-                                has_regular = 'last_trade_price' in quote_data
-                                
-                                if has_extended and has_regular:
-                                    # We have both prices, calculate both changes
-                                    regular_price = float(quote_data['last_trade_price'])
-                                    extended_price = float(quote_data['last_extended_hours_trade_price'])
-                                    previous_close = float(quote_data['previous_close'])
-                                    
-                                    # Regular hours change
-                                    reg_change = regular_price - previous_close
-                                    reg_percent = (reg_change / previous_close) * 100
-                                    reg_change_str = f"{'+' if reg_change >= 0 else ''}{reg_change:.2f} ({'+' if reg_change >= 0 else ''}{reg_percent:.2f}%) Today"
-                                    
-                                    # Extended hours change
-                                    ext_change = extended_price - regular_price
-                                    ext_percent = (ext_change / regular_price) * 100
-                                    ext_change_str = f"{'+' if ext_change >= 0 else ''}{ext_change:.2f} ({'+' if ext_change >= 0 else ''}{ext_percent:.2f}%) After-hours"
-                                    
-                                    # Combine both changes if we're in extended hours
-                                    if using_extended_hours:
-                                        stock_data['change'] = f"{reg_change_str} | {ext_change_str}"
-                                        stock_data['market_status'] = "After Hours"
-                                    else:
-                                        stock_data['change'] = reg_change_str
-                                        stock_data['market_status'] = "Market Open"
-                                else:
-                                    # Simple change calculation
-                                    current_price = float(stock_data['price'].replace('$', ''))
-                                    previous_close = float(quote_data['previous_close'])
-                                    change_amount = current_price - previous_close
-                                    change_percent = (change_amount / previous_close) * 100
-                                    stock_data['change'] = f"{'+' if change_amount >= 0 else ''}{change_amount:.2f} ({'+' if change_amount >= 0 else ''}{change_percent:.2f}%)"
-                                    
-                                    # Set market status based on time if not already set
-                                    if stock_data['market_status'] == 'Unknown':
-                                        stock_data['market_status'] = "After Hours" if using_extended_hours else "Market Closed"
-                                
-                                print(f"Calculated price change from API: {stock_data['change']}")
-                                print(f"Determined market status from API: {stock_data['market_status']}")
+                json_data = json.loads(script_content)
+                logger.debug("Found embedded JSON data")
+                break
+            except json.JSONDecodeError:
+                continue
 
-    except Exception as e:
-        print(f"Error scraping data for {ticker}: {str(e)}")
+    if not (json_data and "props" in json_data and "pageProps" in json_data["props"]):
+        return False
+
+    page_props = json_data["props"]["pageProps"]
+
+    # Extract quote data (contains price info)
+    if "quote" not in page_props:
+        return False
+
+    quote_json = page_props["quote"]
+    logger.debug("Found quote data for %s", quote.ticker)
+
+    # Extract price
+    # Prioritize extended hours price if available
+    if "last_extended_hours_trade_price" in quote_json and quote_json["last_extended_hours_trade_price"]:
+        current_price = float(quote_json["last_extended_hours_trade_price"])
+        price_source = "extended hours"
+        is_extended_hours = True
+    elif "last_trade_price" in quote_json:
+        current_price = float(quote_json["last_trade_price"])
+        price_source = "regular hours"
+        is_extended_hours = False
+    else:
+        # Fallback to ask/bid midpoint if available
+        if "ask_price" in quote_json and "bid_price" in quote_json:
+            ask = float(quote_json["ask_price"])
+            bid = float(quote_json["bid_price"])
+            current_price = (ask + bid) / 2
+            price_source = "bid-ask midpoint"
+            is_extended_hours = False
+        else:
+            current_price = None
+            price_source = None
+            is_extended_hours = False
+
+    if current_price:
+        quote.price = current_price
+        logger.debug("Extracted price from JSON (%s): %.2f", price_source, current_price)
+
+        # Calculate price change - with special handling for extended hours
+        if "previous_close" in quote_json:
+            previous_close = float(quote_json["previous_close"])
+
+            # If we have both regular and extended hours prices
+            if "last_trade_price" in quote_json and "last_extended_hours_trade_price" in quote_json and quote_json["last_extended_hours_trade_price"]:
+                quote.previous_close = previous_close
+                quote.set_extended_change(float(quote_json["last_trade_price"]),
+                                          float(quote_json["last_extended_hours_trade_price"]))
+
+                # For display, use the appropriate change based on current market status
+                if is_extended_hours:
+                    # Set market status to After Hours if we're using extended hours price
+                    quote.session = MarketSession.AFTER_HOURS
+                else:
+                    # Regular market hours, just show today's change
+                    quote.extended_change = None
+                    quote.extended_change_percent = None
+                    quote.session = MarketSession.REGULAR
+            else:
+                # We only have one price, calculate simple change
+                quote.set_price_change(previous_close)
+                if is_extended_hours:
+                    quote.extended_price = current_price
+                else:
+                    quote.regular_price = current_price
+
+                # Set a default market status based on whether we have extended hours
+                quote.session = MarketSession.AFTER_HOURS if is_extended_hours else MarketSession.CLOSED
+
+            logger.debug("Calculated price change and market status from JSON: %r", quote)
+
+    # Check for trading halted
+    if "trading_halted" in quote_json and quote_json["trading_halted"]:
+        quote.session = MarketSession.HALTED
+        logger.debug("Trading is halted for %s", quote.ticker)
+
+    return quote.is_complete
+
+def extract_from_api(ticker, headers, quote):
+    """
+    APPROACH 3: Use the Robinhood API as a fallback.
+    Only fills in the fields the page did not provide. Returns True if the quote is complete.
+    """
+    instrument_id = _instrument_ids.get(ticker)
+    if instrument_id is None:
+        api_url = f"{API_BASE_URL}/instruments/?symbol={ticker}"
+        response = _get(api_url, headers, 10, 'instruments')
+
+        if response.status_code != 200:
+            return False
+
+        instrument_data = response.json()
+        if not (instrument_data.get('results') and len(instrument_data['results']) > 0):
+            return False
+
+        instrument_id = instrument_data['results'][0]['id']
+        _instrument_ids[ticker] = instrument_id
+        logger.debug("Found instrument ID: %s", instrument_id)
+
+    # Get quote data
+    quote_url = f"{API_BASE_URL}/marketdata/quotes/{instrument_id}/"
+    quote_response = _get(quote_url, headers, 10, 'quotes')
+
+    if quote_response.status_code != 200:
+        return False
+
+    quote_data = quote_response.json()
+    logger.debug("Quote data for %s: %s", ticker, quote_data)
 
-    # Update the last_updated timestamp
-    stock_data['last_updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return stock_data
+    # The API returns null for the extended hours price outside extended hours
+    has_extended = bool(quote_data.get('last_extended_hours_trade_price'))
+    has_regular = bool(quote_data.get('last_trade_price'))
+    using_extended_hours = False
+
+    # Extract price if still needed
+    if quote.price is None:
+        # Prioritize extended hours price over last trade price
+        if has_extended:
+            quote.price = float(quote_data['last_extended_hours_trade_price'])
+            logger.debug("Using extended hours price from API: %.2f", quote.price)
+            using_extended_hours = True
+        elif has_regular:
+            quote.price = float(quote_data['last_trade_price'])
+            logger.debug("Using last trade price from API: %.2f", quote.price)
+        elif quote_data.get('ask_price') and quote_data.get('bid_price'):
+            # Fallback to ask/bid as estimate
+            ask = float(quote_data['ask_price'])
+            bid = float(quote_data['bid_price'])
+            quote.price = (ask + bid) / 2
+            logger.debug("Using bid-ask midpoint from API: %.2f", quote.price)
+
+    # Calculate change if still needed
+    if quote.change is None and quote.price is not None and quote_data.get('previous_close'):
+        quote.previous_close = float(quote_data['previous_close'])
+
+        if has_extended and has_regular:
+            # We have both prices, calculate both changes
+            quote.set_extended_change(float(quote_data['last_trade_price']),
+                                      float(quote_data['last_extended_hours_trade_price']))
+
+            # Show both changes if we're in extended hours
+            if using_extended_hours:
+                quote.session = MarketSession.AFTER_HOURS
+            else:
+                quote.extended_change = None
+                quote.extended_change_percent = None
+                quote.session = MarketSession.REGULAR
+        else:
+            # Simple change calculation
+            quote.set_price_change(quote.previous_close)
+
+            # Set market status if not already set
+            if quote.session is MarketSession.UNKNOWN:
+                quote.session = MarketSession.AFTER_HOURS if using_extended_hours else MarketSession.CLOSED
+
+        logger.debug("Calculated price change and market status from API: %r", quote)
+
+    return quote.is_complete
+
+def _fetch_page(ticker, url, headers):
+    """
+    Fetch the stock page, hedged if enabled.
+
+    Returns:
+        tuple: (response, hedge_quote); hedge_quote is a complete quote when the
+        hedged API request answered first, and response is then None.
+    """
+    with _stage(ticker, 'fetch') as info:
+        if HEDGE_ENABLED:
+            response, hedge_quote, info['hedge'] = _fetch_page_hedged(ticker, url, headers)
+        else:
+            response, hedge_quote = _get(url, headers, 15, 'page'), None
+        if hedge_quote is not None:
+            info['ok'] = True
+        else:
+            info['status'] = response.status_code
+            info['bytes'] = len(response.content)
+            info['ttfb'] = response.ttfb
+            info['new_connection'] = response.new_connection
+            info['ok'] = response.status_code == 200
+    return response, hedge_quote
+
+def _extract(strategy, ticker, headers, page, quote):
+    """Run one extraction strategy on the quote"""
+    if strategy == 'html':
+        return extract_from_html(page, quote)
+    if strategy == 'json':
+        return extract_from_json(page, quote)
+    return extract_from_api(ticker, headers, quote)
+
+def scrape_quote(ticker):
+    """
+    Scrape a Quote from Robinhood for a given ticker
+    Uses a multi-layer approach, each layer filling in what the previous ones missed:
+    1. Direct HTML element extraction
+    2. JSON embedded data extraction
+    3. API lookup
+    The layers are tried in the order that has worked best recently for the current
+    market session (see StrategyStats), with the stock page only fetched when a layer
+    needs it. If a parse pool is configured (see parse_pool.py), the page layers run
+    in a separate process.
+    """
+    # URL for Robinhood stock page
+    url = f"{WEB_BASE_URL}/us/en/stocks/{ticker}/"
+
+    # Get random headers for this request
+    headers = get_random_headers()
+
+    quote = Quote(ticker)
+    session = market_session_at(time.time()).name
+
+    with _stage(ticker, 'scrape') as scrape_info:
+        # Add a random delay (0.5 to 2 seconds by default) to simulate human browsing
+        with _stage(ticker, 'delay') as info:
+            if HUMAN_DELAY_RANGE[1] > 0:
+                time.sleep(random.uniform(*HUMAN_DELAY_RANGE))
+            info['ok'] = True
+        scrape_info['delay'] = info['elapsed']
+
+        order, explored = _strategy_stats.order(session)
+        scrape_info['order'] = ','.join(order)
+        if explored:
+            scrape_info['explore'] = True
+
+        try:
+            logger.debug("Scraping data for %s from %s, strategies %s", ticker, url, order)
+            page = None
+            pool = parse_pool.get_pool()
+            position = 0
+
+            while position < len(order):
+                strategy = order[position]
+                started = time.perf_counter()
+
+                if strategy in PAGE_STRATEGIES and page is None:
+                    # Get the webpage content
+                    response, hedge_quote = _fetch_page(ticker, url, headers)
+
+                    if hedge_quote is not None:
+                        # The quote API answered before the slow page did
+                        scrape_info['ok'] = True
+                        scrape_info['strategy'] = 'hedge'
+                        hedge_quote.timestamp = time.time()
+                        return hedge_quote
+
+                    scrape_info['status'] = response.status_code
+                    scrape_info['bytes'] = len(response.content)
+                    if response.status_code != 200:
+                        break
+                    # The parse processes get the raw bytes; decoding is part of their work
+                    page = response.content if pool is not None else response.text
+
+                if strategy in PAGE_STRATEGIES and pool is not None:
+                    # Hand this and the page strategies right after it to a parse process in one job
+                    run = [strategy]
+                    while position + len(run) < len(order) and order[position + len(run)] in PAGE_STRATEGIES:
+                        run.append(order[position + len(run)])
+                    position += len(run)
+
+                    quote, outcomes, finished = pool.parse(ticker, page, response.encoding, run, quote)
+                    # The first strategy also pays for the fetch and the hand-off
+                    overhead = finished - started - sum(elapsed for _, _, elapsed, _ in outcomes)
+                    for name, start, elapsed, info in outcomes:
+                        info['process'] = True
+                        _report_stage(ticker, name, start, elapsed, info)
+                        _strategy_stats.record(session, name, info['ok'], elapsed + overhead)
+                        overhead = 0.0
+                        if info.get('error'):
+                            scrape_info['error'] = info['error']
+                    if outcomes[-1][3]['ok']:
+                        scrape_info['strategy'] = outcomes[-1][0]
+                        scrape_info.pop('error', None)
+                        break
+                    continue
+
+                position += 1
+                logger.debug("Extracting %s with strategy %s", ticker, strategy)
+                with _stage(ticker, strategy) as info:
+                    try:
+                        info['ok'] = _extract(strategy, ticker, headers, page, quote)
+                    except Exception as e:
+                        info['error'] = str(e)
+                        scrape_info['error'] = str(e)
+                        logger.debug("Strategy %s failed for %s: %s", strategy, ticker, e)
+                    if not info['ok']:
+                        info['missing'] = quote.missing_fields()
+                _strategy_stats.record(session, strategy, info['ok'], time.perf_counter() - started)
+
+                if info['ok']:
+                    logger.debug("Extracted all data for %s with strategy %s", ticker, strategy)
+                    scrape_info['strategy'] = strategy
+                    scrape_info.pop('error', None)
+                    break
+
+        except Exception as e:
+            # Reported in the 'scrape' event
+            scrape_info['error'] = str(e)
+
+        scrape_info['ok'] = quote.price is not None
+
+    # Update the timestamp
+    quote.timestamp = time.time()
+    return quote
+
+def scrape_stock_data(ticker):
+    """
+    Scrape stock data from Robinhood for a given ticker.
+    Returns the legacy display-string dictionary (see Quote.to_dict).
+    """
+    return scrape_quote(ticker).to_dict()
 
 def test_scraper(ticker):
     """Test the scraper for a given ticker"""
@@ -0,0 +1,392 @@
+"""
+Standalone scraper daemon and the client the web workers use to reach it.
+
+The daemon owns a ThreadedScraper (its threads, pacing and cache) and serves
+it over a Unix socket, so the web processes stay small and fast to fork and
+every gunicorn worker shares one cache and one scrape budget. Scrape capacity
+is sized with the daemon's --workers independently of the web workers.
+
+Messages are length-prefixed JSON: a 4-byte big-endian length followed by a
+UTF-8 JSON object. A request names an operation and its arguments, e.g.
+{"op": "quotes", "tickers": ["AAPL", "MSFT"], "fast_mode": false,
+"client": "user:42"}; the reply
+is {"result": ...} or {"error": "..."}. Quotes travel as Quote.to_record()
+lists. Connections are persistent, one per client thread.
+
+Run the daemon, then start the app with STONX_SCRAPER_SOCKET pointing at it:
+
+    python scraper_service.py --socket /tmp/stonx-scraper.sock --workers 12
+    STONX_SCRAPER_SOCKET=/tmp/stonx-scraper.sock gunicorn -w 4 wsgi:app
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from payload import EncodedQuote
+from quote import Quote
+from ttl_cache import TTLCache
+
+logger = logging.getLogger('247stonx.scraper_service')
+
+DEFAULT_SOCKET = '/tmp/stonx-scraper.sock'
+
+# Encoded quotes a client keeps for reuse, and for how long (see QuoteClient.get_encoded_quotes)
+ENCODED_CACHE_TTL = 300
+ENCODED_CACHE_ENTRIES = 5000
+
+# Largest message accepted, to fail fast on a corrupt length prefix
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+_LENGTH = struct.Struct('>I')
+
+
+class ScraperServiceError(RuntimeError):
+    """The scraper daemon reported an error or could not be reached"""
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]):
+    """Send one length-prefixed JSON message"""
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(body)) + body)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Receive one length-prefixed JSON message, or None if the peer closed the connection"""
+    header = _recv_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    (size,) = _LENGTH.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ScraperServiceError(f"Message of {size} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit")
+    body = _recv_exactly(sock, size)
+    if body is None:
+        return None
+    return json.loads(body)
+
+
+def socket_in_use(path: str, timeout: float = 1.0) -> bool:
+    """True if something accepts connections on the Unix socket at `path`"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        return True
+    except socket.timeout:
+        # Listening, but its backlog is full: a busy daemon, not a stale file
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class ScraperServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves a ThreadedScraper over a Unix socket.
+
+    Requests run concurrently; the scraper's fair queue shares its workers
+    between the clients named in the requests.
+
+    Args:
+        path (str): Socket path. A stale socket file at this path is removed.
+        scraper: The ThreadedScraper to serve.
+
+    Raises:
+        ScraperServiceError: If another daemon is listening on the path.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, scraper):
+        self.path = path
+        self.scraper = scraper
+        if os.path.exists(path):
+            if socket_in_use(path):
+                raise ScraperServiceError(f"Another scraper daemon is listening on {path}")
+            os.unlink(path)
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def handle_request_message(self, message: Dict[str, Any]) -> Any:
+        """Run one operation and return its result"""
+        op = message.get('op')
+        scraper = self.scraper
+        if op == 'quotes':
+            quotes, metadata = scraper.get_multiple_quotes(message['tickers'], message.get('fast_mode', False),
+                                                           message.get('client'))
+            return {
+                'quotes': {ticker: quote.to_record() for ticker, quote in quotes.items()},
+                'metadata': metadata,
+            }
+        if op == 'cached_quotes':
+            quotes, refresh = scraper.get_cached_quotes(message['tickers'])
+            return {
+                'quotes': {ticker: quote.to_record() for ticker, quote in quotes.items()},
+                'refresh': refresh,
+            }
+        if op == 'refresh':
+            return scraper.refresh_in_background(message['tickers'], message.get('fast_mode', False),
+                                                 message.get('client'))
+        if op == 'stats':
+            return scraper.get_stats()
+        if op == 'cache_info':
+            return scraper.get_cache_info()
+        if op == 'clear_cache':
+            scraper.clear_cache()
+            return None
+        if op == 'reset_stats':
+            scraper.reset_stats()
+            return None
+        if op == 'ping':
+            return {'pid': os.getpid()}
+        raise ValueError(f"Unknown operation {op!r}")
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Serves the messages of one client connection until it closes"""
+
+    def handle(self):
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError, ScraperServiceError) as e:
+                logger.warning("Dropping client connection: %s", e)
+                return
+            if message is None:
+                return
+            try:
+                reply = {'result': self.server.handle_request_message(message)}
+            except Exception as e:
+                logger.exception("Error handling %s request", message.get('op'))
+                reply = {'error': str(e)}
+            try:
+                send_message(self.request, reply)
+            except OSError:
+                return
+
+
+class QuoteClient:
+    """
+    The ThreadedScraper methods the app uses, built on a client's get_multiple_quotes().
+
+    ScraperClient (one daemon) and sharding.ShardedScraperClient (a ring of
+    daemons) implement get_multiple_quotes() and the operations that go to the
+    daemons; the per-ticker and display-dictionary reads and the encoding of
+    bulk responses are shared here.
+
+    Args:
+        precompress (bool, optional): Keep a deflate fragment of each encoded quote, as
+            ThreadedScraper(precompress=True) does.
+    """
+
+    def __init__(self, precompress: bool = False):
+        self._precompress = precompress
+        # Created on first use, so only the client the app encodes through has one
+        self._encoded = None
+
+    def get_multiple_quotes(self, tickers: List[str], fast_mode: bool = False,
+                            client: Optional[str] = None) -> Tuple[Dict[str, Quote], Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_quote(self, ticker: str, fast_mode: bool = False) -> Quote:
+        quotes, _ = self.get_multiple_quotes([ticker], fast_mode)
+        return quotes[ticker]
+
+    def get_stock_data(self, ticker: str, fast_mode: bool = False, client: Optional[str] = None) -> Dict[str, Any]:
+        quotes, _ = self.get_multiple_quotes([ticker], fast_mode, client)
+        return quotes[ticker].to_dict()
+
+    def get_multiple_stock_data(self, tickers: List[str], fast_mode: bool = False,
+                                client: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        if not tickers:
+            return {}
+        quotes, metadata = self.get_multiple_quotes(tickers, fast_mode, client)
+        results = {ticker: quote.to_dict() for ticker, quote in quotes.items()}
+        results['metadata'] = metadata
+        return results
+
+    def get_encoded_quotes(self, quotes: Dict[str, Quote]) -> List[EncodedQuote]:
+        """
+        Encode quotes for the bulk response, reusing the bytes of quotes that have not changed.
+
+        The daemon's cached encodings cannot cross the socket, so the client keeps
+        its own, keyed by ticker and quote contents. They expire after
+        ENCODED_CACHE_TTL seconds and at most ENCODED_CACHE_ENTRIES are kept, so
+        quotes that changed or tickers nobody asks for any more drop out.
+        """
+        if self._encoded is None:
+            self._encoded = TTLCache('encoded_quotes', ENCODED_CACHE_TTL, ENCODED_CACHE_ENTRIES)
+        return [self._encoded.get((ticker, tuple(quote.to_record())),
+                                  lambda: EncodedQuote(ticker, quote.to_dict(), self._precompress))
+                for ticker, quote in quotes.items()]
+
+    def _forget_encoded(self):
+        """Drop the encoded quotes, e.g. when the daemons' caches are cleared"""
+        if self._encoded is not None:
+            self._encoded.clear()
+
+
+class ScraperClient(QuoteClient):
+    """
+    Client for the scraper daemon with the ThreadedScraper methods the app uses.
+
+    Each thread keeps its own persistent connection. A request that fails on a
+    connection error is retried once on a new connection.
+
+    Args:
+        path (str): Socket path of the daemon.
+        timeout (float, optional): Seconds to wait for a reply.
+        precompress (bool, optional): Keep a deflate fragment of each encoded quote, as
+            ThreadedScraper(precompress=True) does.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0, precompress: bool = False):
+        super().__init__(precompress)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise ScraperServiceError(f"Cannot reach the scraper daemon at {self.path}: {e}") from e
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, op: str, **arguments) -> Any:
+        """Run an operation on the daemon and return its result"""
+        message = dict(arguments, op=op)
+        for attempt in range(2):
+            sock = getattr(self._local, 'sock', None)
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                send_message(sock, message)
+                reply = recv_message(sock)
+            except OSError as e:
+                self._close()
+                if attempt:
+                    raise ScraperServiceError(f"Scraper daemon request failed: {e}") from e
+                continue
+            if reply is None:
+                # The daemon closed an idle connection; reconnect once
+                self._close()
+                if attempt:
+                    raise ScraperServiceError("Scraper daemon closed the connection")
+                continue
+            if 'error' in reply:
+                raise ScraperServiceError(reply['error'])
+            return reply['result']
+
+    def get_multiple_quotes(self, tickers: List[str], fast_mode: bool = False,
+                            client: Optional[str] = None) -> Tuple[Dict[str, Quote], Dict[str, Any]]:
+        """Fetch Quotes for multiple tickers in one round trip (see ThreadedScraper.get_multiple_quotes)"""
+        result = self.call('quotes', tickers=list(tickers), fast_mode=fast_mode, client=client)
+        quotes = {ticker: Quote.from_record(record) for ticker, record in result['quotes'].items()}
+        return quotes, result['metadata']
+
+    def get_cached_quotes(self, tickers: List[str]) -> Tuple[Dict[str, Quote], List[str]]:
+        """Cached quotes and the tickers needing a refresh (see ThreadedScraper.get_cached_quotes)"""
+        result = self.call('cached_quotes', tickers=list(tickers))
+        quotes = {ticker: Quote.from_record(record) for ticker, record in result['quotes'].items()}
+        return quotes, result['refresh']
+
+    def refresh_in_background(self, tickers: List[str], fast_mode: bool = False,
+                              client: Optional[str] = None) -> int:
+        """Queue fetches on the daemon without waiting (see ThreadedScraper.refresh_in_background)"""
+        return self.call('refresh', tickers=list(tickers), fast_mode=fast_mode, client=client)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.call('stats')
+
+    def get_cache_info(self) -> Dict[str, Any]:
+        return self.call('cache_info')
+
+    def clear_cache(self):
+        self.call('clear_cache')
+        self._forget_encoded()
+
+    def reset_stats(self):
+        self.call('reset_stats')
+
+    def ping(self) -> Dict[str, Any]:
+        return self.call('ping')
+
+
+def main():
+    from logs import configure_logging
+    import history
+    import parse_pool
+    import tracing
+    from threaded_scraper import DEFAULT_SCRAPE_QUOTA, ThreadedScraper
+
+    parser = argparse.ArgumentParser(description='Scraper daemon serving quotes over a Unix socket')
+    parser.add_argument('--socket', default=os.environ.get('STONX_SCRAPER_SOCKET', DEFAULT_SOCKET),
+                        help='Socket path (default STONX_SCRAPER_SOCKET or %(default)s)')
+    parser.add_argument('--workers', type=int, default=6, help='Scraper worker threads')
+    parser.add_argument('--cache-ttl', type=int, default=300, help='Quote cache TTL in seconds')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('STONX_SCRAPER_SHARDS', '1')),
+                        help='Daemons in the ring this one is part of; each charges a client this share '
+                             'of STONX_SCRAPE_QUOTA (default STONX_SCRAPER_SHARDS or 1)')
+    parser.add_argument('--log-level', help='Log level (default STONX_LOG_LEVEL or INFO)')
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+
+    configure_logging(args.log_level)
+    # Tickers are spread evenly over the ring, so the shares add up to the client's whole quota
+    scraper = ThreadedScraper(max_workers=args.workers, cache_ttl=args.cache_ttl,
+                              scrape_quota=DEFAULT_SCRAPE_QUOTA / args.shards)
+    # Claim the socket first, so a daemon started by mistake exits before it writes anything
+    try:
+        server = ScraperServer(args.socket, scraper)
+    except ScraperServiceError as e:
+        parser.exit(1, f"{e}\n")
+    tracing.configure_from_env()
+    parse_pool.configure_from_env()
+    # Same default location as the app's, so the web workers read what the daemon records
+    history.configure_from_env(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'history'))
+
+    logger.info("Scraper daemon listening on %s with %d workers, cache TTL %ds, shard of %d",
+                args.socket, args.workers, args.cache_ttl, args.shards)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
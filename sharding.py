@@ -0,0 +1,301 @@
+"""
+Consistent-hash sharding of tickers across several scraper daemons.
+
+Each scraper daemon (scraper_service.py) is a node on a hash ring with many
+virtual points, and a ticker belongs to the first node point clockwise of the
+ticker's hash. Every node therefore owns a slice of the ticker universe, with
+its own cache and scrape budget, and refresh capacity grows with the number
+of nodes. When a node joins or leaves, only the tickers between its points
+and their predecessors change owner (about 1/N of them); the rest keep their
+warm caches.
+
+ShardedScraperClient routes each read to the owning node, fanning a
+multi-ticker read out to the nodes in parallel. A node that cannot be reached
+is taken off the ring, so its tickers move to the next nodes, and is probed
+again every `recheck_interval` seconds to rejoin.
+
+Point the app at several daemons with a comma-separated STONX_SCRAPER_SOCKET:
+
+    STONX_SCRAPER_SOCKET=/tmp/stonx-0.sock,/tmp/stonx-1.sock,/tmp/stonx-2.sock
+"""
+
+import bisect
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from quote import Quote
+from scraper_service import QuoteClient, ScraperClient, ScraperServiceError
+
+logger = logging.getLogger('247stonx.sharding')
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent-hash ring mapping keys to nodes.
+
+    Args:
+        nodes (Iterable[str], optional): Initial node names.
+        vnodes (int, optional): Points per node. More points give a more even split.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self._points = []  # sorted hashes
+        self._owners = []  # node of each point, parallel to _points
+        self._nodes = set()
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def add_node(self, node: str):
+        """Add a node. Only the keys landing on its points move to it."""
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for index in range(self.vnodes):
+            point = _hash(f"{node}#{index}")
+            position = bisect.bisect(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, node)
+
+    def remove_node(self, node: str):
+        """Remove a node. Its keys move to the next points clockwise."""
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """The node owning a key, or None if the ring is empty"""
+        if not self._points:
+            return None
+        position = bisect.bisect(self._points, _hash(key))
+        return self._owners[position % len(self._points)]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """Group keys by owning node"""
+        assignment = {}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                assignment.setdefault(node, []).append(key)
+        return assignment
+
+
+class ShardedScraperClient(QuoteClient):
+    """
+    ScraperClient-compatible client routing tickers to their owning daemon.
+
+    Each daemon should be started with --shards set to the size of the ring, so
+    that the daemons' scrape quotas add up to one client's quota.
+
+    Args:
+        paths (List[str]): Socket paths of the daemons; each is a node on the ring.
+        timeout (float, optional): Seconds to wait for a daemon's reply.
+        precompress (bool, optional): Keep deflate fragments of encoded quotes.
+        vnodes (int, optional): Ring points per node.
+        recheck_interval (float, optional): Seconds between probes of nodes taken off the ring.
+    """
+
+    def __init__(self, paths: List[str], timeout: float = 60.0, precompress: bool = False,
+                 vnodes: int = 160, recheck_interval: float = 30.0):
+        super().__init__(precompress)
+        self.paths = list(paths)
+        self.timeout = timeout
+        self._clients = {path: ScraperClient(path, timeout) for path in self.paths}
+        self._ring = HashRing(self.paths, vnodes)
+        self._ring_lock = threading.Lock()
+        self._down = {}  # path -> time it was taken off the ring
+        self.recheck_interval = recheck_interval
+        # Several web threads fan out at once, so allow a few calls in flight per daemon
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(self.paths), 1) * 4,
+                                                               thread_name_prefix='shard')
+
+    def node_for(self, ticker: str) -> Optional[str]:
+        """Socket path of the daemon owning a ticker"""
+        with self._ring_lock:
+            return self._ring.node_for(ticker)
+
+    def assign(self, tickers: Iterable[str]) -> Dict[str, List[str]]:
+        """Group tickers by owning daemon"""
+        with self._ring_lock:
+            return self._ring.assign(tickers)
+
+    def live_nodes(self) -> List[str]:
+        with self._ring_lock:
+            return self._ring.nodes
+
+    def add_node(self, path: str):
+        """Add a daemon to the ring; about 1/N of the tickers move to it"""
+        with self._ring_lock:
+            if path not in self._clients:
+                self.paths.append(path)
+                self._clients[path] = ScraperClient(path, self.timeout)
+            self._down.pop(path, None)
+            self._ring.add_node(path)
+        logger.info("Shard %s joined the ring", path)
+
+    def remove_node(self, path: str, down: bool = False):
+        """Take a daemon off the ring; its tickers move to the remaining daemons"""
+        with self._ring_lock:
+            self._ring.remove_node(path)
+            if down:
+                self._down[path] = time.monotonic()
+            else:
+                self._down.pop(path, None)
+        logger.warning("Shard %s left the ring%s", path, ' (unreachable)' if down else '')
+
+    def _recheck_down_nodes(self):
+        """Probe nodes taken off the ring as unreachable and add back the ones that answer"""
+        now = time.monotonic()
+        with self._ring_lock:
+            due = [path for path, since in self._down.items() if now - since >= self.recheck_interval]
+            for path in due:
+                self._down[path] = now
+        for path in due:
+            try:
+                self._clients[path].ping()
+            except ScraperServiceError:
+                continue
+            self.add_node(path)
+
+    def _fetch_shard(self, path: str, tickers: List[str], fast_mode: bool,
+                     client: Optional[str]) -> Tuple[Dict[str, Quote], Dict[str, Any]]:
+        return self._clients[path].get_multiple_quotes(tickers, fast_mode, client)
+
+    def get_multiple_quotes(self, tickers: List[str], fast_mode: bool = False,
+                            client: Optional[str] = None) -> Tuple[Dict[str, Quote], Dict[str, Any]]:
+        """
+        Fetch Quotes from the owning daemons in parallel (see ThreadedScraper.get_multiple_quotes).
+
+        Tickers of a daemon that fails are re-routed once to their new owners.
+        """
+        if self._down:
+            self._recheck_down_nodes()
+        start = time.time()
+        results = {}
+        metadata = {'cached_tickers': 0, 'uncached_tickers': 0, 'quota_denied': 0, 'shards': {}}
+        pending = list(tickers)
+
+        for attempt in range(2):
+            assignment = self.assign(pending)
+            if not assignment:
+                break
+            futures = {self._executor.submit(self._fetch_shard, path, shard_tickers, fast_mode, client): path
+                       for path, shard_tickers in assignment.items()}
+            pending = []
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    quotes, shard_metadata = future.result()
+                except ScraperServiceError as e:
+                    logger.warning("Shard %s failed: %s", path, e)
+                    self.remove_node(path, down=True)
+                    pending.extend(assignment[path])
+                    continue
+                results.update(quotes)
+                metadata['cached_tickers'] += shard_metadata.get('cached_tickers', 0)
+                metadata['uncached_tickers'] += shard_metadata.get('uncached_tickers', 0)
+                # Each daemon charges its share of the client's quota (scraper_service --shards)
+                metadata['quota_denied'] += shard_metadata.get('quota_denied', 0)
+                metadata['shards'][path] = len(assignment[path])
+            if not pending:
+                break
+
+        for ticker in pending:
+            results[ticker] = Quote(ticker, error='No scraper shard available')
+
+        elapsed = time.time() - start
+        metadata.update({
+            'total_time': elapsed,
+            'tickers_processed': len(tickers),
+            'average_time_per_ticker': elapsed / len(tickers) if tickers else 0,
+            'fast_mode': fast_mode,
+        })
+        return results, metadata
+
+    def get_cached_quotes(self, tickers: List[str]) -> Tuple[Dict[str, Quote], List[str]]:
+        """Cached quotes from the owning daemons; tickers of unreachable daemons need a refresh"""
+        quotes = {}
+        refresh = []
+        for path, shard_tickers in self.assign(tickers).items():
+            try:
+                shard_quotes, shard_refresh = self._clients[path].get_cached_quotes(shard_tickers)
+            except ScraperServiceError as e:
+                logger.warning("Shard %s failed: %s", path, e)
+                self.remove_node(path, down=True)
+                refresh.extend(shard_tickers)
+                continue
+            quotes.update(shard_quotes)
+            refresh.extend(shard_refresh)
+        return quotes, refresh
+
+    def refresh_in_background(self, tickers: List[str], fast_mode: bool = False,
+                              client: Optional[str] = None) -> int:
+        """Queue fetches on the owning daemons without waiting"""
+        queued = 0
+        for path, shard_tickers in self.assign(tickers).items():
+            try:
+                queued += self._clients[path].refresh_in_background(shard_tickers, fast_mode, client)
+            except ScraperServiceError as e:
+                logger.warning("Shard %s failed: %s", path, e)
+                self.remove_node(path, down=True)
+        return queued
+
+    def _each_live_node(self, op: str) -> Dict[str, Any]:
+        results = {}
+        for path in self.live_nodes():
+            try:
+                results[path] = self._clients[path].call(op)
+            except ScraperServiceError as e:
+                logger.warning("Shard %s failed: %s", path, e)
+                self.remove_node(path, down=True)
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Summed cache counters of the live daemons, with each daemon's stats under 'shards'"""
+        shards = self._each_live_node('stats')
+        hits = sum(stats['cache_hits'] for stats in shards.values())
+        misses = sum(stats['cache_misses'] for stats in shards.values())
+        return {
+            'cache_size': sum(stats['cache_size'] for stats in shards.values()),
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'cache_hit_ratio': hits / (hits + misses) if hits + misses else 0,
+            'requests_made': sum(stats['requests_made'] for stats in shards.values()),
+            'live_shards': len(shards),
+            'down_shards': sorted(self._down),
+            'shards': shards,
+        }
+
+    def get_cache_info(self) -> Dict[str, Any]:
+        return self._each_live_node('cache_info')
+
+    def clear_cache(self):
+        self._each_live_node('clear_cache')
+        self._forget_encoded()
+
+    def reset_stats(self):
+        self._each_live_node('reset_stats')
+
+
+def ring_movement(before: HashRing, after: HashRing, keys: Iterable[str]) -> float:
+    """Fraction of keys whose owner differs between two rings"""
+    keys = list(keys)
+    if not keys:
+        return 0.0
+    moved = sum(1 for key in keys if before.node_for(key) != after.node_for(key))
+    return moved / len(keys)
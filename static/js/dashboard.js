@@ -6,6 +6,8 @@ const RETRY_DELAY = 1000;
 const SESSION_KEEPALIVE_INTERVAL = 120000; // 2 minutes between session keepalive pings
 const AUTO_REFRESH_INTERVAL = 30000; // Reduced from 60 to 30 seconds
 const USE_BULK_ENDPOINT = true; // Always use bulk endpoint for efficiency
+const SPARKLINE_REFRESH_INTERVAL = 300000; // Sparklines use 5-minute bars
+const SYMBOL_SUGGEST_DELAY = 150; // Wait for a pause in typing before asking for suggestions
 
 // Tracking variables
 let isRefreshing = false;
@@ -23,10 +25,10 @@ function showToast(message, type = 'info') {
                 <span aria-hidden="true">&times;</span>
             </button>
         </div>
-        <div class="toast-body">
-            ${message}
-        </div>
+        <div class="toast-body"></div>
     `;
+    // Messages can carry user input (e.g. symbols from an imported file): never parse them as HTML
+    toast.querySelector('.toast-body').textContent = message;
     
     // Find or create toast container
     let toastContainer = document.getElementById('toast-container');
@@ -72,6 +74,11 @@ function updateTickerCard(ticker, data) {
     const changeTodayEl = cardContainer.querySelector('.change-today');
     const changeAfterHoursEl = cardContainer.querySelector('.change-after-hours');
     const marketStatusEl = cardContainer.querySelector('.market-status');
+    const lastUpdatedEl = cardContainer.querySelector('.last-updated');
+    
+    // Show when the quote was taken; stale quotes were served from the cache after it expired
+    lastUpdatedEl.textContent = data.last_updated ? `Updated ${data.last_updated}` : '';
+    lastUpdatedEl.classList.toggle('text-warning', data.price !== undefined && data.price.includes('cached'));
     
     if (data.error) {
         // Show error
@@ -167,6 +174,290 @@ function updateTickerCard(ticker, data) {
     }
 }
 
+// Draw a card's sparkline from a list of closing prices
+function drawSparkline(ticker, closes) {
+    const cardContainer = document.querySelector(`.ticker-card-container[data-ticker="${ticker}"]`);
+    if (!cardContainer) return;
+    
+    const svg = cardContainer.querySelector('.sparkline');
+    if (!svg) return;
+    
+    svg.innerHTML = '';
+    if (!closes || closes.length < 2) {
+        return;
+    }
+    
+    // Scale into the 100x24 viewBox, leaving a pixel of margin
+    const low = Math.min(...closes);
+    const high = Math.max(...closes);
+    const range = high - low || 1;
+    const points = closes.map((close, i) => {
+        const x = (i / (closes.length - 1)) * 100;
+        const y = 23 - ((close - low) / range) * 22;
+        return `${x.toFixed(2)},${y.toFixed(2)}`;
+    }).join(' ');
+    
+    const line = document.createElementNS('http://www.w3.org/2000/svg', 'polyline');
+    line.setAttribute('points', points);
+    line.setAttribute('class', closes[closes.length - 1] >= closes[0] ? 'sparkline-up' : 'sparkline-down');
+    svg.appendChild(line);
+}
+
+// Fetch and redraw every card's sparkline
+function refreshSparklines() {
+    const tickers = Array.from(document.querySelectorAll('.ticker-card-container')).map(card => card.dataset.ticker);
+    if (tickers.length === 0) {
+        return;
+    }
+    
+    fetch(`/api/history/sparklines?tickers=${tickers.join(',')}&_=${Date.now()}`, {
+        credentials: 'same-origin',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Sparkline request failed: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        Object.keys(data).forEach(ticker => drawSparkline(ticker, data[ticker]));
+    })
+    .catch(error => {
+        console.log('Sparkline refresh error:', error);
+    });
+}
+
+// Fill the add form's suggestion list from the symbol index as the user types
+/**
+ * Report the outcome of a bulk add or import request, and reload to show added tickers
+ */
+function sendBulkAdd(request) {
+    return request
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                showToast(data.error, 'error');
+                return;
+            }
+            const invalid = Object.keys(data.invalid || {});
+            if (invalid.length) {
+                showToast(`Could not add ${invalid.slice(0, 10).join(', ')}${invalid.length > 10 ? ` and ${invalid.length - 10} more` : ''}`, 'warning');
+            }
+            if (data.existing && data.existing.length) {
+                showToast(`${data.existing.length} already on your dashboard`, 'info');
+            }
+            if (data.added && data.added.length) {
+                showToast(`Added ${data.added.length} ticker${data.added.length === 1 ? '' : 's'} to your dashboard`, 'success');
+                window.location.reload();
+            }
+        })
+        .catch(error => {
+            console.error("Error adding tickers:", error);
+            showToast('Error adding tickers', 'error');
+        });
+}
+
+function setupSymbolSuggestions(input) {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    if (!datalist) return;
+    
+    let timer = null;
+    let lastPrefix = '';
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const prefix = input.value.trim();
+        if (!prefix || prefix === lastPrefix) {
+            return;
+        }
+        timer = setTimeout(() => {
+            lastPrefix = prefix;
+            fetch(`/api/symbols?prefix=${encodeURIComponent(prefix)}&limit=10`, {
+                credentials: 'same-origin',
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            })
+            .then(response => response.ok ? response.json() : [])
+            .then(matches => {
+                // A later keystroke has its own request
+                if (input.value.trim() !== prefix) return;
+                datalist.replaceChildren(...matches.map(match => {
+                    const option = document.createElement('option');
+                    option.value = match.symbol;
+                    option.label = match.name;
+                    return option;
+                }));
+            })
+            .catch(error => {
+                console.log('Symbol suggestion error:', error);
+            });
+        }, SYMBOL_SUGGEST_DELAY);
+    });
+}
+
+// Ticker whose alerts the alert dialog shows
+let alertTicker = null;
+
+// Fill the alert dialog's list from the server
+function loadAlerts(ticker) {
+    const list = document.getElementById('alertList');
+    fetch(`/api/alerts?ticker=${encodeURIComponent(ticker)}`, {
+        credentials: 'same-origin',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`Alert request failed: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(items => {
+        list.replaceChildren();
+        if (items.length === 0) {
+            const empty = document.createElement('li');
+            empty.className = 'list-group-item text-muted';
+            empty.textContent = 'No alerts yet';
+            list.appendChild(empty);
+        }
+        items.forEach(item => {
+            const entry = document.createElement('li');
+            entry.className = 'list-group-item d-flex justify-content-between align-items-center';
+            const label = document.createElement('span');
+            label.textContent = item.triggered_at
+                ? `${item.description} (fired at ${item.trigger_price.toFixed(2)}, ${item.triggered_at})`
+                : item.description;
+            if (item.triggered_at) {
+                label.classList.add('text-muted');
+            }
+            const remove = document.createElement('button');
+            remove.type = 'button';
+            remove.className = 'btn btn-sm btn-outline-danger';
+            remove.innerHTML = '<i class="bi bi-trash"></i>';
+            remove.addEventListener('click', () => deleteAlert(item.id));
+            entry.append(label, remove);
+            list.appendChild(entry);
+        });
+    })
+    .catch(error => {
+        console.error('Error loading alerts:', error);
+        showToast('Could not load alerts', 'error');
+    });
+}
+
+function deleteAlert(alertId) {
+    fetch(`/api/alerts/${alertId}`, {
+        method: 'DELETE',
+        credentials: 'same-origin',
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Failed to delete alert');
+        }
+        loadAlerts(alertTicker);
+    })
+    .catch(error => {
+        showToast(error.message, 'error');
+    });
+}
+
+// Wire the alert dialog to the cards' bell buttons
+function setupAlerts() {
+    const modalEl = document.getElementById('alertModal');
+    if (!modalEl) return;
+    const modal = new bootstrap.Modal(modalEl);
+    const form = document.getElementById('alertForm');
+    
+    document.querySelectorAll('.alert-btn').forEach(btn => {
+        btn.addEventListener('click', function() {
+            alertTicker = this.dataset.ticker;
+            document.getElementById('alertModalTitle').textContent = `${alertTicker} alerts`;
+            loadAlerts(alertTicker);
+            modal.show();
+        });
+    });
+    
+    form.addEventListener('submit', function(e) {
+        e.preventDefault();
+        fetch('/api/alerts', {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({
+                ticker: alertTicker,
+                kind: form.elements.kind.value,
+                threshold: form.elements.threshold.value
+            })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Failed to add alert');
+            }
+            form.elements.threshold.value = '';
+            loadAlerts(alertTicker);
+        })
+        .catch(error => {
+            showToast(error.message, 'error');
+        });
+    });
+}
+
+// Show the alerts that fired since the last poll, delivered with the bulk quotes
+function showFiredAlerts(fired) {
+    fired.forEach(item => {
+        showToast(`${item.description}: now ${item.trigger_price.toFixed(2)}`, 'warning');
+    });
+}
+
+// Mark a card whose quote the server is still fetching
+function markPending(ticker) {
+    const cardContainer = document.querySelector(`.ticker-card-container[data-ticker="${ticker}"]`);
+    if (!cardContainer) return;
+    
+    const lastUpdatedEl = cardContainer.querySelector('.last-updated');
+    lastUpdatedEl.textContent = 'Refreshing...';
+}
+
+/**
+ * Renders the quotes the server embedded in the page, without a round trip.
+ * Returns the tickers the server is still fetching, or null if nothing was embedded.
+ */
+function renderInitialQuotes() {
+    const initialEl = document.getElementById('initialQuotes');
+    if (!initialEl) {
+        return null;
+    }
+    
+    let initial;
+    try {
+        initial = JSON.parse(initialEl.textContent);
+    } catch (error) {
+        console.error('Could not read the embedded quotes:', error);
+        return null;
+    }
+    
+    Object.keys(initial.quotes).forEach(ticker => {
+        updateTickerCard(ticker, initial.quotes[ticker]);
+    });
+    Object.keys(initial.sparklines || {}).forEach(ticker => {
+        drawSparkline(ticker, initial.sparklines[ticker]);
+    });
+    initial.pending.forEach(markPending);
+    return initial.pending;
+}
+
 // Function to handle errors
 function handleError(ticker, error, retryCount = 0) {
     console.log(`Error loading data for ${ticker}: ${error} (retry: ${retryCount})`);
@@ -363,6 +654,10 @@ function refreshAllTickers() {
                 }
             });
             
+            if (data.metadata && data.metadata.alerts) {
+                showFiredAlerts(data.metadata.alerts);
+            }
+            
             // Optional: Log performance metrics if present
             if (data.metadata) {
                 console.log(`Refreshed ${data.metadata.tickers_count} tickers in ${data.metadata.total_time.toFixed(2)}s`);
@@ -377,8 +672,15 @@ function refreshAllTickers() {
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Setting up automatic refresh every 30 seconds');
     
-    // Initial refresh of all tickers
-    refreshAllTickers();
+    // Show the cached quotes right away. Only go back to the server now if some
+    // tickers are still being fetched; the bulk request waits for those fetches
+    // rather than starting new ones.
+    const pending = renderInitialQuotes();
+    if (pending === null || pending.length > 0) {
+        refreshAllTickers();
+    } else {
+        window.tickersRefreshed = true;
+    }
     
     // Set up automatic refresh with dynamic interval based on market hours
     function scheduleNextRefresh() {
@@ -415,9 +717,16 @@ document.addEventListener('DOMContentLoaded', function() {
     // Start the dynamic refresh scheduling
     scheduleNextRefresh();
     
+    // Sparklines were embedded in the page; redraw them as new bars complete
+    setInterval(refreshSparklines, SPARKLINE_REFRESH_INTERVAL);
+    
+    setupAlerts();
+    
     // Set up add ticker form
     const addTickerForm = document.getElementById('addTickerForm');
     if (addTickerForm) {
+        setupSymbolSuggestions(addTickerForm.querySelector('input[name="ticker"]'));
+        
         addTickerForm.addEventListener('submit', function(e) {
             e.preventDefault();
             
@@ -431,6 +740,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
             
+            // Several symbols: one bulk request
+            if (/[\s,]/.test(ticker)) {
+                tickerInput.disabled = true;
+                submitBtn.disabled = true;
+                sendBulkAdd(fetch('/api/watchlist/add', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ tickers: ticker.split(/[\s,]+/).filter(Boolean) })
+                })).finally(() => {
+                    tickerInput.disabled = false;
+                    submitBtn.disabled = false;
+                    tickerInput.value = '';
+                    tickerInput.focus();
+                });
+                return;
+            }
+            
             // Check if ticker already exists
             const existingCard = document.querySelector(`.ticker-card-container[data-ticker="${ticker}"]`);
             if (existingCard) {
@@ -501,6 +827,20 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Set up CSV import
+    const importInput = document.getElementById('importFile');
+    if (importInput) {
+        document.getElementById('importBtn').addEventListener('click', () => importInput.click());
+        importInput.addEventListener('change', function() {
+            if (!this.files.length) return;
+            const form = new FormData();
+            form.append('file', this.files[0]);
+            showToast('Importing tickers...', 'info');
+            sendBulkAdd(fetch('/api/watchlist/import', { method: 'POST', body: form }))
+                .finally(() => { this.value = ''; });
+        });
+    }
+    
     // Set up delete ticker buttons
     document.querySelectorAll('.delete-btn').forEach(btn => {
         btn.addEventListener('click', function() {
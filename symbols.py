@@ -0,0 +1,271 @@
+"""
+Local index of known ticker symbols, for validation and autocomplete.
+
+Symbols and their security names are loaded from a symbol file into sorted
+arrays. Membership and prefix lookups are a bisect, a few microseconds for
+the whole US listing, so adding a known ticker to a watchlist needs no
+upstream scrape and the add form can suggest symbols as the user types.
+Symbols the index does not know still fall back to a scrape; those that
+scrape fine are added to the in-memory index.
+
+The symbol file has one symbol per line, optionally followed by '|', ',' or a
+tab and the security name. Lines whose first field is not an upper-case symbol
+(headers, footers, comments) are skipped, so the NASDAQ Trader symbol
+directory files load as they are. `python symbols.py refresh` downloads
+them and writes a merged file:
+
+    python symbols.py refresh                  # instance/symbols.txt
+    python symbols.py lookup APP               # try the index
+
+A running app reloads the file when its modification time changes, checked at
+most once a minute. Environment:
+    STONX_SYMBOLS_FILE  Symbol file (default instance/symbols.txt)
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('247stonx.symbols')
+
+# What a ticker symbol can look like; anything else is rejected without a lookup
+VALID_SYMBOL = re.compile(r'^[A-Z0-9][A-Z0-9.\-^=]{0,15}$')
+
+# Listed securities of all US exchanges, refreshed nightly by NASDAQ Trader
+SOURCES = (
+    ('https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt', 'Symbol'),
+    ('https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt', 'ACT Symbol'),
+)
+
+# Seconds between checks of the symbol file for changes
+RELOAD_INTERVAL = 60.0
+
+_FIELD_SEPARATOR = re.compile(r'[|,\t]')
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def is_valid_symbol(symbol: str) -> bool:
+    """True if the text has the format of a ticker symbol"""
+    return bool(VALID_SYMBOL.match(symbol))
+
+
+def parse_symbol_file(text: str) -> Dict[str, str]:
+    """Symbols of a symbol file with their names ('' when the file has none)"""
+    entries = {}
+    for line in text.splitlines():
+        # The first separator of the line is the file's; the name is the second field
+        separator = _FIELD_SEPARATOR.search(line)
+        fields = line.split(separator.group()) if separator else [line]
+        symbol = fields[0].strip()
+        if VALID_SYMBOL.match(symbol):
+            entries[symbol] = fields[1].strip() if len(fields) > 1 else ''
+    return entries
+
+
+class SymbolIndex:
+    """
+    Sorted arrays of symbols and name words, searched with bisect.
+
+    Args:
+        entries (Dict[str, str]): Symbol to security name.
+    """
+
+    def __init__(self, entries: Dict[str, str]):
+        self._lock = threading.Lock()
+        self._symbols = sorted(entries)
+        self._names = [entries[symbol] for symbol in self._symbols]
+        # (word of a name, symbol) pairs, so "appl" finds AAPL through "apple"
+        self._words = sorted({(word, symbol) for symbol, name in entries.items()
+                              for word in _WORD.findall(name.lower())})
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        symbols = self._symbols
+        position = bisect.bisect_left(symbols, symbol)
+        return position < len(symbols) and symbols[position] == symbol
+
+    def name(self, symbol: str) -> Optional[str]:
+        """Security name of a known symbol, None for an unknown one"""
+        position = bisect.bisect_left(self._symbols, symbol)
+        if position < len(self._symbols) and self._symbols[position] == symbol:
+            return self._names[position]
+        return None
+
+    def add(self, symbol: str, name: str = ''):
+        """Learn a symbol found upstream; kept until the next reload"""
+        with self._lock:
+            position = bisect.bisect_left(self._symbols, symbol)
+            if position < len(self._symbols) and self._symbols[position] == symbol:
+                return
+            self._symbols.insert(position, symbol)
+            self._names.insert(position, name)
+
+    def search(self, prefix: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        Symbols starting with the prefix, then symbols whose name has a word starting with it.
+
+        Returns:
+            List[Tuple[str, str]]: Up to `limit` (symbol, name) pairs, exact match first.
+        """
+        results = []
+        seen = set()
+        symbol_prefix = prefix.strip().upper()
+        if symbol_prefix:
+            symbols = self._symbols
+            position = bisect.bisect_left(symbols, symbol_prefix)
+            while position < len(symbols) and len(results) < limit and symbols[position].startswith(symbol_prefix):
+                results.append((symbols[position], self._names[position]))
+                seen.add(symbols[position])
+                position += 1
+
+        word_prefix = prefix.strip().lower()
+        if word_prefix and len(results) < limit:
+            words = self._words
+            position = bisect.bisect_left(words, (word_prefix, ''))
+            while position < len(words) and len(results) < limit and words[position][0].startswith(word_prefix):
+                symbol = words[position][1]
+                if symbol not in seen:
+                    seen.add(symbol)
+                    results.append((symbol, self.name(symbol)))
+                position += 1
+        return results
+
+
+class SymbolFile:
+    """
+    A SymbolIndex kept in step with a symbol file.
+
+    Args:
+        path (str): Symbol file. A missing file gives an empty index.
+        reload_interval (float, optional): Seconds between checks for a changed file.
+    """
+
+    def __init__(self, path: str, reload_interval: float = RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._index = SymbolIndex({})
+        self._mtime = None
+        self._checked = None
+        self.index()
+
+    def index(self) -> SymbolIndex:
+        """The current index, reloaded first if the file changed since the last check"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.reload_interval:
+            return self._index
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.reload_interval:
+                return self._index
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self._index = self._load() if mtime is not None else SymbolIndex({})
+        return self._index
+
+    def _load(self) -> SymbolIndex:
+        started = time.perf_counter()
+        try:
+            with open(self.path, encoding='utf-8', errors='replace') as f:
+                index = SymbolIndex(parse_symbol_file(f.read()))
+        except OSError as e:
+            logger.error("Could not read symbol file %s: %s", self.path, e)
+            return self._index
+        logger.info("Loaded %d symbols from %s in %.0fms", len(index), self.path,
+                    (time.perf_counter() - started) * 1000)
+        return index
+
+
+_symbol_file = None
+
+
+def configure(path: Optional[str], reload_interval: float = RELOAD_INTERVAL):
+    """Use the symbol file at `path`, or no index if None"""
+    global _symbol_file
+    _symbol_file = SymbolFile(path, reload_interval) if path else None
+
+
+def configure_from_env(default_path: str):
+    """Use STONX_SYMBOLS_FILE, or default_path"""
+    configure(os.environ.get('STONX_SYMBOLS_FILE') or default_path)
+
+
+def get_index() -> SymbolIndex:
+    """The current index; empty when no symbol file is configured or present"""
+    symbol_file = _symbol_file
+    return symbol_file.index() if symbol_file is not None else SymbolIndex({})
+
+
+def download(sources=SOURCES, timeout: float = 30.0) -> Dict[str, str]:
+    """Listed symbols and names from the NASDAQ Trader symbol directory, test issues left out"""
+    import requests
+
+    entries = {}
+    for url, symbol_column in sources:
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        for row in csv.DictReader(io.StringIO(response.text), delimiter='|'):
+            symbol = (row.get(symbol_column) or '').strip()
+            if row.get('Test Issue') == 'Y' or not VALID_SYMBOL.match(symbol):
+                continue
+            entries[symbol] = (row.get('Security Name') or '').strip()
+        logger.info("Downloaded %s: %d symbols so far", url, len(entries))
+    return entries
+
+
+def write_symbol_file(path: str, entries: Dict[str, str]):
+    """Write a symbol file atomically, so a running app never loads half of one"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write('Symbol|Security Name\n')
+        for symbol in sorted(entries):
+            f.write(f"{symbol}|{entries[symbol].replace('|', ' ')}\n")
+    os.replace(temporary, path)
+
+
+def main():
+    from logs import configure_logging
+
+    default_path = os.environ.get('STONX_SYMBOLS_FILE') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'symbols.txt')
+    parser = argparse.ArgumentParser(description='Maintain and query the local symbol index')
+    parser.add_argument('command', choices=('refresh', 'lookup'), help='Download the symbol file, or search it')
+    parser.add_argument('prefix', nargs='?', default='', help='Prefix to look up')
+    parser.add_argument('--file', default=default_path, help='Symbol file (default %(default)s)')
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'refresh':
+        entries = download()
+        write_symbol_file(args.file, entries)
+        print(f"Wrote {len(entries)} symbols to {args.file}")
+        return
+
+    started = time.perf_counter()
+    index = SymbolFile(args.file).index()
+    loaded = time.perf_counter()
+    results = index.search(args.prefix, 20)
+    searched = time.perf_counter()
+    for symbol, name in results:
+        print(f"{symbol:8} {name}")
+    print(f"{len(index)} symbols loaded in {(loaded - started) * 1000:.1f}ms, "
+          f"searched in {(searched - loaded) * 1e6:.0f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,55 +6,110 @@ from datetime import datetime, timedelta
 from dateutil import parser
 import threading
 import concurrent.futures
+import logging
+import os
 from lxml import html
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import scraper
 import random
 
 # Import the original scraper functionality to reuse
-from scraper import scrape_stock_data
+from scraper import scrape_quote
+from quote import Quote
+from payload import EncodedQuote
+from fair_share import QUOTA_EXCEEDED, FairScheduler, Job, RateLimiter, ScrapeQuota
+import metrics
+import tracing
+import parse_pool
+import history
+
+logger = logging.getLogger('247stonx.threaded_scraper')
 
 # Thread-local storage to keep track of thread-specific data
 thread_local = threading.local()
 
+# Uncached fetches each client may cause per minute (STONX_SCRAPE_QUOTA, 0 to disable).
+# Only calls that name a client are charged.
+DEFAULT_SCRAPE_QUOTA = float(os.environ.get('STONX_SCRAPE_QUOTA', '600') or 0)
+
 class ThreadedScraper:
     """
     A threaded stock data scraper that fetches data for multiple tickers concurrently.
-    Uses ThreadPoolExecutor to parallelize requests and improve performance.
+    
+    Cache misses are queued per client on a FairScheduler and fetched by a fixed
+    set of worker threads, so a client with a long watchlist cannot starve the
+    others (see fair_share.py).
     """
     
-    def __init__(self, max_workers: Optional[int] = None, cache_ttl: int = 600):
+    def __init__(self, max_workers: Optional[int] = None, cache_ttl: int = 600, precompress: bool = False,
+                 scrape_quota: Optional[float] = None, rate_limit: Optional[float] = None):
         """
         Initialize the threaded scraper with a specified number of workers.
         
         Args:
             max_workers (int, optional): Maximum number of worker threads to use.
             cache_ttl (int, optional): Time to live for cached data in seconds.
+            precompress (bool, optional): If True, also keep a deflate fragment of
+                each cached quote so gzip responses can be assembled without compressing.
+            scrape_quota (float, optional): Uncached fetches a client may cause per
+                minute. Defaults to STONX_SCRAPE_QUOTA; 0 disables the quota.
+            rate_limit (float, optional): Most upstream scrapes per second across all
+                workers, on top of the pacing. None or 0 for no limit.
         """
         # Increase default worker count for better parallelization
         self.max_workers = max_workers if max_workers else 6  # Increased from 4 to 6 workers by default
+        # Guards the cache, pacing and queue state; never held while sleeping or scraping
         self._lock = threading.Lock()
+        # Guards the counters alone, so cache hits never wait on a worker
+        self._stats_lock = threading.Lock()
         self._stats = {
             'requests_made': 0,
             'successful_requests': 0,
             'failed_requests': 0,
             'total_time': 0,
+            'request_time': 0,
+            'batches': 0,
             'last_batch_time': 0,
             'last_batch_size': 0,
-            'last_request_time': 0
+            'cache_hits': 0,
+            'cache_misses': 0
         }
-        # Cache to store results with timestamps to avoid redundant requests
+        # Cache to store results with timestamps to avoid redundant requests.
+        # Each entry also holds the quote pre-encoded as JSON (see payload.py).
         self._cache = {}
+        self._precompress = precompress
         self._cache_ttl = cache_ttl  # Allow configurable TTL
         # Maximum delay between requests (seconds)
         self._max_delay = 0.3  # Reduced from 0.8 to 0.3 to speed up requests
-        # Last time each ticker was scraped
+        # Last time each ticker was scraped, and any ticker; a worker about to sleep
+        # before its scrape has already reserved its slot here
         self._last_scrape_time = {}
+        self._last_request_time = 0
+        # Fair queue of cache misses and the workers serving it, started on first use
+        self._scheduler = FairScheduler()
+        self._workers = []
+        # Tickers queued or being fetched: ticker -> (job, future). Concurrent
+        # requests for the same ticker share one fetch.
+        self._in_flight = {}
+        if scrape_quota is None:
+            scrape_quota = DEFAULT_SCRAPE_QUOTA
+        self._quota = ScrapeQuota(scrape_quota) if scrape_quota > 0 else None
+        self._rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        # Called with every newly scraped quote (see add_quote_listener)
+        self._quote_listeners = []
+    
+    def add_quote_listener(self, listener):
+        """
+        Call `listener(quote)` with every successfully scraped quote.
+        
+        Listeners run on the worker thread that scraped the quote, so they must be quick.
+        """
+        self._quote_listeners.append(listener)
     
-    def get_stock_data(self, ticker: str, fast_mode: bool = False) -> Dict[str, Any]:
+    def get_quote(self, ticker: str, fast_mode: bool = False) -> Quote:
         """
-        Fetch stock data for a single ticker using the base scraper.
+        Fetch a Quote for a single ticker using the base scraper.
         Increments stats counters for tracking performance.
         
         Args:
@@ -62,7 +117,7 @@ class ThreadedScraper:
             fast_mode (bool, optional): If True, minimize delays between requests.
             
         Returns:
-            Dict[str, Any]: Stock data dictionary with price, change, and market status.
+            Quote: The quote. Marked stale if a failed refresh fell back to the cache.
         """
         # Check cache first
         current_time = time.time()
@@ -70,119 +125,286 @@ class ThreadedScraper:
             cache_time = self._cache[ticker]['timestamp']
             if current_time - cache_time < self._cache_ttl:
                 # Return cached data if still fresh
-                print(f"Using cached data for {ticker} ({current_time - cache_time:.1f}s old)")
-                return self._cache[ticker]['data']
+                logger.debug("Using cached data for %s (%.1fs old)", ticker, current_time - cache_time)
+                with self._stats_lock:
+                    self._stats['cache_hits'] += 1
+                metrics.CACHE_LOOKUPS.labels('hit').inc()
+                return self._cache[ticker]['quote']
+        
+        with self._stats_lock:
+            self._stats['cache_misses'] += 1
+        metrics.CACHE_LOOKUPS.labels('miss').inc()
         
-        # Add a small, reasonable delay to avoid overwhelming the server
+        trace = tracing.begin(ticker) if tracing.enabled else None
+        try:
+            return self._scrape(ticker, fast_mode, current_time)
+        finally:
+            tracing.end(trace)
+    
+    def _scrape(self, ticker: str, fast_mode: bool, current_time: float) -> Quote:
+        """Pace, scrape and cache a ticker that missed the cache (see get_quote)"""
+        # Add a small, reasonable delay to avoid overwhelming the server. The delay is
+        # worked out and the slot reserved under the lock; the sleep happens outside
+        # it, so cache hits and other tickers' workers are not held up by it.
+        pacing_start = time.perf_counter()
         with self._lock:
+            lock_wait = time.perf_counter() - pacing_start
+            
             # Check when this specific ticker was last scraped
             ticker_last_time = self._last_scrape_time.get(ticker, 0)
             
+            # Scrapes other workers have reserved but not started yet go first
+            now = time.time()
+            backlog = max(0, self._last_request_time - now)
+            since_last_request = now + backlog - self._last_request_time
+            
             # In fast mode, use minimal delays for page initial load
             if fast_mode:
                 # Significantly reduce delays for fast mode
                 ticker_delay = max(0, 0.1 - (current_time - ticker_last_time))
                 global_delay = 0
-                since_last_request = current_time - self._stats['last_request_time']
                 if since_last_request < 0.05:  # Use much smaller delay in fast mode
                     global_delay = min(0.1, 0.05 - since_last_request + random.uniform(0.01, 0.02))
             else:
                 # Regular mode with normal delays
                 ticker_delay = max(0, 0.5 - (current_time - ticker_last_time))
                 global_delay = 0
-                since_last_request = current_time - self._stats['last_request_time']
                 if since_last_request < 0.2:
                     global_delay = min(self._max_delay, 0.2 - since_last_request + random.uniform(0.01, 0.05))
             
             # Use the longer of the two delays
             delay = max(ticker_delay, global_delay)
             
-            # Cap maximum delay
-            delay = min(delay, 1.0 if not fast_mode else 0.3)
+            # Cap maximum delay, then queue behind the reserved scrapes
+            delay = min(delay, 1.0 if not fast_mode else 0.3) + backlog
             
-            if delay > 0.1 and not fast_mode:  # Only log substantial delays in non-fast mode
-                print(f"Adding delay of {delay:.2f}s before scraping {ticker}")
-                
-            if delay > 0:
-                time.sleep(delay)
-            
-            # Update timestamps
-            self._stats['last_request_time'] = time.time()
-            self._last_scrape_time[ticker] = time.time()
+            # Reserve the slot this scrape starts at
+            self._last_request_time = self._last_scrape_time[ticker] = now + delay
+        
+        if delay > 0.1 and not fast_mode:  # Only log substantial delays in non-fast mode
+            logger.debug("Adding delay of %.2fs before scraping %s", delay, ticker)
+        if delay > 0:
+            time.sleep(delay)
+        rate_wait = self._rate_limiter.wait() if self._rate_limiter is not None else 0.0
         
+        if tracing.enabled:
+            tracing.add_span('pacing', pacing_start, time.perf_counter() - pacing_start,
+                             lock_wait_ms=round(lock_wait * 1000, 2), sleep_ms=round(delay * 1000, 2),
+                             rate_wait_ms=round(rate_wait * 1000, 2))
+        
+        scrape_start = time.time()
         try:
             # Use the existing scraper module to get stock data
-            result = scrape_stock_data(ticker)
+            quote = scrape_quote(ticker)
+            scrape_time = time.time() - scrape_start
             
             # If we got valid price data, cache it
-            if result['price'] != 'N/A':
+            if quote.price is not None:
+                # Encode outside the lock; the bulk endpoint reuses these bytes
+                encoded = EncodedQuote(ticker, quote.to_dict(), self._precompress)
                 with self._lock:
                     self._cache[ticker] = {
-                        'data': result,
+                        'quote': quote,
+                        'encoded': encoded,
                         'timestamp': time.time()
                     }
+                with self._stats_lock:
                     self._stats['requests_made'] += 1
                     self._stats['successful_requests'] += 1
+                    self._stats['request_time'] += scrape_time
+                history.record(ticker, quote.timestamp, quote.price, quote.previous_close)
+                for listener in self._quote_listeners:
+                    try:
+                        listener(quote)
+                    except Exception:
+                        logger.exception("Quote listener failed for %s", ticker)
             else:
                 # Got N/A result, check if we have a valid cached version
                 if ticker in self._cache:
                     # Use cached data but mark it as stale
-                    print(f"Got N/A for {ticker}, using cached data but marking as stale")
-                    cached_data = self._cache[ticker]['data'].copy()
-                    cached_data['price'] += " (cached)"
-                    cached_data['market_status'] = "Data may be stale"
-                    with self._lock:
+                    logger.info("Got N/A for %s, using cached data but marking as stale", ticker)
+                    with self._stats_lock:
                         self._stats['requests_made'] += 1
                         self._stats['failed_requests'] += 1
-                    return cached_data
+                        self._stats['request_time'] += scrape_time
+                    return self._cache[ticker]['quote'].copy(stale=True)
                 
                 # No valid cache, increment failed counter
-                with self._lock:
+                with self._stats_lock:
                     self._stats['requests_made'] += 1
                     self._stats['failed_requests'] += 1
+                    self._stats['request_time'] += scrape_time
             
-            return result
+            return quote
         except Exception as e:
-            with self._lock:
+            with self._stats_lock:
                 self._stats['requests_made'] += 1
                 self._stats['failed_requests'] += 1
+                self._stats['request_time'] += time.time() - scrape_start
             
             # Check if we have cached data we can use instead
             if ticker in self._cache:
-                print(f"Error scraping {ticker}, using cached data: {str(e)}")
-                cached_data = self._cache[ticker]['data'].copy()
-                cached_data['price'] += " (cached)"
-                cached_data['market_status'] = "Data may be stale"
-                return cached_data
+                logger.warning("Error scraping %s, using cached data: %s", ticker, e)
+                return self._cache[ticker]['quote'].copy(stale=True)
             
             # Return error data
-            return {
-                'ticker': ticker,
-                'price': 'N/A',
-                'change': 'N/A',
-                'market_status': 'Error: Rate limited',
-                'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'error': str(e)
-            }
+            return Quote(ticker, error=str(e))
+    
+    def _ensure_workers(self):
+        """Start the worker threads on first use"""
+        if len(self._workers) >= self.max_workers:
+            return
+        with self._lock:
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"scraper-worker-{len(self._workers)}",
+                                          daemon=True)
+                worker.start()
+                self._workers.append(worker)
+    
+    def _work(self):
+        """Worker loop: fetch queued tickers in fair order until shutdown()"""
+        while True:
+            job = self._scheduler.next_job()
+            if job is None:
+                return
+            metrics.QUEUE_WAIT.labels('executor').observe(time.perf_counter() - job.submitted)
+            ticker = job.key
+            try:
+                quote = self.get_quote(ticker, job.payload)
+            except Exception as e:
+                quote = Quote(ticker, error=f"Unexpected error: {str(e)}")
+            with self._lock:
+                _, future = self._in_flight.pop(ticker)
+            future.set_result(quote)
+    
+    def shutdown(self):
+        """Stop the worker threads once the queued fetches are taken"""
+        self._scheduler.close()
+        for worker in self._workers:
+            worker.join()
+    
+    def get_stock_data(self, ticker: str, fast_mode: bool = False, client: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetch stock data for a single ticker as a display dictionary.
+        
+        Args:
+            ticker (str): The stock ticker symbol to fetch data for.
+            fast_mode (bool, optional): If True, minimize delays between requests.
+            client (str, optional): Who is asking, for fair queuing and the scrape quota.
+            
+        Returns:
+            Dict[str, Any]: Stock data dictionary with price, change, and market status.
+        """
+        quotes, _ = self.get_multiple_quotes([ticker], fast_mode, client)
+        return quotes[ticker].to_dict()
+    
+    def _queue_fetches(self, tickers: List[str], fast_mode: bool,
+                       client: Optional[str]) -> Tuple[Dict[str, concurrent.futures.Future], List[str]]:
+        """
+        Charge cache misses to the client's quota and queue the allowed ones.
+        
+        Only fetches nobody else has queued are charged; tickers already queued
+        join the existing fetch.
+        
+        Returns:
+            tuple: (futures, denied) with a Future of the Quote per queued ticker,
+            and the tickers refused by the quota.
+        """
+        denied_tickers = []
+        if self._quota is not None and client is not None:
+            with self._lock:
+                new_tickers = [ticker for ticker in tickers if ticker not in self._in_flight]
+            allowed = self._quota.take(client, len(new_tickers))
+            if allowed < len(new_tickers):
+                denied_tickers = new_tickers[allowed:]
+                denied = set(denied_tickers)
+                tickers = [ticker for ticker in tickers if ticker not in denied]
+                metrics.QUOTA_DENIED.inc(len(denied_tickers))
+                logger.info("Client %s is over its scrape quota; refused %d of %d fetches",
+                            client, len(denied_tickers), len(new_tickers))
+        
+        # Queue the misses, joining fetches already queued for the same ticker
+        futures = {}
+        queue = client if client is not None else ''
+        with self._lock:
+            for ticker in tickers:
+                entry = self._in_flight.get(ticker)
+                if entry is None:
+                    entry = self._in_flight[ticker] = (Job(ticker, fast_mode), concurrent.futures.Future())
+                job, futures[ticker] = entry
+                if not job.taken:
+                    self._scheduler.submit(queue, job)
+        self._ensure_workers()
+        return futures, denied_tickers
+    
+    def get_cached_quotes(self, tickers: List[str]) -> Tuple[Dict[str, Quote], List[str]]:
+        """
+        Look tickers up in the cache without scraping.
+        
+        Args:
+            tickers (List[str]): List of ticker symbols to look up.
+            
+        Returns:
+            Tuple[Dict[str, Quote], List[str]]: The cached quotes, expired ones as
+            stale copies, and the tickers that are expired or not cached at all.
+        """
+        quotes = {}
+        refresh = []
+        fresh = 0
+        current_time = time.time()
+        for ticker in tickers:
+            entry = self._cache.get(ticker)
+            if entry is None:
+                refresh.append(ticker)
+            elif current_time - entry['timestamp'] < self._cache_ttl:
+                quotes[ticker] = entry['quote']
+                fresh += 1
+            else:
+                quotes[ticker] = entry['quote'].copy(stale=True)
+                refresh.append(ticker)
+        # Expired and missing tickers are counted as misses when their refresh runs
+        with self._stats_lock:
+            self._stats['cache_hits'] += fresh
+        if fresh:
+            metrics.CACHE_LOOKUPS.labels('hit').inc(fresh)
+        return quotes, refresh
     
-    def get_multiple_stock_data(self, tickers: List[str], fast_mode: bool = False) -> Dict[str, Dict[str, Any]]:
+    def refresh_in_background(self, tickers: List[str], fast_mode: bool = False,
+                              client: Optional[str] = None) -> int:
         """
-        Fetch stock data for multiple tickers concurrently using ThreadPoolExecutor.
+        Queue fetches for tickers without waiting for them.
+        
+        The fetches go through the client's fair queue and quota like those of
+        get_multiple_quotes, which joins them if it asks for the same tickers.
+        
+        Returns:
+            int: How many tickers were queued; the rest were over the quota.
+        """
+        futures, _ = self._queue_fetches(list(tickers), fast_mode, client)
+        return len(futures)
+    
+    def get_multiple_quotes(self, tickers: List[str], fast_mode: bool = False,
+                            client: Optional[str] = None) -> Tuple[Dict[str, Quote], Dict[str, Any]]:
+        """
+        Fetch Quotes for multiple tickers, queuing the cache misses on the worker threads.
+        
+        Cache hits are returned straight away and cost nothing. Misses are charged
+        to the client's scrape quota; those over it get the expired cached quote,
+        marked stale, or an error quote. The rest are queued in the client's fair
+        queue, and tickers already queued by someone else are shared.
         
         Args:
             tickers (List[str]): List of ticker symbols to fetch data for.
             fast_mode (bool, optional): If True, minimize delays between requests for initial page loads.
+            client (str, optional): Who is asking, e.g. "user:42". Calls without a
+                client share one queue and are not charged against a quota.
             
         Returns:
-            Dict[str, Dict[str, Any]]: Dictionary mapping ticker symbols to their stock data.
+            Tuple[Dict[str, Quote], Dict[str, Any]]: Quotes keyed by ticker, and batch metadata.
         """
         start_time = time.time()
         results = {}
         
-        # Skip empty ticker list
-        if not tickers:
-            return results
-        
         # Prioritize cached results first to improve responsiveness
         cached_tickers = []
         uncached_tickers = []
@@ -193,55 +415,42 @@ class ThreadedScraper:
                 cache_time = self._cache[ticker]['timestamp']
                 if current_time - cache_time < self._cache_ttl:
                     # Use cached data
-                    results[ticker] = self._cache[ticker]['data']
+                    results[ticker] = self._cache[ticker]['quote']
                     cached_tickers.append(ticker)
                     continue
             uncached_tickers.append(ticker)
         
-        # Process uncached tickers
+        # Cached tickers are counted here; uncached ones are counted by get_quote
+        with self._stats_lock:
+            self._stats['cache_hits'] += len(cached_tickers)
+        if cached_tickers:
+            metrics.CACHE_LOOKUPS.labels('hit').inc(len(cached_tickers))
+        
+        denied_tickers = []
         if uncached_tickers:
-            # Adjust batch size based on mode
-            max_tickers_per_batch = min(len(uncached_tickers), 20 if fast_mode else 12)
-            batched_tickers = [uncached_tickers[i:i+max_tickers_per_batch] for i in range(0, len(uncached_tickers), max_tickers_per_batch)]
+            # Shuffle tickers to randomize the order of requests
+            random.shuffle(uncached_tickers)
             
-            for batch in batched_tickers:
-                # Shuffle tickers to randomize the order of requests
-                random_tickers = batch.copy()
-                random.shuffle(random_tickers)
-                
-                # Process each batch with improved concurrency
-                with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    # Submit all ticker fetch tasks
-                    future_to_ticker = {
-                        executor.submit(self.get_stock_data, ticker, fast_mode): ticker 
-                        for ticker in random_tickers
-                    }
-                    
-                    # Process results as they complete
-                    for future in concurrent.futures.as_completed(future_to_ticker):
-                        ticker = future_to_ticker[future]
-                        try:
-                            data = future.result()
-                            results[ticker] = data
-                        except Exception as e:
-                            # Handle unexpected exceptions and provide fallback data
-                            results[ticker] = {
-                                'ticker': ticker,
-                                'price': 'N/A',
-                                'change': 'N/A',
-                                'market_status': 'Error',
-                                'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                'error': f"Unexpected error: {str(e)}"
-                            }
-                
-                # Reduce the delay between batches, especially in fast mode
-                if len(batched_tickers) > 1 and batch != batched_tickers[-1]:
-                    time.sleep(0.1 if fast_mode else 0.2)
+            futures, denied_tickers = self._queue_fetches(uncached_tickers, fast_mode, client)
+            for ticker in denied_tickers:
+                entry = self._cache.get(ticker)
+                if entry is not None:
+                    results[ticker] = entry['quote'].copy(stale=True)
+                else:
+                    results[ticker] = Quote(ticker, error=QUOTA_EXCEEDED)
+            
+            for ticker, future in futures.items():
+                try:
+                    results[ticker] = future.result()
+                except Exception as e:
+                    # Handle unexpected exceptions and provide fallback data
+                    results[ticker] = Quote(ticker, error=f"Unexpected error: {str(e)}")
         
         # Update stats for this batch
         elapsed_time = time.time() - start_time
-        with self._lock:
+        with self._stats_lock:
             self._stats['total_time'] += elapsed_time
+            self._stats['batches'] += 1
             self._stats['last_batch_time'] = elapsed_time
             self._stats['last_batch_size'] = len(tickers)
         
@@ -252,51 +461,119 @@ class ThreadedScraper:
             'average_time_per_ticker': elapsed_time / len(tickers) if tickers else 0,
             'cached_tickers': len(cached_tickers),
             'uncached_tickers': len(uncached_tickers),
+            'quota_denied': len(denied_tickers),
             'fast_mode': fast_mode
         }
-        results['metadata'] = metadata
         
+        return results, metadata
+    
+    def get_multiple_stock_data(self, tickers: List[str], fast_mode: bool = False,
+                                client: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch stock data for multiple tickers concurrently as display dictionaries.
+        
+        Args:
+            tickers (List[str]): List of ticker symbols to fetch data for.
+            fast_mode (bool, optional): If True, minimize delays between requests for initial page loads.
+            client (str, optional): Who is asking, for fair queuing and the scrape quota.
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: Dictionary mapping ticker symbols to their stock data.
+        """
+        # Skip empty ticker list
+        if not tickers:
+            return {}
+        
+        quotes, metadata = self.get_multiple_quotes(tickers, fast_mode, client)
+        results = {ticker: quote.to_dict() for ticker, quote in quotes.items()}
+        results['metadata'] = metadata
         return results
     
+    def get_encoded_quotes(self, quotes: Dict[str, Quote]) -> List[EncodedQuote]:
+        """
+        Get pre-encoded JSON for quotes returned by get_multiple_quotes.
+        
+        Quotes that came from the cache reuse the bytes encoded when they were
+        cached. Anything else (stale or error quotes) is encoded on the spot.
+        
+        Args:
+            quotes (Dict[str, Quote]): Quotes keyed by ticker.
+            
+        Returns:
+            List[EncodedQuote]: Encoded quotes in the order of quotes.
+        """
+        encoded_quotes = []
+        for ticker, quote in quotes.items():
+            entry = self._cache.get(ticker)
+            if entry is not None and entry['quote'] is quote:
+                encoded_quotes.append(entry['encoded'])
+            else:
+                encoded_quotes.append(EncodedQuote(ticker, quote.to_dict(), self._precompress))
+        return encoded_quotes
+    
     def clear_cache(self):
         """Clear the data cache"""
         with self._lock:
             self._cache = {}
-            print("Cache cleared")
+            logger.info("Cache cleared")
     
     def get_stats(self):
         """Get performance statistics"""
-        with self._lock:
+        with self._stats_lock:
+            # Time per upstream scrape, successful or not. Batch wall time is reported separately.
             avg_time = 0
-            if self._stats['successful_requests'] > 0:
-                avg_time = self._stats['total_time'] / self._stats['successful_requests']
+            if self._stats['requests_made'] > 0:
+                avg_time = self._stats['request_time'] / self._stats['requests_made']
+            avg_batch_time = 0
+            if self._stats['batches'] > 0:
+                avg_batch_time = self._stats['total_time'] / self._stats['batches']
             
+            lookups = self._stats['cache_hits'] + self._stats['cache_misses']
             stats = {
                 'requests_made': self._stats['requests_made'],
                 'successful_requests': self._stats['successful_requests'],
                 'failed_requests': self._stats['failed_requests'],
                 'cache_size': len(self._cache),
                 'cache_ttl': self._cache_ttl,
-                'average_time_per_request': avg_time
+                'cache_hits': self._stats['cache_hits'],
+                'cache_misses': self._stats['cache_misses'],
+                'cache_hit_ratio': self._stats['cache_hits'] / lookups if lookups else 0,
+                'average_time_per_request': avg_time,
+                'average_batch_time': avg_batch_time,
+                'hedging': scraper.hedge_stats(),
+                'strategies': scraper.strategy_stats(),
+                'parse_pool': parse_pool.stats(),
+                'history': history.stats(),
+                'scheduler': self._scheduler.stats(),
+                'quota': self._quota.stats() if self._quota is not None else None,
+                'rate_limit': self._rate_limiter.stats() if self._rate_limiter is not None else None
             }
             return stats
     
     def reset_stats(self):
         """Reset performance statistics"""
-        with self._lock:
+        with self._stats_lock:
             self._stats = {
                 'requests_made': 0,
                 'successful_requests': 0,
                 'failed_requests': 0,
                 'total_time': 0,
+                'request_time': 0,
+                'batches': 0,
                 'last_batch_time': 0,
                 'last_batch_size': 0,
-                'last_request_time': time.time()
+                'cache_hits': 0,
+                'cache_misses': 0
             }
-            print("Stats reset")
+            logger.info("Stats reset")
     
     def get_cache_info(self):
-        """Get information about the current cache state"""
+        """
+        Get information about the current cache state.
+        
+        This walks the whole cache, so it is meant for debugging and the CLI.
+        Use get_stats() on request paths.
+        """
         with self._lock:
             current_time = time.time()
             cache_info = {
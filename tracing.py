@@ -0,0 +1,232 @@
+"""
+Opt-in span tracing for scrapes.
+
+When enabled, every scrape records a timed waterfall: the ThreadedScraper
+pacing, the human-like delay, each upstream request (time to first byte, body
+download, bytes, whether a new connection was opened), and each extraction
+strategy with the fields it was missing when it fell through. Requests run on
+another thread, like hedged page fetches, are added with bind(). Traces slower
+than a threshold are kept in a ring buffer and served at /debug/traces.
+
+Tracing is off by default. Turn it on with STONX_TRACING=1 (and optionally
+STONX_TRACE_SLOW_MS, STONX_TRACE_BUFFER) or call enable(). While it is off no
+stage hook is registered and scrapes only check a module flag.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Whether scrapes are traced; read without a lock on every scrape
+enabled = False
+
+_slow_threshold = 1.0
+_traces = deque(maxlen=50)
+_traces_lock = threading.Lock()
+_local = threading.local()
+
+# Stage info keys left out of span attributes
+_TIMING_KEYS = ('elapsed', 'delay', 'ttfb')
+
+
+class Trace:
+    """
+    The spans of one scrape.
+
+    Attributes:
+        ticker (str): Ticker being scraped.
+        thread (str): Name of the thread that ran the scrape.
+        start (float): time.perf_counter() at the start of the first span.
+        started_at (float): Epoch time the trace was opened.
+        duration (float): Seconds from the first span start to the last span end, set by end().
+        spans (list): (name, start, elapsed, attributes) tuples.
+    """
+
+    __slots__ = ('ticker', 'thread', 'start', 'started_at', 'duration', 'spans')
+
+    def __init__(self, ticker: str, start: Optional[float] = None):
+        self.ticker = ticker
+        self.thread = threading.current_thread().name
+        self.start = start if start is not None else time.perf_counter()
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.spans = []
+
+    def add_span(self, name: str, start: float, elapsed: float, **attributes):
+        self.spans.append((name, start, elapsed, attributes))
+        if start < self.start:
+            self.start = start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The trace as a JSON-ready waterfall, spans ordered by start time"""
+        spans = []
+        for name, start, elapsed, attributes in sorted(self.spans, key=lambda span: span[1]):
+            span = {
+                'name': name,
+                'offset_ms': round((start - self.start) * 1000, 2),
+                'duration_ms': round(elapsed * 1000, 2),
+            }
+            span.update(attributes)
+            spans.append(span)
+        return {
+            'ticker': self.ticker,
+            'thread': self.thread,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.duration * 1000, 2),
+            'spans': spans,
+        }
+
+    def format_waterfall(self, width: int = 60) -> str:
+        """Render the trace as a text waterfall"""
+        lines = [f"{self.ticker} {self.duration * 1000:.1f} ms on {self.thread}"]
+        scale = width / self.duration if self.duration else 0
+        for span in self.to_dict()['spans']:
+            offset = int(span['offset_ms'] / 1000 * scale)
+            length = max(1, int(span['duration_ms'] / 1000 * scale))
+            details = ' '.join(f"{key}={value}" for key, value in span.items()
+                               if key not in ('name', 'offset_ms', 'duration_ms'))
+            lines.append(f"  {span['name']:<18} {' ' * offset}{'#' * length:<{width - offset}} "
+                         f"{span['duration_ms']:>9.1f} ms  {details}".rstrip())
+        return '\n'.join(lines)
+
+
+def current() -> Optional[Trace]:
+    """The trace open on this thread, if any"""
+    return getattr(_local, 'trace', None)
+
+
+def begin(ticker: str) -> Optional[Trace]:
+    """
+    Open a trace for a scrape on this thread.
+
+    Returns:
+        Trace: The new trace, or None if tracing is off or a trace is already open
+        (the spans then go to the outer trace, which its opener ends).
+    """
+    if not enabled or current() is not None:
+        return None
+    trace = Trace(ticker)
+    _local.trace = trace
+    return trace
+
+
+def end(trace: Optional[Trace]):
+    """Close a trace opened by begin() and keep it if it was slow"""
+    if trace is None:
+        return
+    _local.trace = None
+    if trace.spans:
+        trace.duration = max(start + elapsed for _, start, elapsed, _ in trace.spans) - trace.start
+    else:
+        trace.duration = time.perf_counter() - trace.start
+    if trace.duration >= _slow_threshold:
+        with _traces_lock:
+            _traces.append(trace)
+
+
+def add_span(name: str, start: float, elapsed: float, **attributes):
+    """Add a span to the trace open on this thread, if any"""
+    trace = current()
+    if trace is not None:
+        trace.add_span(name, start, elapsed, **attributes)
+
+
+def bind(function):
+    """
+    Wrap a function so that its spans go to the trace open on this thread, on
+    whichever thread it runs (e.g. a page fetch handed to the hedge executor).
+
+    Returns the function itself when no trace is open.
+    """
+    trace = current()
+    if trace is None:
+        return function
+
+    def run(*args, **kwargs):
+        previous = current()
+        _local.trace = trace
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return run
+
+
+def _on_stage(ticker, stage, start, elapsed, info):
+    """Stage hook turning scraper stages into spans"""
+    trace = current()
+    if trace is None:
+        # scrape_quote() called directly, without ThreadedScraper: trace the scrape on its own
+        trace = begin(ticker)
+        if trace is None:
+            return
+        trace.start = start
+        _local.owned = True
+    # Timings in info are already spans of their own (the delay stage, the http:* spans)
+    attributes = {key: value for key, value in info.items() if key not in _TIMING_KEYS}
+    trace.add_span(stage, start, elapsed, **attributes)
+    if stage == 'scrape' and getattr(_local, 'owned', False):
+        _local.owned = False
+        end(trace)
+
+
+def enable(slow_threshold: Optional[float] = None, capacity: Optional[int] = None):
+    """
+    Start tracing scrapes.
+
+    Args:
+        slow_threshold (float, optional): Keep traces that took at least this many seconds.
+        capacity (int, optional): Number of slow traces to keep.
+    """
+    global enabled, _slow_threshold, _traces
+    import scraper
+
+    if slow_threshold is not None:
+        _slow_threshold = slow_threshold
+    if capacity is not None and capacity != _traces.maxlen:
+        with _traces_lock:
+            _traces = deque(_traces, maxlen=capacity)
+    if not enabled:
+        scraper.add_stage_hook(_on_stage)
+        enabled = True
+
+
+def disable():
+    """Stop tracing scrapes. Kept traces stay available."""
+    global enabled
+    import scraper
+
+    enabled = False
+    scraper.remove_stage_hook(_on_stage)
+
+
+def slow_traces() -> List[Trace]:
+    """Kept slow traces, newest first"""
+    with _traces_lock:
+        return list(reversed(_traces))
+
+
+def clear():
+    """Drop the kept traces"""
+    with _traces_lock:
+        _traces.clear()
+
+
+def status() -> Dict[str, Any]:
+    """Tracing settings and buffer usage"""
+    return {
+        'enabled': enabled,
+        'slow_threshold_ms': _slow_threshold * 1000,
+        'capacity': _traces.maxlen,
+        'kept': len(_traces),
+    }
+
+
+def configure_from_env():
+    """Enable tracing if STONX_TRACING is set"""
+    if os.environ.get('STONX_TRACING', '').lower() in ('1', 'true', 'yes', 'on'):
+        enable(float(os.environ.get('STONX_TRACE_SLOW_MS', '1000')) / 1000,
+               int(os.environ.get('STONX_TRACE_BUFFER', '50')))
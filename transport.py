@@ -0,0 +1,350 @@
+"""
+Pluggable HTTP transport for the scraper.
+
+scraper.py fetches every upstream URL through get_transport(), so the network
+can be swapped out without touching the extraction code:
+
+- LiveTransport: real requests, with a keep-alive session per thread.
+- RecordingTransport: wraps another transport and saves every response,
+  with its timing, into a corpus directory.
+- ReplayTransport: serves a recorded corpus, sleeping for the recorded
+  latency (optionally scaled), so runs are deterministic and offline.
+
+The transport is chosen with the STONX_TRANSPORT environment variable:
+
+    STONX_TRANSPORT=live                      (default)
+    STONX_TRANSPORT=record:corpora/friday-close
+    STONX_TRANSPORT=replay:corpora/friday-close
+    STONX_TRANSPORT=replay:corpora/friday-close:0.5   (replay at half the latency)
+
+Usage:
+    python transport.py record corpora/friday-close AAPL MSFT TSLA
+    python transport.py replay corpora/friday-close AAPL MSFT TSLA --scale 0.5
+    python transport.py info corpora/friday-close
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+class ReplayMissError(Exception):
+    """Raised when a replayed corpus has no recording for a URL"""
+
+
+class Response:
+    """
+    Minimal HTTP response used by the scraper.
+
+    Attributes:
+        url (str): Requested URL.
+        status_code (int): HTTP status code.
+        content (bytes): Response body.
+        content_type (str): Content-Type header.
+        ttfb (float): Seconds until the response headers arrived.
+        elapsed (float): Seconds until the whole body was read.
+        new_connection (bool): Whether a new connection (DNS, connect, TLS) was opened
+            for the request, so its cost is part of ttfb. None when unknown.
+    """
+
+    __slots__ = ('url', 'status_code', 'content', 'content_type', 'ttfb', 'elapsed', 'new_connection')
+
+    def __init__(self, url: str, status_code: int, content: bytes, content_type: str = '',
+                 ttfb: float = 0.0, elapsed: float = 0.0, new_connection: Optional[bool] = None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.content_type = content_type
+        self.ttfb = ttfb
+        self.elapsed = elapsed
+        self.new_connection = new_connection
+
+    @property
+    def encoding(self) -> str:
+        """Charset from Content-Type, UTF-8 by default"""
+        if 'charset=' in self.content_type:
+            return self.content_type.split('charset=', 1)[1].split(';')[0].strip() or 'utf-8'
+        return 'utf-8'
+
+    @property
+    def text(self) -> str:
+        """Body decoded with the charset from Content-Type"""
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        """Body parsed as JSON"""
+        return json.loads(self.content)
+
+
+class Transport:
+    """Base class for transports. Subclasses implement get()."""
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> Response:
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the transport"""
+
+
+class LiveTransport(Transport):
+    """
+    Fetches over the network with requests.
+
+    Each thread keeps its own requests.Session so connections to the upstream
+    are reused instead of paying for a new TCP and TLS handshake per request.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> Response:
+        session = self._session()
+        # The pool counts the connections it opens, which tells a reused connection from a new one
+        pool = session.get_adapter(url).poolmanager.connection_from_url(url)
+        opened = pool.num_connections
+        start = time.perf_counter()
+        # Stream so the time to the headers can be told apart from the body download
+        with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            ttfb = time.perf_counter() - start
+            content = response.content
+        return Response(url, response.status_code, content, response.headers.get('Content-Type', ''),
+                        ttfb, time.perf_counter() - start, pool.num_connections > opened)
+
+
+def _request_key(url: str) -> str:
+    """Path and query of a URL, so a corpus replays against any base URL"""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+class RecordingTransport(Transport):
+    """
+    Records every response of another transport into a corpus directory.
+
+    The corpus holds exchanges.ndjson, one line per request in the order they
+    completed, and bodies/<sha1>.bin with the deduplicated response bodies.
+
+    Args:
+        corpus_dir (str): Directory to write the corpus to. Appends if it exists.
+        inner (Transport, optional): Transport to record. Defaults to LiveTransport.
+    """
+
+    def __init__(self, corpus_dir: str, inner: Optional[Transport] = None):
+        self.corpus_dir = corpus_dir
+        self.inner = inner or LiveTransport()
+        self._lock = threading.Lock()
+        self._start = time.time()
+        os.makedirs(os.path.join(corpus_dir, 'bodies'), exist_ok=True)
+        self._index = open(os.path.join(corpus_dir, 'exchanges.ndjson'), 'a')
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> Response:
+        started_at = time.time()
+        response = self.inner.get(url, headers=headers, timeout=timeout)
+
+        digest = hashlib.sha1(response.content).hexdigest()
+        body_path = os.path.join(self.corpus_dir, 'bodies', f'{digest}.bin')
+        exchange = {
+            'key': _request_key(url),
+            'url': url,
+            'status': response.status_code,
+            'content_type': response.content_type,
+            'body': digest,
+            'ttfb': response.ttfb,
+            'elapsed': response.elapsed,
+            'offset': started_at - self._start,
+        }
+        with self._lock:
+            if not os.path.exists(body_path):
+                with open(body_path, 'wb') as f:
+                    f.write(response.content)
+            self._index.write(json.dumps(exchange) + '\n')
+            self._index.flush()
+        return response
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+        self.inner.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Serves responses from a recorded corpus.
+
+    Requests for the same URL are answered with its recordings in the order
+    they were made, wrapping around once they run out.
+
+    Args:
+        corpus_dir (str): Corpus written by RecordingTransport.
+        latency_scale (float, optional): Multiplier for the recorded latency. 0 replays instantly.
+    """
+
+    def __init__(self, corpus_dir: str, latency_scale: float = 1.0):
+        self.corpus_dir = corpus_dir
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._exchanges = defaultdict(deque)
+        self._bodies = {}
+        with open(os.path.join(corpus_dir, 'exchanges.ndjson')) as f:
+            for line in f:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self._exchanges[exchange['key']].append(exchange)
+
+    def _body(self, digest: str) -> bytes:
+        body = self._bodies.get(digest)
+        if body is None:
+            with open(os.path.join(self.corpus_dir, 'bodies', f'{digest}.bin'), 'rb') as f:
+                body = f.read()
+            self._bodies[digest] = body
+        return body
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 15) -> Response:
+        key = _request_key(url)
+        with self._lock:
+            recordings = self._exchanges.get(key)
+            if not recordings:
+                raise ReplayMissError(f"No recording for {key}")
+            exchange = recordings[0]
+            recordings.rotate(-1)
+            body = self._body(exchange['body'])
+
+        elapsed = exchange['elapsed'] * self.latency_scale
+        if elapsed > timeout:
+            time.sleep(timeout)
+            raise requests.Timeout(f"Replayed response for {key} took {elapsed:.2f}s")
+        if elapsed > 0:
+            time.sleep(elapsed)
+        return Response(url, exchange['status'], body, exchange['content_type'],
+                        exchange['ttfb'] * self.latency_scale, elapsed)
+
+
+def transport_from_spec(spec: str) -> Transport:
+    """
+    Build a transport from a spec string: 'live', 'record:<dir>' or 'replay:<dir>[:<scale>]'.
+    """
+    kind, _, rest = spec.partition(':')
+    if kind == 'live':
+        return LiveTransport()
+    if kind == 'record' and rest:
+        return RecordingTransport(rest)
+    if kind == 'replay' and rest:
+        corpus_dir, _, scale = rest.rpartition(':')
+        try:
+            return ReplayTransport(corpus_dir, float(scale))
+        except ValueError:
+            return ReplayTransport(rest)
+    raise ValueError(f"Invalid transport spec: {spec}")
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """Get the active transport, creating it from STONX_TRANSPORT on first use"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = transport_from_spec(os.environ.get('STONX_TRANSPORT', 'live'))
+    return _transport
+
+
+def set_transport(transport: Transport) -> Optional[Transport]:
+    """Replace the active transport. Returns the previous one."""
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    return previous
+
+
+def corpus_info(corpus_dir: str) -> Dict[str, object]:
+    """Summarize a corpus: exchanges, distinct URLs, status codes and latency"""
+    statuses = defaultdict(int)
+    keys = set()
+    latencies = []
+    with open(os.path.join(corpus_dir, 'exchanges.ndjson')) as f:
+        for line in f:
+            if line.strip():
+                exchange = json.loads(line)
+                keys.add(exchange['key'])
+                statuses[str(exchange['status'])] += 1
+                latencies.append(exchange['elapsed'])
+    latencies.sort()
+    return {
+        'exchanges': len(latencies),
+        'urls': len(keys),
+        'statuses': dict(statuses),
+        'mean_latency': sum(latencies) / len(latencies) if latencies else 0,
+        'max_latency': latencies[-1] if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay scraper traffic')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='Scrape tickers live and record the responses')
+    record_parser.add_argument('corpus', help='Corpus directory')
+    record_parser.add_argument('tickers', nargs='+', help='Ticker symbols to scrape')
+    record_parser.add_argument('--workers', type=int, default=4, help='Worker threads')
+
+    replay_parser = subparsers.add_parser('replay', help='Scrape tickers against a recorded corpus')
+    replay_parser.add_argument('corpus', help='Corpus directory')
+    replay_parser.add_argument('tickers', nargs='+', help='Ticker symbols to scrape')
+    replay_parser.add_argument('--scale', type=float, default=1.0, help='Latency multiplier (0 for no delay)')
+    replay_parser.add_argument('--workers', type=int, default=4, help='Worker threads')
+
+    info_parser = subparsers.add_parser('info', help='Summarize a recorded corpus')
+    info_parser.add_argument('corpus', help='Corpus directory')
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(json.dumps(corpus_info(args.corpus), indent=2))
+        return
+
+    # Imported here so `transport.py info` works without the scraper's dependencies
+    import scraper
+    from threaded_scraper import ThreadedScraper
+    # When run as a script this file is __main__; the scraper uses the `transport` module
+    import transport as transport_module
+
+    if args.command == 'record':
+        transport = transport_module.RecordingTransport(args.corpus)
+    else:
+        transport = transport_module.ReplayTransport(args.corpus, args.scale)
+        # Recorded latency already includes any upstream pacing; skip the human-like delay
+        scraper.HUMAN_DELAY_RANGE = (0.0, 0.0)
+    transport_module.set_transport(transport)
+
+    threaded = ThreadedScraper(max_workers=args.workers, cache_ttl=0)
+    start = time.time()
+    quotes, _ = threaded.get_multiple_quotes([t.strip().upper() for t in args.tickers], fast_mode=True)
+    elapsed = time.time() - start
+    transport.close()
+
+    for ticker, quote in quotes.items():
+        data = quote.to_dict()
+        print(f"{ticker:<6} | {data['price']:<10} | {data['change']:<40} | {data['market_status']}")
+    print(f"\n{args.command.capitalize()}ed {len(quotes)} tickers in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
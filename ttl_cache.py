@@ -0,0 +1,104 @@
+"""
+Small in-process caches with a time to live, for records read on every request.
+
+The web app reads the logged-in user and their watchlist on every request, and
+a dashboard polls every 30 seconds, so most of those reads return what the
+last one did. A TTLCache keeps them in memory for a while; the code that
+changes a record invalidates its entry, so this process sees its own changes at
+once and changes made by other processes within the time to live.
+
+An entry loaded while an invalidation happened is not stored: the loader may
+have read the database just before the change was committed, and storing its
+result would bring the old value back until it expires.
+
+Lookups are counted by cache and result (hit or miss) in metrics.py.
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+import metrics
+
+# Marks a missing entry, so that None can be cached
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A least recently used cache whose entries expire.
+
+    Args:
+        name (str): Name of the cache in metrics and stats.
+        ttl (float): Seconds an entry is used for. 0 disables the cache: every
+            lookup loads.
+        max_entries (int, optional): Entries kept; the least recently used go first.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (expires, value)
+        # Bumped by every invalidation; a load that saw it change is not stored
+        self._version = 0
+        self._hits = 0
+        self._misses = 0
+        self._hit_counter = metrics.APP_CACHE_LOOKUPS.labels(name, 'hit')
+        self._miss_counter = metrics.APP_CACHE_LOOKUPS.labels(name, 'miss')
+        metrics.APP_CACHE_HIT_RATIO.labels(name).set_function(self.hit_ratio)
+        metrics.APP_CACHE_SIZE.labels(name).set_function(lambda: len(self._entries))
+
+    def get(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        The cached value of a key, or the value load() returns, which is then cached.
+
+        Exceptions from load() propagate and nothing is cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                self._hit_counter.inc()
+                return entry[1]
+            self._misses += 1
+            version = self._version
+        self._miss_counter.inc()
+
+        value = load()
+        if self.ttl > 0:
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable):
+        """Forget a key, e.g. after its record changed"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+    def hit_ratio(self) -> float:
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'ttl': self.ttl,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self.hit_ratio(),
+        }